@@ -1,7 +1,8 @@
 '''
 Perform maintenance operations on source code.
 '''
-from ben10.clikit.app import App
+from clikit.app import App
+from ben10.dircache import CollectGarbage, ParseSize
 from ben10.filesystem import CreateFile, FindFiles, GetFileLines
 
 
@@ -56,5 +57,20 @@ def license_headers(console_, directory, header='HEADER.txt'):
 
 
 
+@app
+def dircache_gc(console_, cache_dir, max_size):
+    '''
+    Remove the least recently used entries of a DirCache cache directory, until it fits the given
+    size.
+
+    :param cache_dir: The base cache directory.
+    :param max_size: The maximum size of the cache directory, in bytes. Accepts the suffixes K, M
+        and G (.. seealso:: ParseSize).
+    '''
+    for i_name in CollectGarbage(cache_dir, ParseSize(max_size)):
+        console_.Item(i_name + ' removed')
+
+
+
 if __name__ == '__main__':
     app.Main()
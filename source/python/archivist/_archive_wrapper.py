@@ -1,9 +1,28 @@
 from ben10.foundation.decorators import Implements
+from ben10.foundation.namedtuple import namedtuple
 from ben10.interface import ImplementsInterface, Interface
 import os
 
 
 
+# ZipInfo.create_system of archives created on unix systems, which store the permission bits.
+_ZIP_SYSTEM_UNIX = 3
+
+# The extensions of the tar archives handled by TarWrapper.
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2')
+
+# The size of the chunks read from the archives.
+CHUNK_SIZE = 64 * 1024
+
+# The types of the members in the index of tar archives (.. seealso:: TarWrapper).
+_TAR_FILE = 'file'
+_TAR_DIR = 'dir'
+_TAR_OTHER = 'other'
+
+_TarMember = namedtuple('_TarMember', 'type offset size mode mtime')
+
+
+
 #===================================================================================================
 # IArchiveWrapper
 #===================================================================================================
@@ -42,6 +61,45 @@ class IArchiveWrapper(Interface):
             The contents of the file.
         '''
 
+    def OpenMember(self, filename):
+        '''
+        Opens the given filename stored inside the archive for reading, so it can be read in
+        chunks instead of all at once (.. seealso:: ReadFile).
+
+        :param str filename:
+            A filename found inside the archive.
+
+        :rtype: file
+        :returns:
+            A file-like object, it must be closed by the caller.
+        '''
+
+    def GetFileMode(self, filename):
+        '''
+        :param str filename:
+            A filename found inside the archive.
+
+        :rtype: int|None
+        :returns:
+            The permission bits of the file, or None if not stored in the archive (e.g. archives
+            created on Windows).
+        '''
+
+    def GetFileMTime(self, filename):
+        '''
+        :param str filename:
+            A filename found inside the archive.
+
+        :rtype: float
+        :returns:
+            The modification time of the file (as returned by os.path.getmtime).
+        '''
+
+    def Close(self):
+        '''
+        Closes the archive. The files opened with OpenMember must be closed before.
+        '''
+
 
 
 #===================================================================================================
@@ -50,13 +108,21 @@ class IArchiveWrapper(Interface):
 class ZipWrapper(object):
     '''
     ArchiveWrapper for zipfiles
+
+    The central directory is read only once, when the archive is opened, and the archive is
+    memory-mapped: members are read (and decompressed) directly from the mapped memory, each one
+    independently, so many members can be read at the same time, by many threads.
     '''
 
     ImplementsInterface(IArchiveWrapper)
 
     def __init__(self, filename):
+        import mmap
         import zipfile
+
         self.wrapped = zipfile.ZipFile(filename)
+        self._file = open(filename, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
 
 
     @Implements(IArchiveWrapper.ListFilenames)
@@ -82,6 +148,397 @@ class ZipWrapper(object):
         return self.wrapped.read(filename)
 
 
+    @Implements(IArchiveWrapper.OpenMember)
+    def OpenMember(self, filename):
+        import zipfile
+
+        info = self.wrapped.getinfo(filename)
+        encrypted = info.flag_bits & 0x1
+        if encrypted or info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            return self.wrapped.open(filename)  # zipfile opens its own file handle
+        return _ZipMemberFile(self._map, info)
+
+
+    @Implements(IArchiveWrapper.GetFileMode)
+    def GetFileMode(self, filename):
+        info = self.wrapped.getinfo(filename)
+        if info.create_system != _ZIP_SYSTEM_UNIX:
+            return None
+        return (info.external_attr >> 16) & 0o7777 or None
+
+
+    @Implements(IArchiveWrapper.GetFileMTime)
+    def GetFileMTime(self, filename):
+        return _DateTimeToMTime(self.wrapped.getinfo(filename).date_time)
+
+
+    @Implements(IArchiveWrapper.Close)
+    def Close(self):
+        self._map.close()
+        self._file.close()
+        self.wrapped.close()
+
+
+
+#===================================================================================================
+# _ZipMemberFile
+#===================================================================================================
+class _ZipMemberFile(object):
+    '''
+    A read-only file with the contents of a zip member, read from the memory-mapped archive.
+    '''
+
+    def __init__(self, archive_map, info):
+        '''
+        :param mmap.mmap archive_map:
+            The memory-mapped zip archive.
+
+        :param zipfile.ZipInfo info:
+            The member (stored or deflated).
+        '''
+        import zipfile
+        import zlib
+
+        header_end = info.header_offset + zipfile.sizeFileHeader
+        self._map = archive_map
+        self._position = _GetZipDataOffset(info, archive_map[info.header_offset:header_end])
+        self._end = self._position + info.compress_size
+        self._info = info
+        self._crc = 0
+        self._buffer = ''
+        self._eof = False
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        else:
+            self._decompressor = None
+
+
+    def read(self, size=-1):
+        '''
+        :param int size:
+            The maximum number of bytes to read. If negative, reads until the end of the member.
+
+        :rtype: str
+        '''
+        result = []
+        while size != 0:
+            chunk = self._ReadChunk(CHUNK_SIZE if size < 0 else size)
+            if not chunk:
+                break
+            result.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return ''.join(result)
+
+
+    def close(self):
+        self._map = None
+
+
+    def _ReadChunk(self, size):
+        '''
+        :rtype: str
+        :returns:
+            Up to "size" bytes of the member, empty at the end of the member.
+
+        :raises zipfile.BadZipfile:
+            If the member is corrupted: its CRC does not match its contents (or its compressed data
+            is not valid).
+        '''
+        import zipfile
+        import zlib
+
+        if self._buffer:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+            return data
+        if self._eof:
+            return ''
+
+        data = ''
+        if self._decompressor is None:
+            end = min(self._position + size, self._end)
+            data = self._map[self._position:end]
+            self._position = end
+        else:
+            try:
+                while not data:
+                    compressed = self._decompressor.unconsumed_tail
+                    if not compressed:
+                        if self._position == self._end:
+                            data = self._decompressor.flush()
+                            data, self._buffer = data[:size], data[size:]
+                            break
+                        end = min(self._position + CHUNK_SIZE, self._end)
+                        compressed = self._map[self._position:end]
+                        self._position = end
+                    data = self._decompressor.decompress(compressed, size)
+            except zlib.error, e:
+                raise zipfile.BadZipfile('Invalid data for file %r: %s' % (self._info.filename, e))
+
+        self._crc = zlib.crc32(data + self._buffer, self._crc)
+        if not data:
+            self._eof = True
+            if self._crc & 0xffffffff != self._info.CRC:
+                raise zipfile.BadZipfile('Bad CRC-32 for file %r' % self._info.filename)
+        return data
+
+
+
+def _GetZipDataOffset(info, header):
+    '''
+    :param zipfile.ZipInfo info:
+        A zip member.
+
+    :param str header:
+        The local header of the member (the zipfile.sizeFileHeader bytes at info.header_offset).
+
+    :rtype: int
+    :returns:
+        The offset of the (compressed) contents of the member in the archive.
+
+    :raises zipfile.BadZipfile:
+        If the header is not valid.
+    '''
+    import struct
+    import zipfile
+
+    if len(header) != zipfile.sizeFileHeader:
+        raise zipfile.BadZipfile('Truncated file header')
+    header = struct.unpack(zipfile.structFileHeader, header)
+    if header[zipfile._FH_SIGNATURE] != zipfile.stringFileHeader:
+        raise zipfile.BadZipfile('Bad magic number for file header')
+    return (
+        info.header_offset
+        + zipfile.sizeFileHeader
+        + header[zipfile._FH_FILENAME_LENGTH]
+        + header[zipfile._FH_EXTRA_FIELD_LENGTH]
+    )
+
+
+
+#===================================================================================================
+# TarWrapper
+#===================================================================================================
+class TarWrapper(object):
+    '''
+    ArchiveWrapper for tar archives (.. seealso:: TAR_EXTENSIONS).
+
+    The members are found through an index with the offset of each member in the archive. The index
+    is created by scanning the archive the first time it is opened, and stored in a file along with
+    the archive (<archive>.index) for the next times. Members are read by seeking to their offset.
+
+    Uncompressed archives are read only where the member is. Compressed archives (gz, bz2) have no
+    random access: seeking decompresses the archive up to the member, but the headers of the
+    members before it are not parsed.
+    '''
+
+    ImplementsInterface(IArchiveWrapper)
+
+    # Changed when the contents of the index files change, to ignore older index files.
+    INDEX_VERSION = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.index_filename = filename + '.index'
+        self._members = self._LoadIndex()
+        if self._members is None:
+            self._members = self._CreateIndex()
+
+
+    @Implements(IArchiveWrapper.ListFilenames)
+    def ListFilenames(self):
+        return [i for i, i_member in self._members.iteritems() if i_member.type == _TAR_FILE]
+
+
+    @Implements(IArchiveWrapper.ListDirs)
+    def ListDirs(self):
+        result = set()
+        for i_name, i_member in self._members.iteritems():
+            if i_member.type == _TAR_DIR:
+                result.add(i_name)
+            else:
+                result.add(os.path.dirname(i_name))
+        return sorted(result)
+
+
+    @Implements(IArchiveWrapper.ReadFile)
+    def ReadFile(self, filename):
+        member_file = self.OpenMember(filename)
+        try:
+            return member_file.read()
+        finally:
+            member_file.close()
+
+
+    @Implements(IArchiveWrapper.OpenMember)
+    def OpenMember(self, filename):
+        member = self._GetMember(filename)
+        stream = self._OpenArchive()
+        try:
+            stream.seek(member.offset)
+        except:
+            stream.close()
+            raise
+        return _PartialFile(stream, member.size)
+
+
+    @Implements(IArchiveWrapper.GetFileMode)
+    def GetFileMode(self, filename):
+        return self._GetMember(filename).mode
+
+
+    @Implements(IArchiveWrapper.GetFileMTime)
+    def GetFileMTime(self, filename):
+        return self._GetMember(filename).mtime
+
+
+    @Implements(IArchiveWrapper.Close)
+    def Close(self):
+        pass  # Each member is read with its own file
+
+
+    def _GetMember(self, filename):
+        '''
+        :rtype: _TarMember
+
+        :raises KeyError:
+            If the archive has no such file.
+        '''
+        member = self._members[filename]
+        if member.type != _TAR_FILE:
+            raise KeyError(filename)
+        return member
+
+
+    def _OpenArchive(self):
+        '''
+        :rtype: file
+        :returns:
+            The archive (decompressed) contents.
+        '''
+        if self.filename.endswith(('.tar.gz', '.tgz')):
+            import gzip
+            return gzip.GzipFile(self.filename, 'rb')
+        if self.filename.endswith(('.tar.bz2', '.tbz2')):
+            import bz2
+            return bz2.BZ2File(self.filename, 'rb')
+        return open(self.filename, 'rb')
+
+
+    def _GetArchiveStamp(self):
+        '''
+        :rtype: list
+        :returns:
+            The size and mtime of the archive, to check that the index file matches it.
+        '''
+        stat = os.stat(self.filename)
+        return [self.INDEX_VERSION, stat.st_size, stat.st_mtime]
+
+
+    def _LoadIndex(self):
+        '''
+        :rtype: OrderedDict(str,_TarMember)|None
+        :returns:
+            The members in the index file, or None if there is no (valid) index file.
+        '''
+        import collections
+        import json
+
+        try:
+            with open(self.index_filename, 'rb') as iss:
+                index = json.load(iss)
+        except (IOError, ValueError):
+            return None
+        if index.get('stamp') != self._GetArchiveStamp():
+            return None
+        return collections.OrderedDict(
+            (i_name.encode('utf-8'), _TarMember(*i_member))
+            for i_name, i_member in index['members']
+        )
+
+
+    def _CreateIndex(self):
+        '''
+        Scans the archive, storing its index in the index file. Failing to store the index (e.g.
+        a read-only directory) is not an error: it is only used in memory.
+
+        :rtype: OrderedDict(str,_TarMember)
+        '''
+        from ben10.filesystem import StandardizePath
+        import collections
+        import json
+        import tarfile
+
+        members = collections.OrderedDict()
+        archive = tarfile.open(self.filename)
+        try:
+            for i_info in archive:
+                if i_info.isreg() and not i_info.issparse():
+                    i_type = _TAR_FILE
+                elif i_info.isdir():
+                    i_type = _TAR_DIR
+                else:
+                    i_type = _TAR_OTHER
+                i_name = StandardizePath(i_info.name).rstrip('/')
+                members[i_name] = _TarMember(
+                    i_type, i_info.offset_data, i_info.size, i_info.mode, i_info.mtime)
+        finally:
+            archive.close()
+
+        index = {
+            'stamp' : self._GetArchiveStamp(),
+            'members' : [[i_name, list(i_member)] for i_name, i_member in members.iteritems()],
+        }
+        temp_filename = self.index_filename + '.tmp'
+        try:
+            with open(temp_filename, 'wb') as oss:
+                json.dump(index, oss)
+            if os.path.isfile(self.index_filename):
+                os.remove(self.index_filename)  # os.rename does not replace files on Windows
+            os.rename(temp_filename, self.index_filename)
+        except (IOError, OSError, ValueError):  # ValueError: names that are not utf-8
+            pass
+        return members
+
+
+
+#===================================================================================================
+# _PartialFile
+#===================================================================================================
+class _PartialFile(object):
+    '''
+    A read-only file with part of the contents of a stream: "size" bytes from its current position.
+    '''
+
+    def __init__(self, stream, size):
+        '''
+        :param file stream:
+            Closed along with this file.
+
+        :param int size:
+        '''
+        self._stream = stream
+        self._remaining = size
+
+
+    def read(self, size=-1):
+        '''
+        :param int size:
+            The maximum number of bytes to read. If negative, reads until the end.
+
+        :rtype: str
+        '''
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._stream.read(size)
+        self._remaining -= len(data)
+        return data
+
+
+    def close(self):
+        self._stream.close()
+
+
 
 #===================================================================================================
 # RarWrapper
@@ -118,6 +575,22 @@ class RarWrapper(object):
         return self.wrapped.read(filename)
 
 
+    def OpenMember(self, filename):
+        return self.wrapped.open(filename)
+
+
+    def GetFileMode(self, filename):
+        return None  # Rar stores the attributes of the system where it was created
+
+
+    def GetFileMTime(self, filename):
+        return _DateTimeToMTime(self.wrapped.getinfo(filename).date_time)
+
+
+    def Close(self):
+        pass  # rarfile opens the archive for each operation
+
+
 
 #===================================================================================================
 # CreateArchiveWrapper
@@ -125,12 +598,15 @@ class RarWrapper(object):
 def CreateArchiveWrapper(filename):
     '''
     :param str filename:
-        An archive file. Its type will be determined from its extension (.rar, .zip)
+        An archive file. Its type will be determined from its extension (.rar, .zip, .tar and
+        .. seealso:: TAR_EXTENSIONS)
 
     :rtype: IArchiveWrapper
     :returns:
         An archive wrapper appropiate for the given file type
     '''
+    if filename.endswith(TAR_EXTENSIONS):
+        return TarWrapper(filename)
     extension = os.path.splitext(filename)[1]
     if extension == '.zip':
         return ZipWrapper(filename)
@@ -138,3 +614,15 @@ def CreateArchiveWrapper(filename):
         return RarWrapper(filename)
     else:
         raise NotImplementedError(extension)
+
+
+
+def _DateTimeToMTime(date_time):
+    '''
+    :param tuple(int) date_time:
+        The (year, month, day, hours, minutes, seconds) stored in archives, in local time.
+
+    :rtype: float
+    '''
+    import time
+    return time.mktime(tuple(date_time[:6]) + (0, 0, -1))
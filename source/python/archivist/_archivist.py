@@ -1,9 +1,22 @@
-from ben10.filesystem import (CheckIsFile, CreateDirectory, CreateFile, DeleteFile, EOL_STYLE_NONE,
-    ExtendedPathMask, FileAlreadyExistsError, FindFiles)
+from ben10.filesystem import (CheckIsFile, CreateDirectory, DeleteFile, ExtendedPathMask,
+    FileAlreadyExistsError, IterFindFiles, OpenFile)
 import os
 
 
 
+# The default number of threads extracting the members of an archive.
+EXTRACT_WORKERS = 8
+
+# The size of the chunks members are extracted in.
+EXTRACT_CHUNK_SIZE = 1024 * 1024
+
+# The default number of threads compressing the members (zip) or blocks (tar.gz) of an archive.
+COMPRESS_WORKERS = 8
+
+# Members compressed in memory up to this size (bigger ones go to temporary files).
+COMPRESS_SPOOL_SIZE = 16 * 1024 * 1024
+
+
 #===================================================================================================
 # Archivist
 #===================================================================================================
@@ -15,10 +28,21 @@ class Archivist(object):
     #===============================================================================================
     # Creation
     #===============================================================================================
-    def CreateArchive(self, archive, archive_mapping, overwrite=True):
+    def CreateArchive(
+            self,
+            archive,
+            archive_mapping,
+            overwrite=True,
+            workers=None,
+            compresslevel=None,
+            update=False,
+        ):
         '''
         Creates a compressed archive (zip, rar, etc).
 
+        Tar archives compressed with xz (.tar.xz), zstd (.tar.zst) and lz4 (.tar.lz4) are supported
+        when the optional compression modules are available (.. seealso:: archivist._compression).
+
         :param str archive:
             The name of the target archive
 
@@ -29,9 +53,25 @@ class Archivist(object):
         :param Bool overwrite:
             If True will overwrite any existing filename.
 
+        :param int|None workers:
+            The number of threads compressing the archive (.. seealso:: CreateZip, CreateTar).
+
+        :param int|None compresslevel:
+            The compression level (the meaning depends on the compression). If None, uses the
+            default level of the compression.
+
+        :param bool update:
+            If True and the archive already exists, updates it instead of creating it again,
+            compressing only the files that changed (.. seealso:: UpdateZip). Only for zip
+            archives: other archives are always created again.
+
         :raises RuntimeError:
             If a filename with the same name already exists, and overwrite is False.
         '''
+        if update and archive.endswith('.zip') and os.path.isfile(archive):
+            self.UpdateZip(archive, archive_mapping, workers=workers, compresslevel=compresslevel)
+            return
+
         if os.path.isfile(archive):
             if overwrite:
                 DeleteFile(archive)
@@ -45,17 +85,28 @@ class Archivist(object):
             ('.tgz'     , self.CreateTar, 'w:gz'),
             ('.tar.bz2' , self.CreateTar, 'w:bz2'),
             ('.tbz2'    , self.CreateTar, 'w:bz2'),
+            ('.tar.xz'  , self.CreateTar, 'w:xz'),
+            ('.txz'     , self.CreateTar, 'w:xz'),
+            ('.tar.zst' , self.CreateTar, 'w:zst'),
+            ('.tzst'    , self.CreateTar, 'w:zst'),
+            ('.tar.lz4' , self.CreateTar, 'w:lz4'),
             ('.tar'     , self.CreateTar, 'w'),
         ]
 
         for i_ext, i_cmd, i_mode in handles_table:
             if archive.endswith(i_ext):
-                return i_cmd(archive, archive_mapping, mode=i_mode)
+                return i_cmd(
+                    archive,
+                    archive_mapping,
+                    mode=i_mode,
+                    workers=workers,
+                    compresslevel=compresslevel,
+                )
 
         raise RuntimeError('Unknown archive format: %s' % archive)
 
 
-    def CreateZip(self, archive, archive_mapping, mode='w'):
+    def CreateZip(self, archive, archive_mapping, mode='w', workers=None, compresslevel=None):
         '''
         Create a zip filename using the given archive_mapping
 
@@ -69,17 +120,105 @@ class Archivist(object):
         :param str mode:
             The file mode for the archive. Needed to maintain the interface.
             CreateZip only accepts "w".
+
+        :param int|None workers:
+            The number of threads compressing members (zlib releases the GIL while compressing).
+            The members are written in order, so the archive is the same for any number of
+            workers. If None, uses COMPRESS_WORKERS.
+
+        :param int|None compresslevel:
+            The zlib compression level (0-9). If None, uses zlib.Z_DEFAULT_COMPRESSION.
         '''
         file_listing = self._ZipFileListing(archive_mapping)
 
         import zipfile
         oss = zipfile.ZipFile(archive, mode, zipfile.ZIP_DEFLATED)
-        for i_archive_filename, i_filename in file_listing:
-            oss.write(i_filename, i_archive_filename)
+        if workers is None:
+            workers = COMPRESS_WORKERS
+        if workers <= 1 and compresslevel is None:
+            for i_archive_filename, i_filename in file_listing:
+                oss.write(i_filename, i_archive_filename)
+        else:
+            tasks = [
+                (_CompressZipMember, (i_archive_filename, i_filename, compresslevel))
+                for i_archive_filename, i_filename in file_listing
+            ]
+            _WriteZipMembers(oss, tasks, workers)
         oss.close()
 
 
-    def CreateTar(self, archive, archive_mapping, mode='w'):
+    def UpdateZip(self, archive, archive_mapping, workers=None, compresslevel=None):
+        '''
+        Updates a zip archive to match the given archive_mapping, as created by CreateZip, but
+        only compressing the new and changed files: the compressed contents of the other members
+        are copied from the archive. Members not in the archive_mapping are removed.
+
+        A file is unchanged if its size matches the member and either its modification time or
+        its CRC matches too (so files touched but not changed are not compressed again).
+
+        The updated archive is written to a temporary file which then replaces the archive.
+
+        :param str archive:
+            The name of the zip archive. Created if missing.
+
+        :param list(tuple(str,str)) archive_mapping:
+            .. seealso:: CreateZip
+
+        :param int|None workers:
+            .. seealso:: CreateZip
+
+        :param int|None compresslevel:
+            .. seealso:: CreateZip
+            Only for the members compressed: the others keep their compression.
+
+        :rtype: list(str)
+        :returns:
+            The names (inside the archive) of the members compressed.
+        '''
+        import threading
+        import zipfile
+
+        if workers is None:
+            workers = COMPRESS_WORKERS
+
+        file_listing = self._ZipFileListing(archive_mapping)
+        if os.path.isfile(archive):
+            old_zip = zipfile.ZipFile(archive)
+            try:
+                old_infos = dict((i.filename, i) for i in old_zip.infolist())
+            finally:
+                old_zip.close()
+        else:
+            old_infos = {}
+
+        compressed = []
+        compressed_lock = threading.Lock()
+        def UpdateMember(archive_filename, filename):
+            result = _ReuseZipMember(archive, old_infos, archive_filename, filename)
+            if result is None:
+                result = _CompressZipMember(archive_filename, filename, compresslevel)
+                with compressed_lock:
+                    compressed.append(result[0].filename)
+            return result
+
+        temp_filename = archive + '.tmp'
+        try:
+            oss = zipfile.ZipFile(temp_filename, 'w', zipfile.ZIP_DEFLATED)
+            try:
+                tasks = [(UpdateMember, i_member) for i_member in file_listing]
+                _WriteZipMembers(oss, tasks, workers)
+            finally:
+                oss.close()
+            if os.path.isfile(archive):
+                DeleteFile(archive)  # os.rename does not replace files on Windows
+            os.rename(temp_filename, archive)
+        finally:
+            if os.path.isfile(temp_filename):
+                DeleteFile(temp_filename)
+        return sorted(compressed)
+
+
+    def CreateTar(self, archive, archive_mapping, mode='w', workers=None, compresslevel=None):
         '''
         Create a tar filename using the given archive_mapping
 
@@ -94,29 +233,72 @@ class Archivist(object):
             The file mode for the archive.
             See options on tarfile.open documentation.
             http://docs.python.org/2/library/tarfile.html
+
+            Also accepts "w:xz", "w:zst" and "w:lz4" (.. seealso:: archivist._compression).
+
+        :param int|None workers:
+            The number of threads compressing "w:gz" archives (.. seealso:: ParallelGzipFile). If
+            None, uses COMPRESS_WORKERS.
+
+            Other compressions use a single thread: bz2 archives compressed in parallel (as
+            pbzip2) have many streams, which are not supported by the bz2 module (before
+            Python 3.3), so tarfile would not be able to read them.
+
+        :param int|None compresslevel:
+            The compression level (the meaning depends on the compression). If None, uses the
+            default level of the compression (9 for gz and bz2).
         '''
         file_listing = self._ZipFileListing(archive_mapping)
+        from _compression import COMPRESSIONS, CompressingFile
         import tarfile
-        oss = tarfile.open(archive, mode)
+
+        if workers is None:
+            workers = COMPRESS_WORKERS
+        compression = mode.partition(':')[2]
+        if compression == 'gz' and workers > 1:
+            from _parallel_gzip import ParallelGzipFile
+            if compresslevel is None:
+                compressed_file = ParallelGzipFile(archive, workers)
+            else:
+                compressed_file = ParallelGzipFile(archive, workers, compresslevel=compresslevel)
+            oss = tarfile.open(fileobj=compressed_file, mode='w|')
+        elif compression in COMPRESSIONS:
+            compressed_file = CompressingFile(archive, compression, compresslevel)
+            oss = tarfile.open(fileobj=compressed_file, mode='w|')
+        else:
+            compressed_file = None
+            if compresslevel is None:
+                oss = tarfile.open(archive, mode)
+            else:
+                oss = tarfile.open(archive, mode, compresslevel=compresslevel)
         for i_archive_filename, i_filename in file_listing:
             oss.add(i_filename, i_archive_filename)
         oss.close()
+        if compressed_file is not None:
+            compressed_file.close()
 
 
     #===============================================================================================
     # Extraction
     #===============================================================================================
-    def ExtractZip(self, zip_filename, target_folder):
+    def ExtractZip(self, zip_filename, target_folder, workers=None):
         '''
         Extracts a zip filename into the target folder
 
+        The members are extracted concurrently (zlib releases the GIL while decompressing) and
+        copied in chunks, so the memory used does not depend on the size of the members. The
+        modification times and the permissions (of archives created on unix) are preserved.
+
         :param str zip_filename:
             Path to the archive filename
 
         :param str target_folder:
             Folder into which contents will be extracted
+
+        :param int|None workers:
+            The number of threads extracting members. If None, uses EXTRACT_WORKERS.
         '''
-        self.__ExtractArchive(zip_filename, target_folder)
+        self.__ExtractArchive(zip_filename, target_folder, workers=workers)
 
 
     def ExtractTar(self, tar_filename, target_folder, mode='r'):
@@ -124,17 +306,54 @@ class Archivist(object):
         Extracts a zip filename into the target folder
 
         :param str tar_filename:
-            Path to the archive filename
+            Path to the archive filename.
+
+            Remote archives (ftp, http) are extracted while being downloaded, in constant memory.
+            Note that hard links in remote archives are not supported (tarfile can't seek back to
+            the linked member in a stream).
 
         :param str target_folder:
             Folder into which contents will be extracted
 
         :param str mode:
+            .. seealso:: tarfile.open
+            Also accepts "r:xz", "r:zst" and "r:lz4" (.. seealso:: archivist._compression). Without
+            a compression ("r") these are detected by the extension of the archive.
         '''
+        from _compression import COMPRESSIONS, DecompressingFile, GetCompression
         import tarfile
-        oss = tarfile.open(tar_filename, mode)
-        oss.extractall(target_folder)
-        oss.close()
+
+        file_mode, _, compression = mode.partition(':')
+        if compression in ('', '*'):
+            compression = GetCompression(tar_filename) or compression
+        if compression in COMPRESSIONS:
+            if os.path.isfile(tar_filename):
+                stream = open(tar_filename, 'rb')
+            else:
+                stream = OpenFile(tar_filename, binary=True)
+            try:
+                oss = tarfile.open(
+                    fileobj=DecompressingFile(stream, compression), mode=file_mode + '|')
+                oss.extractall(target_folder)
+                oss.close()
+            finally:
+                stream.close()
+            return
+
+        if os.path.isfile(tar_filename):
+            oss = tarfile.open(tar_filename, mode)
+            oss.extractall(target_folder)
+            oss.close()
+            return
+
+        # Remote archive: read it as a stream ("r|gz" instead of "r:gz", etc)
+        stream = OpenFile(tar_filename, binary=True)
+        try:
+            oss = tarfile.open(fileobj=stream, mode='%s|%s' % (file_mode, compression or '*'))
+            oss.extractall(target_folder)
+            oss.close()
+        finally:
+            stream.close()
 
 
     def ExtractRar(self, rar_filename, target_folder):
@@ -147,7 +366,9 @@ class Archivist(object):
         :param str target_folder:
             Folder into which contents will be extracted
         '''
-        self.__ExtractArchive(rar_filename, target_folder)
+        # One member at a time: rarfile does not document whether a RarFile can be read by many
+        # threads.
+        self.__ExtractArchive(rar_filename, target_folder, workers=1)
 
 
     def ExtractArchive(self, filename, target_dir):
@@ -170,6 +391,11 @@ class Archivist(object):
             ('.tgz'     , self.ExtractTar, 'r:gz'),
             ('.tar.bz2' , self.ExtractTar, 'r:bz2'),
             ('.tbz2'    , self.ExtractTar, 'r:bz2'),
+            ('.tar.xz'  , self.ExtractTar, 'r:xz'),
+            ('.txz'     , self.ExtractTar, 'r:xz'),
+            ('.tar.zst' , self.ExtractTar, 'r:zst'),
+            ('.tzst'    , self.ExtractTar, 'r:zst'),
+            ('.tar.lz4' , self.ExtractTar, 'r:lz4'),
             ('.tar'     , self.ExtractTar, 'r'),
             ('.rar'     , self.ExtractRar, None),
             ('.cbr'     , self.ExtractRar, None),
@@ -187,6 +413,30 @@ class Archivist(object):
 
 
 
+    def OpenArchive(self, filename):
+        '''
+        Opens an archive to read some of its files, without extracting it. Zip archives are
+        memory-mapped, tar archives are indexed (.. seealso:: TarWrapper), so reading a few files
+        does not require reading the whole archive.
+
+        e.g.:
+            archive = Archivist().OpenArchive('huge.tar')
+            try:
+                stream = archive.OpenMember('sub_dir/charlie.txt')
+                ...
+            finally:
+                archive.Close()
+
+        :param str filename:
+            A zip, rar or tar (.. seealso:: archivist._archive_wrapper.TAR_EXTENSIONS) archive.
+
+        :rtype: IArchiveWrapper
+        '''
+        from _archive_wrapper import CreateArchiveWrapper
+        return CreateArchiveWrapper(filename)
+
+
+
     # Internal functions ---------------------------------------------------------------------------
     def _ZipFileListing(self, archive_mapping, out_filters=()):
         '''
@@ -202,14 +452,15 @@ class Archivist(object):
         result = []
         for i_zip_path, i_path in archive_mapping:
             tree_recurse, _flat_recurse, dirname, in_filters, i_out_filters = ExtendedPathMask.Split(i_path)
-            filenames = FindFiles(
+            entries = IterFindFiles(
                 dirname,
                 in_filters=in_filters,
                 out_filters=i_out_filters + list(out_filters),
                 recursive=tree_recurse,
+                yield_entries=True,
             )
-            for i_filename in filenames:
-                if not os.path.isdir(i_filename):
+            for i_filename, i_entry in entries:
+                if not i_entry.is_dir():
                     archive_filename = i_filename[len(dirname):]
                     if archive_filename.startswith('/') or archive_filename.startswith('\\'):
                         archive_filename = archive_filename[1:]
@@ -219,7 +470,7 @@ class Archivist(object):
         return result
 
 
-    def __ExtractArchive(self, archive_filename, target_dir):
+    def __ExtractArchive(self, archive_filename, target_dir, workers=None):
         '''
         Generic implementation of Extract Archive. Handles .rar and .zip files.
 
@@ -228,32 +479,270 @@ class Archivist(object):
 
         :param str target_dir:
             The target directory to extract the archive contents.
+
+        :param int|None workers:
+            The number of threads extracting members. If None, uses EXTRACT_WORKERS.
         '''
         # Get archive wrapper
         from _archive_wrapper import CreateArchiveWrapper
         archive = CreateArchiveWrapper(archive_filename)
 
 
-        # Create directories needed for target
-        target_dir = os.path.normpath(target_dir)
-        if not target_dir.endswith(':'):
-            CreateDirectory(target_dir)
+        try:
+            # Create directories needed for target
+            target_dir = os.path.normpath(target_dir)
+            if not target_dir.endswith(':'):
+                CreateDirectory(target_dir)
 
 
-        # Create archive structure
-        for sub_dir in archive.ListDirs():
-            curdir = os.path.join(target_dir, sub_dir)
-            CreateDirectory(curdir)
+            # Create archive structure
+            for sub_dir in archive.ListDirs():
+                curdir = os.path.join(target_dir, sub_dir)
+                CreateDirectory(curdir)
 
 
-        # Extract archive
-        for i_name in archive.ListFilenames():
-            target_filename = os.path.normpath(os.path.join(target_dir, i_name))
-            if os.path.isdir(target_filename):
-                continue
+            # Extract archive
+            members = []
+            for i_name in archive.ListFilenames():
+                target_filename = os.path.normpath(os.path.join(target_dir, i_name))
+                if os.path.isdir(target_filename):
+                    continue
+                members.append((i_name, target_filename))
 
-            CreateFile(
-                target_filename,
-                archive.ReadFile(i_name),
-                eol_style=EOL_STYLE_NONE,
-            )
+            def ExtractMember(member):
+                _ExtractMember(archive, *member)
+
+            if workers is None:
+                workers = EXTRACT_WORKERS
+            workers = min(workers, len(members))
+            if workers <= 1:
+                for i_member in members:
+                    ExtractMember(i_member)
+            else:
+                from multiprocessing.pool import ThreadPool
+                pool = ThreadPool(workers)
+                try:
+                    pool.map(ExtractMember, members)  # Raises the error of the first failed member
+                finally:
+                    pool.close()
+                    pool.join()
+        finally:
+            archive.Close()
+
+
+
+def _WriteZipMembers(zip_file, tasks, workers):
+    '''
+    Writes members in the zip archive, in order, preparing (compressing) them in many threads.
+
+    :param zipfile.ZipFile zip_file:
+
+    :param list(tuple(callable,tuple)) tasks:
+        The functions (and their arguments) that prepare each member, returning its info and
+        compressed contents (.. seealso:: _CompressZipMember).
+
+    :param int workers:
+        The number of threads preparing members.
+    '''
+    from multiprocessing.pool import ThreadPool
+    import collections
+
+    pool = ThreadPool(max(workers, 1))
+    try:
+        # Limits the compressed members waiting to be written.
+        pending = collections.deque()
+        for i_function, i_args in tasks:
+            pending.append(pool.apply_async(i_function, i_args))
+            if len(pending) > workers * 2:
+                _WriteZipMember(zip_file, *pending.popleft().get())
+        while pending:
+            _WriteZipMember(zip_file, *pending.popleft().get())
+    finally:
+        pool.close()
+        pool.join()
+
+
+
+def _CreateZipInfo(archive_filename, st):
+    '''
+    :param str archive_filename:
+        The filename inside the archive.
+
+    :param os.stat_result st:
+        The stat of the file, as zipfile.ZipFile.write uses it.
+
+    :rtype: zipfile.ZipInfo
+    :returns:
+        The info of a deflated member, without the sizes and CRC.
+    '''
+    import time
+    import zipfile
+
+    archive_filename = os.path.normpath(os.path.splitdrive(archive_filename)[1])
+    while archive_filename[0] in (os.sep, os.altsep):
+        archive_filename = archive_filename[1:]
+    zinfo = zipfile.ZipInfo(archive_filename, time.localtime(st.st_mtime)[0:6])
+    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16L
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zinfo.flag_bits = 0x00
+    return zinfo
+
+
+
+def _ReuseZipMember(archive, old_infos, archive_filename, filename):
+    '''
+    Reuses the compressed contents of a member of the archive, if the file did not change.
+    .. seealso:: Archivist.UpdateZip
+
+    :param str archive:
+        The zip archive being updated.
+
+    :param dict(str,zipfile.ZipInfo) old_infos:
+        The members of the archive.
+
+    :param str archive_filename:
+        The filename inside the archive.
+
+    :param str filename:
+
+    :rtype: tuple(zipfile.ZipInfo,file)|None
+    :returns:
+        The member info and its compressed contents (.. seealso:: _WriteZipMember), or None if the
+        file changed.
+    '''
+    from _archive_wrapper import _GetZipDataOffset, _PartialFile
+    import zipfile
+    import zlib
+
+    st = os.stat(filename)
+    zinfo = _CreateZipInfo(archive_filename, st)
+    old_info = old_infos.get(zinfo.filename)
+    if old_info is None or old_info.file_size != st.st_size or old_info.flag_bits & 0x1:
+        return None
+    if old_info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        return None
+
+    # Zip stores times with a resolution of 2 seconds.
+    date_time = zinfo.date_time[:5] + (zinfo.date_time[5] // 2 * 2,)
+    if tuple(old_info.date_time) != date_time:
+        crc = 0
+        with open(filename, 'rb') as iss:
+            for i_chunk in iter(lambda: iss.read(EXTRACT_CHUNK_SIZE), ''):
+                crc = zlib.crc32(i_chunk, crc)
+        if crc & 0xffffffff != old_info.CRC:
+            return None
+
+    zinfo.compress_type = old_info.compress_type
+    zinfo.CRC = old_info.CRC
+    zinfo.file_size = old_info.file_size
+    zinfo.compress_size = old_info.compress_size
+
+    stream = open(archive, 'rb')
+    try:
+        stream.seek(old_info.header_offset)
+        stream.seek(_GetZipDataOffset(old_info, stream.read(zipfile.sizeFileHeader)))
+    except:
+        stream.close()
+        raise
+    return zinfo, _PartialFile(stream, old_info.compress_size)
+
+
+
+def _CompressZipMember(archive_filename, filename, compresslevel=None):
+    '''
+    Compresses a file to be stored in a zip archive, as zipfile.ZipFile.write does.
+    .. seealso:: _WriteZipMember
+
+    :param str archive_filename:
+        The filename inside the archive.
+
+    :param str filename:
+
+    :param int|None compresslevel:
+        The zlib compression level. If None, uses zlib.Z_DEFAULT_COMPRESSION (as ZipFile).
+
+    :rtype: tuple(zipfile.ZipInfo,file)
+    :returns:
+        The member info and a temporary file with the compressed contents.
+    '''
+    import tempfile
+    import zlib
+
+    zinfo = _CreateZipInfo(archive_filename, os.stat(filename))
+    compressed = tempfile.SpooledTemporaryFile(COMPRESS_SPOOL_SIZE)
+    if compresslevel is None:
+        compresslevel = zlib.Z_DEFAULT_COMPRESSION
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    crc = 0
+    file_size = 0
+    with open(filename, 'rb') as iss:
+        for i_chunk in iter(lambda: iss.read(EXTRACT_CHUNK_SIZE), ''):
+            crc = zlib.crc32(i_chunk, crc)
+            file_size += len(i_chunk)
+            compressed.write(compressor.compress(i_chunk))
+    compressed.write(compressor.flush())
+
+    zinfo.CRC = crc & 0xffffffff
+    zinfo.file_size = file_size
+    zinfo.compress_size = compressed.tell()
+    compressed.seek(0)
+    return zinfo, compressed
+
+
+
+def _WriteZipMember(zip_file, zinfo, compressed):
+    '''
+    Writes an already compressed member in the zip archive.
+
+    Uses the zipfile.ZipFile internals, as ZipFile.write does: there is no public method to write
+    compressed data.
+
+    :param zipfile.ZipFile zip_file:
+
+    :param zipfile.ZipInfo zinfo:
+
+    :param file compressed:
+        The compressed contents (.. seealso:: _CompressZipMember). Closed after written.
+    '''
+    import shutil
+    import zipfile
+
+    zinfo.header_offset = zip_file.fp.tell()
+    zip_file._writecheck(zinfo)
+    zip_file._didModify = True
+    zip64 = zip_file._allowZip64 and zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+    zip_file.fp.write(zinfo.FileHeader(zip64))
+    try:
+        shutil.copyfileobj(compressed, zip_file.fp, EXTRACT_CHUNK_SIZE)
+    finally:
+        compressed.close()
+    zip_file.filelist.append(zinfo)
+    zip_file.NameToInfo[zinfo.filename] = zinfo
+
+
+
+def _ExtractMember(archive, name, target_filename):
+    '''
+    Extracts a file from the archive in chunks, preserving its permissions and modification time.
+
+    :param IArchiveWrapper archive:
+
+    :param str name:
+        The filename inside the archive.
+
+    :param str target_filename:
+    '''
+    import shutil
+
+    source = archive.OpenMember(name)
+    try:
+        with open(target_filename, 'wb') as oss:
+            shutil.copyfileobj(source, oss, EXTRACT_CHUNK_SIZE)
+    finally:
+        source.close()
+
+    mode = archive.GetFileMode(name)
+    if mode is not None:
+        os.chmod(target_filename, mode)
+    mtime = archive.GetFileMTime(name)
+    os.utime(target_filename, (mtime, mtime))
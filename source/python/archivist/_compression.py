@@ -0,0 +1,255 @@
+'''
+Compressions for tar archives not supported by tarfile, available when their (optional) modules can
+be imported:
+    xz: lzma (Python 3) or backports.lzma
+    zst: zstandard
+    lz4: lz4.frame
+'''
+
+
+
+# The compressions and the extensions of the tar archives compressed with them.
+COMPRESSION_EXTENSIONS = [
+    ('xz', ('.tar.xz', '.txz')),
+    ('zst', ('.tar.zst', '.tzst')),
+    ('lz4', ('.tar.lz4',)),
+]
+COMPRESSIONS = [i for i, _extensions in COMPRESSION_EXTENSIONS]
+
+# The size of the chunks read from compressed streams.
+CHUNK_SIZE = 64 * 1024
+
+
+#===================================================================================================
+# GetCompression
+#===================================================================================================
+def GetCompression(filename):
+    '''
+    :param str filename:
+        The name of a tar archive.
+
+    :rtype: str|None
+    :returns:
+        The compression of the archive (one of COMPRESSIONS), from its extension. None if not
+        compressed with any of COMPRESSIONS.
+    '''
+    for i_compression, i_extensions in COMPRESSION_EXTENSIONS:
+        if filename.endswith(i_extensions):
+            return i_compression
+    return None
+
+
+
+#===================================================================================================
+# IsCompressionAvailable
+#===================================================================================================
+def IsCompressionAvailable(compression):
+    '''
+    :param str compression:
+        One of COMPRESSIONS.
+
+    :rtype: bool
+    :returns:
+        Whether the module needed by the compression can be imported.
+    '''
+    try:
+        _ImportModule(compression)
+    except ImportError:
+        return False
+    return True
+
+
+
+#===================================================================================================
+# CompressingFile
+#===================================================================================================
+class CompressingFile(object):
+    '''
+    A write-only file, compressed with one of COMPRESSIONS as written.
+
+    e.g.:
+        oss = tarfile.open(fileobj=CompressingFile('alpha.tar.xz', 'xz'), mode='w|')
+    '''
+
+    def __init__(self, filename, compression, compresslevel=None):
+        '''
+        :param str filename:
+            The file to create.
+
+        :param str compression:
+            One of COMPRESSIONS.
+
+        :param int|None compresslevel:
+            The compression level (the meaning depends on the compression). If None, uses the
+            default level of the compression module.
+
+        :raises ImportError:
+            If the module needed by the compression is not available.
+        '''
+        self._compressor = _CreateCompressor(compression, compresslevel)
+        self._file = open(filename, 'wb')
+
+
+    def write(self, data):
+        '''
+        :param str data:
+        '''
+        self._file.write(self._compressor.compress(data))
+
+
+    def close(self):
+        '''
+        Finishes the compressed stream and closes the file.
+        '''
+        if self._file is None:
+            return
+        self._file.write(self._compressor.flush())
+        self._file.close()
+        self._file = None
+
+
+
+#===================================================================================================
+# DecompressingFile
+#===================================================================================================
+class DecompressingFile(object):
+    '''
+    A read-only file with the decompressed contents of a stream compressed with one of
+    COMPRESSIONS. The stream is read as needed, so it can be a remote file being downloaded.
+
+    e.g.:
+        oss = tarfile.open(fileobj=DecompressingFile(open('alpha.tar.xz', 'rb'), 'xz'), mode='r|')
+    '''
+
+    def __init__(self, stream, compression):
+        '''
+        :param file stream:
+            The compressed stream. Not closed by this object.
+
+        :param str compression:
+            One of COMPRESSIONS.
+
+        :raises ImportError:
+            If the module needed by the compression is not available.
+        '''
+        self._stream = stream
+        self._decompressor = _CreateDecompressor(compression)
+        self._buffer = ''
+        self._offset = 0
+
+
+    def read(self, size=-1):
+        '''
+        :param int size:
+            The maximum number of bytes to read. If negative, reads until the end of the stream.
+
+        :rtype: str
+        '''
+        result = []
+        while size != 0:
+            if self._offset == len(self._buffer):
+                compressed = self._stream.read(CHUNK_SIZE)
+                if not compressed:
+                    break
+                self._buffer = self._decompressor.decompress(compressed)
+                self._offset = 0
+                continue
+
+            if size < 0:
+                end = len(self._buffer)
+            else:
+                end = min(self._offset + size, len(self._buffer))
+                size -= end - self._offset
+            result.append(self._buffer[self._offset:end])
+            self._offset = end
+        return ''.join(result)
+
+
+    def close(self):
+        pass
+
+
+
+def _ImportModule(compression):
+    '''
+    :rtype: module
+    :returns:
+        The module implementing the given compression.
+
+    :raises ImportError:
+    '''
+    if compression == 'xz':
+        try:
+            import lzma
+        except ImportError:
+            from backports import lzma
+        return lzma
+    if compression == 'zst':
+        import zstandard
+        return zstandard
+    if compression == 'lz4':
+        import lz4.frame
+        return lz4.frame
+    raise ValueError('Unknown compression: %s' % compression)
+
+
+
+def _CreateCompressor(compression, compresslevel):
+    '''
+    :rtype: object
+    :returns:
+        An object with the methods "compress(data)" and "flush()", as zlib.compressobj.
+    '''
+    module = _ImportModule(compression)
+    if compression == 'xz':
+        return module.LZMACompressor(preset=compresslevel)
+    if compression == 'zst':
+        if compresslevel is None:
+            return module.ZstdCompressor().compressobj()
+        return module.ZstdCompressor(level=compresslevel).compressobj()
+    return _Lz4Compressor(module, compresslevel)
+
+
+
+def _CreateDecompressor(compression):
+    '''
+    :rtype: object
+    :returns:
+        An object with the method "decompress(data)", as zlib.decompressobj.
+    '''
+    module = _ImportModule(compression)
+    if compression == 'xz':
+        return module.LZMADecompressor()
+    if compression == 'zst':
+        return module.ZstdDecompressor().decompressobj()
+    return module.LZ4FrameDecompressor()
+
+
+
+#===================================================================================================
+# _Lz4Compressor
+#===================================================================================================
+class _Lz4Compressor(object):
+    '''
+    Adapts lz4.frame.LZ4FrameCompressor to the zlib.compressobj interface: its frame header is
+    written with the first data.
+    '''
+
+    def __init__(self, lz4_frame, compresslevel):
+        if compresslevel is None:
+            self._compressor = lz4_frame.LZ4FrameCompressor()
+        else:
+            self._compressor = lz4_frame.LZ4FrameCompressor(compression_level=compresslevel)
+        self._header = self._compressor.begin()
+
+
+    def compress(self, data):
+        result = self._header + self._compressor.compress(data)
+        self._header = ''
+        return result
+
+
+    def flush(self):
+        result = self._header + self._compressor.flush()
+        self._header = ''
+        return result
@@ -0,0 +1,124 @@
+'''
+Gzip compression in many threads, like pigz (http://zlib.net/pigz).
+'''
+import collections
+import struct
+import zlib
+
+
+
+# The size of the blocks compressed independently.
+BLOCK_SIZE = 1024 * 1024
+
+
+#===================================================================================================
+# ParallelGzipFile
+#===================================================================================================
+class ParallelGzipFile(object):
+    '''
+    A write-only gzip file, compressed in many threads.
+
+    The data is split in blocks, compressed independently (zlib releases the GIL while
+    compressing). Each block but the last ends with a sync flush (it is byte aligned and not marked
+    as the final one) so the compressed blocks, concatenated in order, form a single deflate stream:
+    the result is a regular gzip file with a single member, readable by any gzip reader, including
+    streaming ones (e.g. tarfile "r|gz").
+
+    Since the blocks do not share the compression history the result is slightly bigger than
+    compressing in a single stream.
+    '''
+
+    def __init__(self, filename, workers, compresslevel=9, block_size=None):
+        '''
+        :param str filename:
+            The gzip file to create.
+
+        :param int workers:
+            The number of threads compressing blocks.
+
+        :param int compresslevel:
+            .. seealso:: gzip.GzipFile
+
+        :param int|None block_size:
+            The size of the blocks compressed independently. If None, uses BLOCK_SIZE.
+        '''
+        from multiprocessing.pool import ThreadPool
+        import time
+
+        self._compresslevel = compresslevel
+        self._block_size = block_size or BLOCK_SIZE
+        self._pool = ThreadPool(workers)
+        self._max_pending = workers * 2
+        self._pending = collections.deque()
+
+        self._buffer = []
+        self._buffer_size = 0
+        self._crc = 0
+        self._size = 0
+
+        self._file = open(filename, 'wb')
+        # Magic, deflate method, no flags, mtime, maximum compression, unknown OS (as gzip.GzipFile)
+        self._file.write('\037\213\010\000' + struct.pack('<L', long(time.time())) + '\002\377')
+
+
+    def write(self, data):
+        '''
+        :param str data:
+        '''
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self._buffer.append(data)
+        self._buffer_size += len(data)
+        if self._buffer_size >= self._block_size:
+            self._CompressBuffer(last=False)
+
+
+    def close(self):
+        '''
+        Compresses the remaining data and closes the file.
+        '''
+        if self._file is None:
+            return
+
+        self._CompressBuffer(last=True)
+        while self._pending:
+            self._file.write(self._pending.popleft().get())
+        self._file.write(struct.pack('<LL', self._crc & 0xffffffff, self._size & 0xffffffff))
+        self._file.close()
+        self._file = None
+
+        self._pool.close()
+        self._pool.join()
+
+
+    def _CompressBuffer(self, last):
+        '''
+        Starts compressing the buffered data, writing the blocks already compressed (in order).
+
+        Limits the number of blocks waiting to be written, so the memory used does not depend on
+        the size of the file.
+
+        :param bool last:
+            Whether this is the last block of the file.
+        '''
+        block = ''.join(self._buffer)
+        self._buffer = []
+        self._buffer_size = 0
+
+        self._pending.append(
+            self._pool.apply_async(_CompressBlock, (block, self._compresslevel, last)))
+        while len(self._pending) > self._max_pending:
+            self._file.write(self._pending.popleft().get())
+
+
+
+def _CompressBlock(block, compresslevel, last):
+    '''
+    :rtype: str
+    :returns:
+        The block compressed as raw deflate data, ending with a sync flush (or, for the last block,
+        finishing the stream).
+    '''
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    flush_mode = zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+    return compressor.compress(block) + compressor.flush(flush_mode)
@@ -1,4 +1,5 @@
 from ben10.filesystem import FileAlreadyExistsError
+import pytest
 
 
 
@@ -35,6 +36,336 @@ class Test:
         self._TestArchive(embed_data, embed_data['alpha.tgz'])
 
 
+    @pytest.mark.parametrize('extension', ['.tar.xz', '.tar.zst', '.tar.lz4'])
+    def testCreateAndExtractOptionalCompressions(self, embed_data, extension):
+        from archivist._compression import GetCompression, IsCompressionAvailable
+
+        if not IsCompressionAvailable(GetCompression(extension)):
+            pytest.skip('Compression module not available')
+        self._TestArchive(embed_data, embed_data['alpha' + extension])
+
+
+    @pytest.mark.parametrize('extension', ['.tar.xz', '.tar.zst', '.tar.lz4'])
+    def testOptionalCompressionsWithFakeModule(self, embed_data, monkeypatch, extension):
+        from archivist import _compression
+        from archivist import Archivist
+        from archivist._compression import (CHUNK_SIZE, CompressingFile, DecompressingFile,
+            GetCompression, IsCompressionAvailable)
+        from ben10.filesystem import GetFileContents, ListFiles
+        import zlib
+
+        # The real modules are optional: use zlib behind the same interfaces so the code using
+        # them always runs.
+        monkeypatch.setattr(_compression, '_ImportModule', _CreateFakeCompressionModule)
+        compression = GetCompression(extension)
+        assert IsCompressionAvailable(compression)
+
+        filename = embed_data['alpha' + extension]
+        self._TestArchive(embed_data, filename)
+
+        # The archive was really written by the (fake) compressor
+        contents = GetFileContents(filename, binary=True)
+        if compression == 'lz4':
+            assert contents.startswith(_FakeLz4FrameDecompressor.HEADER)
+            contents = contents[len(_FakeLz4FrameDecompressor.HEADER):]
+        tar_contents = zlib.decompress(contents)
+        assert len(tar_contents) % 512 == 0
+
+        # Reads smaller and larger than the decompressed chunks are buffered correctly
+        stream = DecompressingFile(open(filename, 'rb'), compression)
+        read = []
+        for i_size in [1, 7, 0, CHUNK_SIZE + 3, 512]:
+            read.append(stream.read(i_size))
+            assert len(read[-1]) == min(i_size, len(tar_contents) - len(''.join(read[:-1])))
+        read.append(stream.read())
+        assert stream.read() == ''
+        stream.close()
+        assert ''.join(read) == tar_contents
+
+        # An explicit compression level is passed to the compressor
+        leveled_filename = embed_data['leveled' + extension]
+        stream = CompressingFile(leveled_filename, compression, compresslevel=1)
+        stream.write(tar_contents)
+        stream.close()
+        stream.close()
+        stream = DecompressingFile(open(leveled_filename, 'rb'), compression)
+        assert stream.read() == tar_contents
+        stream.close()
+
+        # ExtractTar with an explicit mode
+        target_dir = embed_data['mode' + extension]
+        Archivist().ExtractTar(leveled_filename, target_dir, mode='r:' + compression)
+        assert sorted(ListFiles(target_dir + '/root_dir')) == \
+            ['alpha.txt', 'apache_pb.gif', 'bravo.txt', 'sub_dir']
+        embed_data.AssertEqualFiles(
+            'mode%s/root_dir/alpha.txt' % extension,
+            'CREATE/root_dir/alpha.txt',
+        )
+
+
+    def testExtractRemoteTar(self, embed_data, httpserver):
+        from archivist import Archivist
+        from ben10.filesystem import GetFileContents
+
+        archive = Archivist()
+        for i_extension, i_mode in [('.tar.gz', 'r:gz'), ('.tar.bz2', 'r:bz2'), ('.tar', 'r')]:
+            i_filename = embed_data['alpha' + i_extension]
+            archive.CreateArchive(
+                i_filename,
+                archive_mapping=[('root_dir', '+' + embed_data['CREATE/root_dir/*'])]
+            )
+            httpserver.serve_content(GetFileContents(i_filename, binary=True))
+
+            # Extracted while downloaded, without a local copy of the archive
+            i_target_dir = embed_data['remote' + i_extension]
+            archive.ExtractTar(httpserver.url + '/alpha' + i_extension, i_target_dir, mode=i_mode)
+            embed_data.AssertEqualFiles(
+                'remote%s/root_dir/apache_pb.gif' % i_extension,
+                'CREATE/root_dir/apache_pb.gif',
+            )
+            embed_data.AssertEqualFiles(
+                'remote%s/root_dir/sub_dir/charlie.txt' % i_extension,
+                'CREATE/root_dir/sub_dir/charlie.txt',
+            )
+
+
+    @pytest.mark.skipif('sys.platform == "win32"')
+    def testExtractZipAttributes(self, embed_data):
+        from archivist import Archivist
+        from ben10.filesystem import CreateFile, FindFiles, GetFileContents
+        import os
+        import stat
+
+        mtime = 1400000000  # Even: zip stores times with a resolution of 2 seconds
+        for i_index in xrange(20):
+            i_filename = embed_data['CREATE/many/%02d.txt' % i_index]
+            CreateFile(i_filename, str(i_index) * (i_index * 10000))
+            os.chmod(i_filename, 0o755 if i_index % 2 else 0o644)
+            os.utime(i_filename, (mtime, mtime + i_index * 2))
+
+        archive = Archivist()
+        archive.CreateArchive(
+            embed_data['many.zip'],
+            archive_mapping=[('many', '+' + embed_data['CREATE/many/*'])],
+        )
+
+        for i_workers in (1, 4):
+            i_target_dir = embed_data['extracted_%d' % i_workers]
+            archive.ExtractZip(embed_data['many.zip'], i_target_dir, workers=i_workers)
+            assert len(FindFiles(i_target_dir, in_filters=['*.txt'])) == 20
+            for i_index in xrange(20):
+                i_filename = os.path.join(i_target_dir, 'many', '%02d.txt' % i_index)
+                assert GetFileContents(i_filename) == str(i_index) * (i_index * 10000)
+                i_stat = os.stat(i_filename)
+                assert stat.S_IMODE(i_stat.st_mode) == (0o755 if i_index % 2 else 0o644)
+                assert i_stat.st_mtime == mtime + i_index * 2
+
+
+    def testCreateArchiveParallel(self, embed_data):
+        from archivist import Archivist
+        from archivist._parallel_gzip import ParallelGzipFile
+        from ben10.filesystem import GetFileContents
+        import gzip
+        import tarfile
+        import zlib
+
+        archive = Archivist()
+        archive_mapping = [('root_dir', '+' + embed_data['CREATE/root_dir/*'])]
+
+        # The same zip for any number of workers
+        for i_workers in (1, 4):
+            archive.CreateArchive(
+                embed_data['alpha_%d.zip' % i_workers], archive_mapping, workers=i_workers)
+        assert GetFileContents(embed_data['alpha_4.zip'], binary=True) == GetFileContents(
+            embed_data['alpha_1.zip'], binary=True)
+
+        # Blocks compressed independently form a single gzip member
+        contents = ''.join('line %d\n' % i for i in xrange(20000))
+        gzip_file = ParallelGzipFile(embed_data['contents.gz'], workers=4, block_size=10000)
+        for i_start in xrange(0, len(contents), 3000):
+            gzip_file.write(contents[i_start:i_start + 3000])
+        gzip_file.close()
+        compressed = GetFileContents(embed_data['contents.gz'], binary=True)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        assert decompressor.decompress(compressed) == contents
+        assert decompressor.unused_data == ''
+        assert gzip.open(embed_data['contents.gz']).read() == contents
+
+        archive.CreateArchive(embed_data['alpha.tar.gz'], archive_mapping, workers=4)
+        with open(embed_data['alpha.tar.gz'], 'rb') as iss:
+            oss = tarfile.open(fileobj=iss, mode='r|gz')  # Streaming reader
+            oss.extractall(embed_data['extracted'])
+            oss.close()
+        embed_data.AssertEqualFiles(
+            'extracted/root_dir/apache_pb.gif',
+            'CREATE/root_dir/apache_pb.gif',
+        )
+
+
+    def testCreateArchiveParallel__slow(self, embed_data):
+        '''
+        Archives created with several workers (compressed in parallel) have the same contents as
+        the ones created with a single worker.
+        '''
+        from archivist import Archivist
+        from ben10.filesystem import CreateFile, FindFiles, GetFileContents
+        import random
+
+        random_ = random.Random(0)
+        words = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel']
+        for i_index in xrange(32):
+            CreateFile(
+                embed_data['many/file_%02d.txt' % i_index],
+                ' '.join(random_.choice(words) for _i in xrange(200000)),
+            )
+
+        def GetContents(directory):
+            filenames = FindFiles(directory, include_root_dir=False)
+            return dict(
+                (i, GetFileContents(directory + '/' + i, binary=True)) for i in filenames)
+
+        expected = GetContents(embed_data['many'])
+        assert len(expected) == 32
+        archive = Archivist()
+        for i_extension in ('.zip', '.tar.gz'):
+            extracted = []
+            for i_workers in (1, 4):
+                i_name = 'many_%s%s' % (i_workers, i_extension)
+                archive.CreateArchive(
+                    embed_data[i_name], [('.', '+' + embed_data['many/*'])], workers=i_workers)
+                archive.ExtractArchive(embed_data[i_name], embed_data['extracted_' + i_name])
+                extracted.append(GetContents(embed_data['extracted_' + i_name]))
+            assert extracted == [expected, expected]
+
+
+    def testUpdateZip(self, embed_data):
+        from archivist import Archivist
+        from ben10.filesystem import CreateFile, DeleteFile, GetFileContents
+        import os
+        import zipfile
+
+        mtime = 1400000000
+        for i_name in ('alpha', 'bravo', 'charlie'):
+            CreateFile(embed_data['update/%s.txt' % i_name], i_name * 1000)
+            os.utime(embed_data['update/%s.txt' % i_name], (mtime, mtime))
+
+        archive = Archivist()
+        archive_mapping = [('update', '+' + embed_data['update/*'])]
+        assert archive.UpdateZip(embed_data['update.zip'], archive_mapping) == [
+            'update/alpha.txt', 'update/bravo.txt', 'update/charlie.txt']
+
+        # Nothing changed
+        assert archive.UpdateZip(embed_data['update.zip'], archive_mapping) == []
+
+        os.utime(embed_data['update/alpha.txt'], (mtime + 10, mtime + 10))  # Same contents
+        CreateFile(embed_data['update/bravo.txt'], 'BRAVO' * 200)  # Same size
+        os.utime(embed_data['update/bravo.txt'], (mtime, mtime))
+        DeleteFile(embed_data['update/charlie.txt'])
+        CreateFile(embed_data['update/delta.txt'], 'delta')
+        assert archive.UpdateZip(embed_data['update.zip'], archive_mapping, workers=1) == [
+            'update/bravo.txt', 'update/delta.txt']
+
+        # The same archive as created from scratch
+        archive.CreateArchive(embed_data['created.zip'], archive_mapping)
+        assert GetFileContents(embed_data['update.zip'], binary=True) == GetFileContents(
+            embed_data['created.zip'], binary=True)
+        with zipfile.ZipFile(embed_data['update.zip']) as zip_file:
+            assert zip_file.testzip() is None
+            assert zip_file.read('update/bravo.txt') == 'BRAVO' * 200
+        assert not os.path.isfile(embed_data['update.zip.tmp'])
+
+        # Through CreateArchive
+        CreateFile(embed_data['update/delta.txt'], 'DELTA!')
+        archive.CreateArchive(embed_data['update.zip'], archive_mapping, update=True)
+        with zipfile.ZipFile(embed_data['update.zip']) as zip_file:
+            assert zip_file.read('update/delta.txt') == 'DELTA!'
+            assert zip_file.read('update/alpha.txt') == 'alpha' * 1000
+
+
+    def testOpenArchive(self, embed_data, monkeypatch):
+        from archivist import Archivist
+        from ben10.filesystem import GetFileContents, IsFile
+        import tarfile
+        import zipfile
+
+        archive = Archivist()
+        archive_mapping = [('root_dir', '+' + embed_data['CREATE/root_dir/*'])]
+        gif_contents = GetFileContents(embed_data['CREATE/root_dir/apache_pb.gif'], binary=True)
+
+        def AssertArchive(filename):
+            wrapper = archive.OpenArchive(filename)
+            try:
+                assert sorted(wrapper.ListFilenames()) == [
+                    'root_dir/alpha.txt',
+                    'root_dir/apache_pb.gif',
+                    'root_dir/bravo.txt',
+                    'root_dir/sub_dir/charlie.txt',
+                ]
+                assert wrapper.ListDirs() == ['root_dir', 'root_dir/sub_dir']
+                assert wrapper.ReadFile('root_dir/apache_pb.gif') == gif_contents
+
+                # Read in small chunks
+                member_file = wrapper.OpenMember('root_dir/apache_pb.gif')
+                chunks = iter(lambda: member_file.read(100), '')
+                assert ''.join(chunks) == gif_contents
+                member_file.close()
+
+                with pytest.raises(KeyError):
+                    wrapper.OpenMember('root_dir/missing.txt')
+            finally:
+                wrapper.Close()
+
+        for i_extension in ('.zip', '.tar', '.tar.gz'):
+            archive.CreateArchive(embed_data['alpha' + i_extension], archive_mapping)
+            AssertArchive(embed_data['alpha' + i_extension])
+
+        # Stored (not compressed) zip members
+        with zipfile.ZipFile(embed_data['stored.zip'], 'w', zipfile.ZIP_STORED) as oss:
+            for i_name, i_filename in archive._ZipFileListing(archive_mapping):
+                oss.write(i_filename, i_name)
+        AssertArchive(embed_data['stored.zip'])
+
+        # The index of tar archives is stored along with the archive, and used the next times
+        assert IsFile(embed_data['alpha.tar.index'])
+        with monkeypatch.context() as patch:
+            patch.setattr(tarfile, 'open', None)
+            AssertArchive(embed_data['alpha.tar'])
+
+        # Corrupted zip members are detected (stored and deflated)
+        from archivist._archive_wrapper import _GetZipDataOffset
+        import shutil
+
+        shutil.copyfile(embed_data['alpha.zip'], embed_data['invalid_deflate.zip'])
+        corruptions = [
+            # CRC mismatch: a byte in the middle of the data changed
+            (embed_data['stored.zip'], 'middle', lambda x: x ^ 0xff),
+            (embed_data['alpha.zip'], 'middle', lambda x: x ^ 0xff),
+            # Invalid deflate data (zlib.error): the first block with the invalid type 11
+            (embed_data['invalid_deflate.zip'], 'start', lambda x: x | 0x07),
+        ]
+        for i_filename, i_position, i_corrupt in corruptions:
+            with zipfile.ZipFile(i_filename) as iss:
+                info = iss.getinfo('root_dir/apache_pb.gif')
+            with open(i_filename, 'r+b') as oss:
+                oss.seek(info.header_offset)
+                offset = _GetZipDataOffset(info, oss.read(zipfile.sizeFileHeader))
+                if i_position == 'middle':
+                    offset += info.compress_size // 2
+                oss.seek(offset)
+                byte = oss.read(1)
+                oss.seek(offset)
+                oss.write(chr(i_corrupt(ord(byte))))
+
+            wrapper = archive.OpenArchive(i_filename)
+            try:
+                member_file = wrapper.OpenMember('root_dir/apache_pb.gif')
+                with pytest.raises(zipfile.BadZipfile):
+                    member_file.read()
+                member_file.close()
+            finally:
+                wrapper.Close()
+
+
     def testExceptions(self, embed_data):
         from archivist import Archivist
         from ben10.filesystem import CreateDirectory, CreateFile
@@ -119,3 +450,86 @@ class Test:
             'root_dir/apache_pb.gif',
             'CREATE/root_dir/apache_pb.gif',
         )
+
+
+
+class _FakeLz4FrameCompressor(object):
+
+    def __init__(self, compression_level=9):
+        import zlib
+        self._compressor = zlib.compressobj(compression_level)
+
+
+    def begin(self):
+        return _FakeLz4FrameDecompressor.HEADER
+
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+
+class _FakeLz4FrameDecompressor(object):
+
+    HEADER = 'FAKE-LZ4'
+
+    def __init__(self):
+        import zlib
+        self._decompressor = zlib.decompressobj()
+        self._header = ''
+
+
+    def decompress(self, data):
+        missing = len(self.HEADER) - len(self._header)
+        if missing:
+            self._header += data[:missing]
+            data = data[missing:]
+        return self._decompressor.decompress(data)
+
+
+
+class _FakeZstdCompressor(object):
+
+    def __init__(self, level=9):
+        self._level = level
+
+
+    def compressobj(self):
+        import zlib
+        return zlib.compressobj(self._level)
+
+
+
+class _FakeZstdDecompressor(object):
+
+    def decompressobj(self):
+        import zlib
+        return zlib.decompressobj()
+
+
+
+def _CreateFakeCompressionModule(compression):
+    '''
+    Replacement for archivist._compression._ImportModule: the parts of lzma, zstandard and lz4.frame
+    used by archivist implemented with zlib.
+    '''
+    import types
+    import zlib
+
+    module = types.ModuleType('fake_' + compression)
+    if compression == 'xz':
+        module.LZMACompressor = lambda preset: zlib.compressobj(9 if preset is None else preset)
+        module.LZMADecompressor = zlib.decompressobj
+    elif compression == 'zst':
+        module.ZstdCompressor = _FakeZstdCompressor
+        module.ZstdDecompressor = _FakeZstdDecompressor
+    elif compression == 'lz4':
+        module.LZ4FrameCompressor = _FakeLz4FrameCompressor
+        module.LZ4FrameDecompressor = _FakeLz4FrameDecompressor
+    else:
+        raise ValueError('Unknown compression: %r' % compression)
+    return module
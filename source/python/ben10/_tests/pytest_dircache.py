@@ -1,5 +1,6 @@
-from ben10.dircache import CacheDisabled, DirCache
-from ben10.filesystem import CreateFile, IsFile, IsLink
+from ben10.dircache import CacheDisabled, CollectGarbage, DirCache
+from ben10.filesystem import (CreateFile, DeleteDirectory, DeleteFile, DeleteLink, FileLock,
+    FileLockTimeoutError, FindFiles, GetFileContents, IsFile, IsLink, ReadLink)
 import os
 import pytest
 
@@ -74,6 +75,28 @@ class Test:
         assert os.path.isdir(embed_data['cache_dir/alpha'])
 
 
+    def testDownloadRemoteTar(self, embed_data, httpserver):
+        '''
+        Tar archives are extracted while downloaded, without a local copy of the archive.
+        '''
+        from archivist import Archivist
+
+        archive_filename = embed_data['alpha.tar.gz']
+        Archivist().CreateArchive(
+            archive_filename,
+            archive_mapping=[('.', '+' + embed_data['remotes/alpha/*'])],
+        )
+        httpserver.serve_content(GetFileContents(archive_filename, binary=True))
+
+        for i_remote in (archive_filename, httpserver.url + '/alpha.tar.gz'):
+            dir_cache = DirCache(i_remote, embed_data['local/zulu'], embed_data['cache_dir'])
+            assert dir_cache.GetName() == 'alpha.tar'  # Only the last extension is removed
+
+            dir_cache.CreateCache(force=True)
+            assert os.path.isfile(embed_data['cache_dir/alpha.tar/file.txt'])
+            assert not os.path.exists(embed_data['cache_dir/alpha.tar.gz'])
+
+
     def testMakeLocallyAvailable(self, embed_data):
         '''
         Tests the MakeLocallyAvailable method.
@@ -144,3 +167,421 @@ class Test:
         dir_cache.DeleteLocal()
         assert dir_cache.RemoteExists()
         assert not dir_cache.LocalExists()
+
+
+    def testCreateCacheConcurrently(self, embed_data, monkeypatch):
+        '''
+        Many processes (here, threads) creating the same cache: only one downloads the remote, the
+        others wait for it.
+        '''
+        import threading
+        import time
+
+        # Left by a process that died while downloading
+        CreateFile(embed_data['cache_dir/alpha.tmp/garbage.txt'], 'garbage')
+
+        downloads = []
+        original_download_remote = DirCache._DownloadRemote
+        def MockDownloadRemote(dir_cache, extract_dir, target_dir):
+            downloads.append(target_dir)
+            time.sleep(0.2)  # Give the other threads the chance to try
+            original_download_remote(dir_cache, extract_dir, target_dir)
+            # The cache directory only appears when complete
+            assert not os.path.isdir(embed_data['cache_dir/alpha'])
+        monkeypatch.setattr(DirCache, '_DownloadRemote', MockDownloadRemote)
+
+        def NewDirCache():
+            return DirCache(
+                embed_data['remotes/alpha.zip'],
+                embed_data['local/zulu'],
+                embed_data['cache_dir'],
+            )
+
+        errors = []
+        def CreateCache():
+            try:
+                NewDirCache().CreateCache()
+                assert os.path.isfile(embed_data['cache_dir/alpha/file.txt'])
+            except Exception, e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=CreateCache) for _i in xrange(8)]
+        for i_thread in threads:
+            i_thread.start()
+        for i_thread in threads:
+            i_thread.join()
+
+        assert errors == []
+        assert len(downloads) == 1
+        assert not os.path.exists(embed_data['cache_dir/alpha.tmp'])
+
+        # Waiting for another process
+        with FileLock(embed_data['cache_dir/alpha.lock']):
+            with pytest.raises(FileLockTimeoutError):
+                NewDirCache().CreateCache(force=True, timeout=0.1)
+        assert len(downloads) == 1
+
+
+    def testCollectGarbage(self, embed_data):
+        def NewDirCache(name):
+            CreateFile(embed_data['remotes/%s/file.bin' % name], 'x' * 1000)
+            return DirCache(
+                embed_data['remotes/%s' % name],
+                embed_data['local/%s' % name],
+                embed_data['cache_dir'],
+            )
+
+        dir_caches = [NewDirCache(i) for i in ('alpha', 'bravo', 'charlie', 'delta')]
+        for i_dir_cache in dir_caches:
+            i_dir_cache.CreateCache()
+        dir_caches[1].CreateLocal()
+
+        # Set the last access of each cache: alpha is the least recently used.
+        for i_index, i_name in enumerate(('alpha', 'bravo', 'charlie', 'delta')):
+            os.utime(embed_data['cache_dir/%s.usage' % i_name], (1000 + i_index, 1000 + i_index))
+
+        assert CollectGarbage(embed_data['cache_dir'], 4000) == []
+
+        # bravo is linked by a local directory: it is kept.
+        # charlie is being used by another process: it is kept.
+        with FileLock(embed_data['cache_dir/charlie.lock']):
+            assert CollectGarbage(embed_data['cache_dir'], 1500) == ['alpha', 'delta']
+        assert not dir_caches[0].CacheExists()
+        assert not os.path.exists(embed_data['cache_dir/alpha.usage'])
+        assert dir_caches[1].CacheExists()
+        assert dir_caches[2].CacheExists()
+        assert not dir_caches[3].CacheExists()
+
+        # Using a cache updates its last access.
+        dir_caches[2].CreateCache()
+        dir_caches[1].DeleteLocal()
+        assert CollectGarbage(embed_data['cache_dir'], 1000) == ['bravo']
+        assert dir_caches[2].CacheExists()
+
+        # Removed caches are downloaded again when needed.
+        dir_caches[0].CreateLocal()
+        assert os.path.isfile(embed_data['local/alpha/file.bin'])
+        assert CollectGarbage(embed_data['cache_dir'], 0) == ['charlie']
+
+        assert CollectGarbage(embed_data['missing_dir'], 0) == []
+
+
+    def testParseSize(self):
+        from ben10.dircache import ParseSize
+
+        assert ParseSize('1000') == 1000
+        assert ParseSize('512K') == 512 * 1024
+        assert ParseSize('2m') == 2 * 1024 ** 2
+        assert ParseSize(' 1.5G ') == int(1.5 * 1024 ** 3)
+        assert ParseSize('0') == 0
+        for i_size in ('', 'K', '12T', 'alpha'):
+            with pytest.raises(ValueError):
+                ParseSize(i_size)
+
+
+    def testMaintenanceDirCacheGC(self, embed_data):
+        '''
+        The "dircache_gc" command of bin/maintenance.py.
+        '''
+        import imp
+
+        maintenance = imp.load_source(
+            'maintenance',
+            os.path.join(os.path.dirname(__file__), '../../../../bin/maintenance.py'),
+        )
+
+        for i_index, i_name in enumerate(('alpha', 'bravo')):
+            CreateFile(embed_data['remotes/%s/file.bin' % i_name], 'x' * 1024)
+            DirCache(
+                embed_data['remotes/%s' % i_name],
+                embed_data['local/%s' % i_name],
+                embed_data['cache_dir'],
+            ).CreateCache()
+            os.utime(embed_data['cache_dir/%s.usage' % i_name], (1000 + i_index, 1000 + i_index))
+
+        cache_dir = os.path.abspath(embed_data['cache_dir'])
+        assert maintenance.app.TestCall('maintenance dircache_gc %s 2K' % cache_dir) == (0, '')
+        assert maintenance.app.TestCall('maintenance dircache_gc %s 1k' % cache_dir) == (
+            0, '- alpha removed\n')
+        assert os.listdir(embed_data['cache_dir/bravo']) == ['file.bin']
+
+
+    def testDeduplicate(self, embed_data):
+        for i_version in ('1.0', '2.0'):
+            CreateFile(embed_data['remotes/%s/sdk/common.txt' % i_version], 'common')
+            CreateFile(embed_data['remotes/%s/sdk/version.txt' % i_version], i_version)
+        CreateFile(embed_data['remotes/other/1.0/sdk/common.txt'], 'other')
+
+        def NewDirCache(remote, deduplicate=True):
+            return DirCache(
+                embed_data['remotes/%s/sdk' % remote],
+                embed_data['local/%s' % remote],
+                embed_data['cache_dir'],
+                deduplicate=deduplicate,
+            )
+
+        dir_caches = [NewDirCache('1.0'), NewDirCache('2.0'), NewDirCache('other/1.0')]
+        for i_dir_cache in dir_caches:
+            i_dir_cache.CreateCache()
+
+        # Remotes with the same filename do not collide
+        cache_dirs = [i.CacheDir() for i in dir_caches]
+        assert len(set(cache_dirs)) == 3
+        assert all(os.path.basename(i).startswith('sdk-') for i in cache_dirs)
+        assert [GetFileContents(i + '/common.txt') for i in cache_dirs] == [
+            'common', 'common', 'other']
+        assert [GetFileContents(i + '/version.txt') for i in cache_dirs[:2]] == ['1.0', '2.0']
+
+        # Files with the same contents are stored once
+        stats = [os.stat(i + '/common.txt') for i in cache_dirs]
+        assert stats[0].st_ino == stats[1].st_ino
+        assert stats[0].st_ino != stats[2].st_ino
+        assert stats[0].st_nlink == 3  # The two caches and the objects directory
+        assert os.stat(cache_dirs[0] + '/version.txt').st_nlink == 2
+
+        # The size of shared files is split among the caches, not counting the objects directory
+        from ben10.dircache import _CacheEntry
+        entry = _CacheEntry(embed_data['cache_dir'], os.path.basename(cache_dirs[0]))
+        assert entry.GetSize() == len('1.0') + len('common') / 2
+        entry = _CacheEntry(embed_data['cache_dir'], os.path.basename(cache_dirs[2]))
+        assert entry.GetSize() == len('other')
+
+        # ... other hardlinks (e.g. in caches not deduplicated) are counted in full
+        CreateFile(embed_data['remotes/plain/plain.txt'], 'plain')
+        plain_dir_cache = DirCache(
+            embed_data['remotes/plain'], embed_data['local/plain'], embed_data['cache_dir'])
+        plain_dir_cache.CreateCache()
+        for i_name in ('plain_link1.txt', 'plain_link2.txt'):
+            os.link(plain_dir_cache.CacheDir() + '/plain.txt', embed_data[i_name])
+        entry = _CacheEntry(embed_data['cache_dir'], 'plain')
+        assert entry.GetSize() == len('plain')
+
+        # Unused objects are removed along with the caches
+        assert sorted(CollectGarbage(embed_data['cache_dir'], 0)) == sorted(
+            [os.path.basename(i) for i in cache_dirs] + ['plain'])
+        assert FindFiles(embed_data['cache_dir/.objects'], in_filters=['*.*']) == []
+
+        # Many local directories linked to the same deduplicated cache
+        local_dir_caches = [
+            DirCache(
+                embed_data['remotes/1.0/sdk'],
+                embed_data['local/%s' % i_name],
+                embed_data['cache_dir'],
+                deduplicate=True,
+            )
+            for i_name in ('local1', 'local2')
+        ]
+        for i_dir_cache in local_dir_caches:
+            i_dir_cache.CreateLocal()
+        local_dir_caches[1].DeleteLocal()
+        assert CollectGarbage(embed_data['cache_dir'], 0) == []
+        assert GetFileContents(embed_data['local/local1/version.txt']) == '1.0'
+        local_dir_caches[0].DeleteLocal()
+        assert CollectGarbage(embed_data['cache_dir'], 0) == [
+            os.path.basename(local_dir_caches[0].CacheDir())]
+
+        # Not deduplicated
+        dir_cache = NewDirCache('1.0', deduplicate=False)
+        assert os.path.basename(dir_cache.CacheDir()) == 'sdk'
+
+
+    def testRefreshCache(self, embed_data, monkeypatch):
+        from ben10.dircache import _GetRemoteValidator
+        from ben10.filesystem import CreateMD5
+        import ben10.filesystem
+
+        CreateFile(embed_data['remotes/alpha/alpha.txt'], 'alpha')
+        dir_cache = DirCache(
+            embed_data['remotes/alpha'],
+            embed_data['local/alpha'],
+            embed_data['cache_dir'],
+        )
+
+        downloads = []
+        original_download_remote = DirCache._DownloadRemote
+        def MockDownloadRemote(self, extract_dir, target_dir):
+            downloads.append(target_dir)
+            original_download_remote(self, extract_dir, target_dir)
+        monkeypatch.setattr(DirCache, '_DownloadRemote', MockDownloadRemote)
+
+        dir_cache.CreateLocal(refresh=True)
+        assert len(downloads) == 1
+        assert IsFile(embed_data['cache_dir/alpha.validator'])
+        assert dir_cache.IsCacheFresh()
+
+        # Unchanged remote: not downloaded again
+        dir_cache.CreateLocal(refresh=True)
+        dir_cache.WaitRefresh()
+        assert not dir_cache.RefreshCache()
+        assert len(downloads) == 1
+
+        # Changed remote: refreshed in the background, into a new version
+        CreateFile(embed_data['remotes/alpha/bravo.txt'], 'bravo')
+        os.utime(embed_data['remotes/alpha/bravo.txt'], (1e10, 1e10))
+        assert not dir_cache.IsCacheFresh()
+        dir_cache.CreateLocal(refresh=True)
+        dir_cache.WaitRefresh()
+        assert os.path.basename(downloads[-1]) == 'alpha.refresh.tmp'
+        assert dir_cache.IsCacheFresh()
+        assert sorted(i for i in os.listdir(embed_data['cache_dir']) if i.startswith('alpha')) == [
+            'alpha', 'alpha.lock', 'alpha.refresh.lock', 'alpha.usage', 'alpha.validator',
+            'alpha.versions']
+        assert IsLink(embed_data['cache_dir/alpha'])
+        assert ReadLink(embed_data['cache_dir/alpha']) == os.path.abspath(
+            embed_data['cache_dir/alpha.versions/2'])
+        assert IsFile(embed_data['cache_dir/alpha/bravo.txt'])
+
+        # ... the local directory keeps the old version, kept while linked
+        assert ReadLink(embed_data['local/alpha']) == os.path.abspath(
+            embed_data['cache_dir/alpha.versions/1'])
+        assert not IsFile(embed_data['local/alpha/bravo.txt'])
+        assert CollectGarbage(embed_data['cache_dir'], 1e10) == []
+        assert sorted(os.listdir(embed_data['cache_dir/alpha.versions'])) == ['1', '2']
+
+        dir_cache.CreateLocal(refresh=True)
+        assert GetFileContents(embed_data['local/alpha/bravo.txt']) == 'bravo'
+        assert CollectGarbage(embed_data['cache_dir'], 1e10) == []
+        assert os.listdir(embed_data['cache_dir/alpha.versions']) == ['2']
+
+        # ... the cache directory is never missing while replaced
+        import threading
+        missing = []
+        stop = threading.Event()
+        def CheckCacheDir():
+            while not stop.is_set():
+                if not os.path.isdir(embed_data['cache_dir/alpha']):
+                    missing.append(True)
+        thread = threading.Thread(target=CheckCacheDir)
+        thread.start()
+        try:
+            for _i in xrange(5):
+                dir_cache.CreateCache(force=True)
+        finally:
+            stop.set()
+            thread.join()
+        assert missing == []
+
+        # ... caches created before the versions become a version as well
+        dir_cache.DeleteLocal()
+        dir_cache.RefreshCache()
+        DeleteLink(embed_data['cache_dir/alpha'])
+        DeleteDirectory(embed_data['cache_dir/alpha.versions'])
+        CreateFile(embed_data['cache_dir/alpha/alpha.txt'], 'old')
+        DeleteFile(embed_data['cache_dir/alpha.validator'])
+        assert dir_cache.RefreshCache()
+        assert ReadLink(embed_data['cache_dir/alpha']) == os.path.abspath(
+            embed_data['cache_dir/alpha.versions/2'])
+        assert os.listdir(embed_data['cache_dir/alpha.versions']) == ['2']
+        assert GetFileContents(embed_data['cache_dir/alpha/alpha.txt']) == 'alpha'
+
+        # A md5 file along with the remote is preferred
+        CreateFile(embed_data['remotes/bravo.zip'], 'bravo')
+        assert _GetRemoteValidator(embed_data['remotes/bravo.zip']).startswith('stat:')
+        CreateMD5(embed_data['remotes/bravo.zip'])
+        assert _GetRemoteValidator(embed_data['remotes/bravo.zip']) == 'md5:' + GetFileContents(
+            embed_data['remotes/bravo.zip.md5'])
+        assert _GetRemoteValidator(embed_data['remotes/missing.zip']) is None
+        assert _GetRemoteValidator('http://127.0.0.1:1/alpha.zip') is None
+
+        # Only errors accessing the remote are ignored
+        def StatMany(filenames):
+            raise TypeError('StatMany')
+        monkeypatch.setattr(ben10.filesystem, 'StatMany', StatMany)
+        with pytest.raises(TypeError):
+            _GetRemoteValidator(embed_data['remotes/alpha'])
+
+
+    def testRefreshCacheHttp(self, embed_data, httpdirserver):
+        from archivist import Archivist
+        from ben10.dircache import _GetRemoteValidator
+        from ben10.filesystem import CreateMD5
+
+        def CreateRemote(contents, mtime):
+            CreateFile(embed_data['contents/alpha.txt'], contents)
+            Archivist().CreateArchive(
+                embed_data['remotes/alpha.zip'],
+                [('.', '+' + embed_data['contents/*'])],
+            )
+            os.utime(embed_data['remotes/alpha.zip'], (mtime, mtime))
+
+        CreateRemote('alpha', 1400000000)
+        remote = httpdirserver.GetUrl(embed_data['remotes/alpha.zip'])
+        dir_cache = DirCache(remote, embed_data['local/alpha'], embed_data['cache_dir'])
+
+        # Without a md5 file (404): uses Last-Modified and Content-Length
+        assert _GetRemoteValidator(remote).startswith('http:')
+        dir_cache.CreateLocal(refresh=True)
+        assert GetFileContents(embed_data['local/alpha/alpha.txt']) == 'alpha'
+        assert dir_cache.IsCacheFresh()
+
+        CreateRemote('bravo', 1400000010)
+        assert not dir_cache.IsCacheFresh()
+        dir_cache.CreateLocal(refresh=True)
+        dir_cache.WaitRefresh()
+        assert dir_cache.IsCacheFresh()
+        assert GetFileContents(embed_data['local/alpha/alpha.txt']) == 'alpha'
+        dir_cache.CreateLocal(refresh=True)
+        assert GetFileContents(embed_data['local/alpha/alpha.txt']) == 'bravo'
+
+        # With a md5 file
+        CreateMD5(embed_data['remotes/alpha.zip'])
+        assert _GetRemoteValidator(remote) == 'md5:' + GetFileContents(
+            embed_data['remotes/alpha.zip.md5'])
+
+
+
+@pytest.fixture
+def httpdirserver(request):
+    '''
+    A http-server serving the current directory (answering 404 for missing files, sending the
+    Last-Modified header), as SimpleHTTPServer.
+
+    Usage:
+        def testAlpha(httpdirserver, embed_data):
+            url = httpdirserver.GetUrl(embed_data['filename.txt'])
+    '''
+    r_httpdirserver = _HttpDirServer()
+    r_httpdirserver.Start()
+    request.addfinalizer(r_httpdirserver.Stop)
+    return r_httpdirserver
+
+
+
+class _HttpDirServer(object):
+    '''
+    Serves the current directory through http, in a thread.
+    '''
+
+    def Start(self):
+        import BaseHTTPServer
+        import SimpleHTTPServer
+        import SocketServer
+        import threading
+
+        class Handler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        class ThreadingHttpServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self._httpd = ThreadingHttpServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.start()
+
+
+    def GetUrl(self, filename):
+        '''
+        :param str filename:
+            The non-absolute filename to access.
+
+        :return str:
+            The full url for the given filename.
+        '''
+        return 'http://127.0.0.1:%d/%s' % (self._httpd.server_address[1], filename)
+
+
+    def Stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
@@ -1,10 +1,27 @@
 from archivist import Archivist
-from ben10.filesystem import (CopyDirectory, CopyFile, CreateLink, CreateTemporaryDirectory,
-    DeleteDirectory, DeleteLink, Exists, IsLink)
+from ben10.filesystem import (CopyDirectory, CopyFile, CreateDirectory, CreateFile, CreateLink,
+    CreateTemporaryDirectory, DeleteDirectory, DeleteFile, DeleteLink, Exists, FileLock,
+    FileLockTimeoutError, GetFileContents, GetFileLines, IsLink, ReadLink)
 import os
+import sys
+import threading
 
 
 
+# Remotes with these extensions are archives, extracted into the cache.
+# Zip archives are downloaded and then extracted (zipfile needs random access to the archive).
+ZIP_EXTENSIONS = ('.zip',)
+# Tar archives are extracted while downloaded.
+# xz, zst and lz4 require optional modules (.. seealso:: archivist._compression).
+TAR_EXTENSIONS = (
+    '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz', '.tar.zst', '.tzst',
+    '.tar.lz4')
+ARCHIVE_EXTENSIONS = ZIP_EXTENSIONS + TAR_EXTENSIONS
+
+# The directory (inside the base cache directory) with the files shared by deduplicated caches.
+OBJECTS_DIR = '.objects'
+
+
 #===================================================================================================
 # CacheDisabled
 #===================================================================================================
@@ -38,20 +55,46 @@ class DirCache(object):
         os.path.isdir('local')
 
     This will make the contents of remote.zip available inside the "local" directory. Behind the
-    scenes we have an indirection, where the contents are stored in the cache directory
-    c:/dircache/remote and "local" is actually a link to c:/dircache/remote.
+    scenes we have an indirection, where the contents are stored in a version directory
+    (c:/dircache/remote.versions/1), linked by the cache directory c:/dircache/remote, and "local" is
+    actually a link to that version.
 
         c:/dircache/remote.zip
-        c:/dircache/remote
+        c:/dircache/remote.versions/1
+        c:/dircache/remote [c:/dircache/remote.versions/1]
 
-        ./local [c:/dircache/remote]
+        ./local [c:/dircache/remote.versions/1]
 
     The local cache directory (c:/dircache) is handy when you have many local directories from the
     same remote resource. This is the case of a Continuous Integration slave machine, that can
     execute many jobs that requires the same resources.
+
+    The cache directory can be shared by many processes: the creation of each cache is protected by
+    a lock file (c:/dircache/remote.lock), so the remote resource is downloaded only once, by the
+    first process, while the others wait. The contents are downloaded into a temporary directory
+    which then becomes a new version, so a cache directory is never seen partially created.
+
+    The cache directory only grows: use CollectGarbage to limit its size. The last time each cache
+    was used and the local directories linked to it are recorded in a usage file
+    (c:/dircache/remote.usage) for the garbage collector.
+
+    With "deduplicate", files with the same contents (and permissions) in any of the caches are
+    stored only once, in c:/dircache/.objects (named by the hash of their contents), and hardlinked
+    into each cache directory. Many versions of a mostly identical resource then take little more
+    space than one. Since the files are shared, they must never be changed through the cache (or
+    local) directories.
+
+    The cache is not downloaded again when the remote changes, unless requested: with
+    CreateCache(refresh=True) a validator of the remote (.. seealso:: _GetRemoteValidator), stored
+    along with the cache (c:/dircache/remote.validator) when it is downloaded, is checked. If the
+    remote changed the cache is refreshed in the background, while the current contents are used.
+    The refreshed contents are a new version: the cache directory link is replaced atomically (on
+    Windows links can not be replaced, so it is missing for an instant) and the local directories
+    created from then on link to the new version. The old version is kept while any local directory
+    links to it.
     '''
 
-    def __init__(self, remote, local_dir, cache_dir=None):
+    def __init__(self, remote, local_dir, cache_dir=None, deduplicate=False):
         '''
         :param str remote:
             A remote directory or archive.
@@ -66,71 +109,262 @@ class DirCache(object):
         :param str|None cache_dir:
             A base directory to store the actual remote content.
             If None disables the cache for this instance of DirCache.
+
+        :param bool deduplicate:
+            If True, stores each file in the cache directory only once, shared by all the caches
+            (also created with deduplicate) with the same file.
+
+            The cache directory name then includes a hash of the remote, so remotes with the same
+            filename do not collide: c:/dircache/remote-1a2b3c4d.
         '''
         self.__remote = remote
         self.__local_dir = local_dir
+        self.__deduplicate = deduplicate
+        self.__refresh_thread = None
 
         self.__filename = os.path.basename(self.__remote)
+        # Only the last extension is removed from the name (as always), even for archive
+        # extensions with two dots: the caches of alpha.tar.gz are still named alpha.tar.
         self.__name = os.path.splitext(self.__filename)[0]
+        self.__extension = _SplitArchiveExtension(self.__filename)[1]
 
         if cache_dir is None:
             self.__cache_base_dir = None
             self.__cache_dir = None
         else:
             self.__cache_base_dir = os.path.abspath(cache_dir)
-            self.__cache_dir = self.__cache_base_dir + '/' + self.__name
+            if deduplicate:
+                from ben10.foundation.hash import Md5Hex
+                cache_name = '%s-%s' % (self.__name, Md5Hex(contents=self.__remote)[:8])
+            else:
+                cache_name = self.__name
+            self.__cache_dir = self.__cache_base_dir + '/' + cache_name
+            self.__lock_filename = self.__cache_dir + '.lock'
+            self.__usage_filename = self.__cache_dir + '.usage'
+            self.__validator_filename = self.__cache_dir + '.validator'
+            self.__refresh_lock_filename = self.__cache_dir + '.refresh.lock'
 
 
-    def CreateCache(self, force=False):
+    def CreateCache(self, force=False, timeout=None, refresh=False):
         '''
         Downloads the remote resource into the local cache.
         This method does not touch the local_dir.
 
         :param bool force:
             Forces the download, even if the local cache already exists.
+
+        :param float|None timeout:
+            The maximum time (in seconds) to wait for another process creating the same cache. If
+            None, waits forever.
+
+        :param bool refresh:
+            If the cache already exists, checks whether the remote changed (.. seealso::
+            IsCacheFresh) and, if so, refreshes the cache in a background thread (.. seealso::
+            RefreshCache), returning immediately. Use WaitRefresh to wait for it.
+
+        :raises FileLockTimeoutError:
+            If the timeout expires.
         '''
         if self.CacheExists() and not force:
+            _TouchUsage(self.__usage_filename)
+            if refresh and not self.IsCacheFresh():
+                self.__refresh_thread = threading.Thread(target=self.RefreshCache)
+                self.__refresh_thread.start()
             return
-        if Exists(self.__cache_dir):
-            DeleteDirectory(self.__cache_dir)
 
-        self._DownloadRemote(self.__cache_base_dir, self.__cache_dir)
+        with FileLock(self.__lock_filename, timeout=timeout):
+            _TouchUsage(self.__usage_filename)
+
+            # Another process may have created the cache while we waited for the lock.
+            if self.CacheExists() and not force:
+                return
+
+            # Obtained before downloading: changes made meanwhile are noticed by the next check.
+            validator = _GetRemoteValidator(self.__remote)
+            temp_dir = self.__cache_dir + '.tmp'
+            self._DownloadInto(temp_dir)
+            self._ReplaceCache(temp_dir, validator)
+
+
+    def IsCacheFresh(self):
+        '''
+        Checks whether the remote changed since the cache was downloaded, comparing the validator
+        of the remote (.. seealso:: _GetRemoteValidator) with the one stored along with the cache.
+        Does not download the remote.
+
+        :rtype: bool
+        :returns:
+            False if the remote changed, or if the cache does not exist or has no stored validator.
+            True if the remote did not change or can not be validated (e.g. the server is not
+            reachable): the cache is kept.
+        '''
+        return self._MatchesValidator(_GetRemoteValidator(self.__remote))
+
+
+    def RefreshCache(self):
+        '''
+        Downloads the remote again if it changed since the cache was downloaded (.. seealso::
+        IsCacheFresh).
+
+        The contents are downloaded into a new directory, without holding the cache lock, so other
+        processes keep using the current contents meanwhile. Then the new directory becomes the
+        current version of the cache (.. seealso:: _ReplaceCache): the local directories already
+        linked keep the old contents, never seeing a partial download.
+
+        Only one process refreshes a cache at a time: if another process is already refreshing it,
+        returns immediately.
+
+        :rtype: bool
+        :returns:
+            True if the cache was refreshed.
+        '''
+        try:
+            with FileLock(self.__refresh_lock_filename, timeout=0):
+                validator = _GetRemoteValidator(self.__remote)
+                if self._MatchesValidator(validator):
+                    return False  # Unchanged or refreshed by another process
+                temp_dir = self.__cache_dir + '.refresh.tmp'
+                self._DownloadInto(temp_dir)
+                with FileLock(self.__lock_filename):
+                    self._ReplaceCache(temp_dir, validator)
+                return True
+        except FileLockTimeoutError:
+            return False
+
+
+    def WaitRefresh(self):
+        '''
+        Waits for the background refresh started by CreateCache (refresh=True), if any.
+        '''
+        if self.__refresh_thread is not None:
+            self.__refresh_thread.join()
+            self.__refresh_thread = None
+
+
+    def _MatchesValidator(self, validator):
+        '''
+        :param str|None validator:
+            The current validator of the remote.
+
+        :rtype: bool
+        :returns:
+            Whether the cache matches the given validator (.. seealso:: IsCacheFresh).
+        '''
+        if not self.CacheExists():
+            return False
+        if validator is None:
+            return True
+        if not os.path.isfile(self.__validator_filename):
+            return False
+        return GetFileContents(self.__validator_filename) == validator
+
+
+    def _DownloadInto(self, temp_dir):
+        '''
+        Downloads the remote resource into the given temporary directory, to replace the cache
+        directory (.. seealso:: _ReplaceCache).
+        '''
+        if Exists(temp_dir):
+            DeleteDirectory(temp_dir)  # Left by a process that died while downloading
+
+        if self.__deduplicate:
+            # The archive is not kept: its name could collide with other remotes.
+            with CreateTemporaryDirectory() as extract_dir:
+                self._DownloadRemote(extract_dir, temp_dir)
+            _DeduplicateFiles(temp_dir, os.path.join(self.__cache_base_dir, OBJECTS_DIR))
+        else:
+            self._DownloadRemote(self.__cache_base_dir, temp_dir)
+
+
+    def _ReplaceCache(self, temp_dir, validator):
+        '''
+        Makes the downloaded directory the current version of the cache, storing its validator.
+        Must be called with the cache lock acquired.
+
+        The previous versions are removed, unless linked by a local directory (removed later, by
+        CollectGarbage, once no longer linked).
+
+        :param str temp_dir:
+            The downloaded contents (.. seealso:: _DownloadInto).
+
+        :param str|None validator:
+            The validator of the remote when the download started.
+        '''
+        if os.path.isfile(self.__validator_filename):
+            DeleteFile(self.__validator_filename)  # Never paired with other contents
+
+        entry = self._GetCacheEntry()
+        entry.AddVersion(temp_dir)
+        entry.RemoveOldVersions()
+
+        if validator is not None:
+            CreateFile(self.__validator_filename, validator, atomic=True)
 
 
     def _DownloadRemote(self, extract_dir, target_dir):
         '''
         Internal method that actually downloads the remote resource. Handles archive remotes.
 
+        Tar archives are extracted as they are downloaded (streamed from the server into tarfile),
+        without a local copy of the archive, so it takes about as long as the slowest of the
+        download and the extraction, instead of both.
+
         :param str extract_dir:
             A temporary directory where to extract archive remote resources.
-            Only used if the remote resource is an archive.
+            Only used if the remote resource is a zip archive.
         :param str target_dir:
             The final destination of the remote resource.
         '''
-        if os.path.splitext(self.__filename)[1] in ('.zip', '.tbz2'):
+        if self.__extension in ZIP_EXTENSIONS:
             local_archive_filename = extract_dir + '/' + self.__filename
             CopyFile(self.__remote, local_archive_filename)
             archivist = Archivist()
             archivist.ExtractArchive(local_archive_filename, target_dir)
+        elif self.__extension in TAR_EXTENSIONS:
+            archivist = Archivist()
+            archivist.ExtractTar(self.__remote, target_dir)  # Detects the compression
         else:
             CopyDirectory(self.__remote, target_dir)
 
 
-    def CreateLocal(self):
+    def CreateLocal(self, refresh=False):
         '''
         Makes a remote resource locally available, downloading it if necessary.
+
+        :param bool refresh:
+            .. seealso:: CreateCache
         '''
         self.DeleteLocal()
         if self.IsCacheEnabled():
-            self.CreateCache()
-            self._CreateLocal()
+            while True:
+                self.CreateCache(refresh=refresh)
+                with FileLock(self.__lock_filename):
+                    # The garbage collector may have removed the cache meanwhile: download again.
+                    if self.CacheExists():
+                        self._CreateLocal()
+                        break
         else:
             with CreateTemporaryDirectory() as tmp_dir:
                 self._DownloadRemote(tmp_dir, self.__local_dir)
 
 
     def _CreateLocal(self):
-        CreateLink(self.__cache_dir, self.__local_dir)
+        entry = self._GetCacheEntry()
+        CreateLink(entry.GetCurrentVersionDir(), self.__local_dir)
+
+        # Record the link, so the garbage collector keeps the cache (and version) while it is used.
+        local_dirs = entry.GetLinkedLocalDirs()
+        local_dir = os.path.abspath(self.__local_dir)
+        if local_dir not in local_dirs:
+            local_dirs.append(local_dir)
+        CreateFile(self.__usage_filename, '\n'.join(local_dirs), atomic=True)
+
+
+    def _GetCacheEntry(self):
+        '''
+        :rtype: _CacheEntry
+        '''
+        return _CacheEntry(self.__cache_base_dir, os.path.basename(self.__cache_dir))
 
 
     def DeleteLocal(self):
@@ -161,7 +395,8 @@ class DirCache(object):
 
     def GetName(self):
         '''
-        Returns the name, as defined by the remote resource.
+        Returns the name, as defined by the remote resource: its filename without the last
+        extension (e.g. "alpha" for alpha.zip, "alpha.tar" for alpha.tar.gz).
 
         :returns str:
         '''
@@ -237,3 +472,495 @@ class DirCache(object):
         if not self.IsCacheEnabled():
             raise CacheDisabled()
         return Exists(self.__cache_dir)
+
+
+
+#===================================================================================================
+# CollectGarbage
+#===================================================================================================
+def CollectGarbage(cache_base_dir, max_size):
+    '''
+    Removes the least recently used caches from a cache directory until its size is, at most,
+    max_size.
+
+    Caches linked by an existing local directory (.. seealso:: DirCache.CreateLocal) are never
+    removed, nor the ones being created or linked by another process at the time.
+
+    The old versions of the caches (.. seealso:: DirCache.RefreshCache) no longer linked by any
+    local directory are always removed.
+
+    The size of a file shared by deduplicated caches is split among them.
+
+    :param str cache_base_dir:
+        The base cache directory, as given to DirCache.
+
+    :param int max_size:
+        The maximum size (in bytes) of the cache directory.
+
+    :rtype: list(str)
+    :returns:
+        The names of the removed caches, least recently used first.
+    '''
+    entries = _ListCacheEntries(cache_base_dir)
+
+    removed_versions = False
+    for i_entry in entries:
+        try:
+            with FileLock(i_entry.lock_filename, timeout=0):
+                removed_versions = i_entry.RemoveOldVersions() or removed_versions
+        except FileLockTimeoutError:
+            pass  # Being used by another process
+
+    object_inodes = _GetObjectInodes(os.path.join(cache_base_dir, OBJECTS_DIR))
+    total_size = sum(i.GetSize(object_inodes) for i in entries)
+
+    removed = []
+    for i_entry in sorted(entries, key=lambda x: x.GetLastAccess()):
+        if total_size <= max_size:
+            break
+        if i_entry.Remove():
+            total_size -= i_entry.GetSize(object_inodes)
+            removed.append(i_entry.name)
+
+    if removed or removed_versions:
+        _RemoveUnusedObjects(os.path.join(cache_base_dir, OBJECTS_DIR))
+    return removed
+
+
+
+#===================================================================================================
+# ParseSize
+#===================================================================================================
+def ParseSize(size):
+    '''
+    Parses a size given by the user (e.g. the max_size of CollectGarbage in a command line).
+
+    :param str size:
+        A number of bytes, optionally followed by one of the suffixes K, M or G (case insensitive,
+        powers of 1024): "1000", "512K", "1.5G".
+
+    :rtype: int
+    :returns:
+        The size, in bytes.
+
+    :raises ValueError:
+        If the size is not valid.
+    '''
+    multipliers = {'K' : 1024, 'M' : 1024 ** 2, 'G' : 1024 ** 3}
+    size = size.strip().upper()
+    if size[-1:] in multipliers:
+        return int(float(size[:-1]) * multipliers[size[-1]])
+    return int(size)
+
+
+
+def _SplitArchiveExtension(filename):
+    '''
+    Same as os.path.splitext, but handles archive extensions with two dots (.tar.gz).
+
+    :rtype: tuple(str,str)
+    '''
+    for i_extension in ARCHIVE_EXTENSIONS:
+        if filename.endswith(i_extension):
+            return filename[:-len(i_extension)], i_extension
+    return os.path.splitext(filename)
+
+
+
+def _DeduplicateFiles(directory, objects_dir):
+    '''
+    Replaces the files in the directory by hardlinks to the files with the same contents (and
+    permissions) in the objects directory. Files not found there are added to it.
+
+    :param str directory:
+    :param str objects_dir:
+    '''
+    import stat
+    from ben10.foundation.hash import Md5Hex
+
+    for i_dirpath, _dirnames, i_filenames in os.walk(directory):
+        for i_filename in i_filenames:
+            i_path = os.path.join(i_dirpath, i_filename)
+            if os.path.islink(i_path):
+                continue
+
+            i_hash = Md5Hex(filename=i_path)
+            i_mode = stat.S_IMODE(os.stat(i_path).st_mode)
+            i_object = os.path.join(objects_dir, i_hash[:2], '%s.%o' % (i_hash[2:], i_mode))
+
+            # Link the object next to the file and replace the file, so the file is never missing
+            # (even if the object is removed meanwhile by the garbage collector).
+            i_temp_path = i_path + '.link'
+            try:
+                _CreateHardLink(i_object, i_temp_path)
+            except OSError:
+                # Not in the objects yet: add this file.
+                if not os.path.isdir(os.path.dirname(i_object)):
+                    CreateDirectory(os.path.dirname(i_object))
+                try:
+                    _CreateHardLink(i_path, i_object)
+                except OSError:
+                    pass  # Added by another process meanwhile: keep this file unshared.
+                continue
+
+            if sys.platform == 'win32':
+                os.remove(i_path)  # os.rename does not replace files on Windows
+            os.rename(i_temp_path, i_path)
+
+
+
+def _GetObjectInodes(objects_dir):
+    '''
+    :rtype: set(tuple(int,int))
+    :returns:
+        The (st_dev, st_ino) of the files in the objects directory.
+    '''
+    result = set()
+    for i_dirpath, _dirnames, i_filenames in os.walk(objects_dir):
+        for i_filename in i_filenames:
+            i_stat = os.stat(os.path.join(i_dirpath, i_filename))
+            result.add((i_stat.st_dev, i_stat.st_ino))
+    return result
+
+
+
+def _RemoveUnusedObjects(objects_dir):
+    '''
+    Removes the files in the objects directory that are no longer linked by any cache.
+    '''
+    for i_dirpath, _dirnames, i_filenames in os.walk(objects_dir):
+        for i_filename in i_filenames:
+            i_path = os.path.join(i_dirpath, i_filename)
+            if os.stat(i_path).st_nlink == 1:
+                os.remove(i_path)
+
+
+
+def _CreateHardLink(source, link):
+    '''
+    Creates a hardlink ("link") to the given file ("source").
+
+    :raises OSError:
+        If the link could not be created (e.g. the source is missing or the link exists).
+    '''
+    if sys.platform == 'win32':
+        import pywintypes
+        import win32file
+        try:
+            win32file.CreateHardLink(link, source)
+        except pywintypes.error, e:
+            raise OSError(e.winerror, e.strerror)
+    else:
+        os.link(source, link)
+
+
+
+def _GetRemoteValidator(remote):
+    '''
+    Obtains a value that changes whenever the remote changes, without downloading it:
+        - The contents of the remote md5 file (remote + '.md5'), if any (.. seealso::
+          ben10.filesystem.CreateMD5);
+        - For http remotes, the ETag header, or the Last-Modified and Content-Length headers;
+        - For other remotes, the size and mtime. For local directories, the newest mtime of their
+          files (.. seealso:: GetMTime); for ftp directories, their own mtime, which only changes
+          when entries are added or removed.
+
+    :param str remote:
+
+    :rtype: str|None
+    :returns:
+        The validator, or None if the remote can not be validated.
+    '''
+    from ben10.filesystem import FileNotFoundError, GetMTime, PATH_TYPE_DIR, StatMany
+    import urllib2
+    import urlparse
+
+    # The validator only avoids downloads: an unreachable remote is not an error here (the
+    # download reports it), but other errors are.
+    try:
+        scheme = urlparse.urlparse(remote).scheme
+        if scheme in ('http', 'https'):
+            return _GetHttpValidator(remote)
+
+        try:
+            return 'md5:' + GetFileContents(remote + '.md5').strip()
+        except FileNotFoundError:
+            pass
+
+        stat_record = StatMany([remote])[0]
+        if stat_record.type is None:
+            return None
+        if stat_record.type == PATH_TYPE_DIR and len(scheme) < 2:
+            return 'stat:%r' % GetMTime(remote)
+        return 'stat:%s %r' % (stat_record.size, stat_record.mtime)
+    except (IOError, OSError, urllib2.URLError, FileNotFoundError):
+        return None
+
+
+
+def _GetHttpValidator(remote):
+    '''
+    .. seealso:: _GetRemoteValidator
+
+    Uses urllib2, checking the status of the responses: a missing md5 file (404) is not an error
+    (unlike GetFileContents, which for http uses urllib and would return the error page).
+
+    :param str remote:
+        A http url.
+
+    :rtype: str|None
+    '''
+    import urllib2
+
+    try:
+        response = urllib2.urlopen(remote + '.md5')
+    except urllib2.HTTPError, e:
+        e.close()
+        if e.code != 404:
+            raise
+    else:
+        try:
+            return 'md5:' + response.read().strip()
+        finally:
+            response.close()
+
+    request = urllib2.Request(remote)
+    request.get_method = lambda: 'HEAD'
+    response = urllib2.urlopen(request)
+    try:
+        headers = response.info()
+    finally:
+        response.close()
+    if headers.get('ETag') is not None:
+        return 'etag:' + headers['ETag']
+    if headers.get('Last-Modified') is None:
+        return None
+    return 'http:%s %s' % (headers['Last-Modified'], headers.get('Content-Length'))
+
+
+
+def _TouchUsage(usage_filename):
+    '''
+    Records the current time as the last access of a cache (the mtime of its usage file).
+    '''
+    open(usage_filename, 'ab').close()  # Creates the file if missing, without changing it
+    os.utime(usage_filename, None)
+
+
+
+def _ListCacheEntries(cache_base_dir):
+    '''
+    :rtype: list(_CacheEntry)
+    :returns:
+        The caches in the given base directory.
+    '''
+    if not os.path.isdir(cache_base_dir):
+        return []
+
+    result = []
+    for i_name in sorted(os.listdir(cache_base_dir)):
+        if i_name == OBJECTS_DIR or os.path.splitext(i_name)[1] in ('.tmp', '.versions'):
+            continue
+        if os.path.isdir(os.path.join(cache_base_dir, i_name)):
+            result.append(_CacheEntry(cache_base_dir, i_name))
+    return result
+
+
+#===================================================================================================
+# _CacheEntry
+#===================================================================================================
+class _CacheEntry(object):
+    '''
+    A cache in the cache base directory, along with its files:
+        <name>: The cache directory, a link to the current version
+        <name>.versions/<number>: The versions of the cache contents (the current one and the old
+            ones still linked by local directories)
+        <name>.zip: The remote archive (if the remote is an archive), for each ARCHIVE_EXTENSIONS
+        <name>.usage: The local directories linked to the cache. Its mtime is the last access.
+        <name>.validator: The validator of the remote (.. seealso:: _GetRemoteValidator).
+        <name>.lock, <name>.refresh.lock: The lock files (never removed .. seealso:: FileLock).
+    '''
+
+    def __init__(self, cache_base_dir, name):
+        self.name = name
+        self.cache_dir = os.path.join(cache_base_dir, name)
+        self.versions_dir = self.cache_dir + '.versions'
+        self.lock_filename = self.cache_dir + '.lock'
+        self.usage_filename = self.cache_dir + '.usage'
+        self.validator_filename = self.cache_dir + '.validator'
+        self.archive_filenames = [self.cache_dir + i for i in ARCHIVE_EXTENSIONS]
+        self._size = None
+
+
+    def GetLastAccess(self):
+        '''
+        :rtype: float
+        :returns:
+            The last time the cache was used (created, linked or requested).
+        '''
+        if os.path.isfile(self.usage_filename):
+            return os.path.getmtime(self.usage_filename)
+        return os.path.getmtime(self.cache_dir)  # Created before the usage was recorded
+
+
+    def GetSize(self, object_inodes=None):
+        '''
+        :param set(tuple(int,int))|None object_inodes:
+            The inodes of the files in the objects directory (.. seealso:: _GetObjectInodes). If
+            None, obtained from the objects directory next to the cache.
+
+        :rtype: int
+        :returns:
+            The total size of the cache files, in bytes.
+        '''
+        if self._size is None:
+            if object_inodes is None:
+                object_inodes = _GetObjectInodes(
+                    os.path.join(os.path.dirname(self.cache_dir), OBJECTS_DIR))
+            size = sum(os.path.getsize(i) for i in self.archive_filenames if os.path.isfile(i))
+            directories = [self.versions_dir]
+            if not IsLink(self.cache_dir):
+                directories.append(self.cache_dir)  # Created before the versions
+            for i_directory in directories:
+                for i_dirpath, _dirnames, i_filenames in os.walk(i_directory):
+                    for i_filename in i_filenames:
+                        i_path = os.path.join(i_dirpath, i_filename)
+                        if not os.path.islink(i_path):
+                            i_stat = os.stat(i_path)
+                            if (i_stat.st_dev, i_stat.st_ino) in object_inodes:
+                                # Deduplicated file: split the size among the caches linking to it
+                                # (one of the links is in the objects directory). Other hardlinks
+                                # are not shared by caches: counted in full.
+                                size += i_stat.st_size / (i_stat.st_nlink - 1)
+                            else:
+                                size += i_stat.st_size
+            self._size = size
+        return self._size
+
+
+    def GetCurrentVersionDir(self):
+        '''
+        :rtype: str
+        :returns:
+            The directory with the current contents of the cache (the cache directory itself if
+            created before the versions).
+        '''
+        if IsLink(self.cache_dir):
+            return ReadLink(self.cache_dir)
+        return self.cache_dir
+
+
+    def AddVersion(self, directory):
+        '''
+        Moves the given directory into the versions directory, making it the current version.
+        Must be called with the cache lock acquired.
+
+        The cache directory link is replaced by renaming a new link over it, so it always exists
+        (except on Windows, where renames do not replace files).
+
+        :param str directory:
+        '''
+        if not os.path.isdir(self.versions_dir):
+            CreateDirectory(self.versions_dir)
+        if Exists(self.cache_dir) and not IsLink(self.cache_dir):
+            # Created before the versions: becomes an old version.
+            os.rename(self.cache_dir, self._GetNewVersionDir())
+
+        version_dir = self._GetNewVersionDir()
+        os.rename(directory, version_dir)
+
+        temp_link = self.cache_dir + '.link.tmp'
+        CreateLink(version_dir, temp_link)  # Overrides a link left by a process that died
+        if sys.platform == 'win32' and IsLink(self.cache_dir):
+            DeleteLink(self.cache_dir)
+        os.rename(temp_link, self.cache_dir)
+
+
+    def RemoveOldVersions(self):
+        '''
+        Removes the versions other than the current one that are not linked by local directories.
+        Must be called with the cache lock acquired.
+
+        :rtype: bool
+        :returns:
+            True if any version was removed.
+        '''
+        if not os.path.isdir(self.versions_dir):
+            return False
+
+        used_dirs = [self.GetCurrentVersionDir()]
+        used_dirs += [ReadLink(i) for i in self.GetLinkedLocalDirs()]
+
+        result = False
+        for i_name in os.listdir(self.versions_dir):
+            i_version_dir = os.path.join(self.versions_dir, i_name)
+            if not any(_IsSamePath(i_version_dir, j) for j in used_dirs):
+                DeleteDirectory(i_version_dir)
+                result = True
+        return result
+
+
+    def _GetNewVersionDir(self):
+        '''
+        :rtype: str
+        :returns:
+            A directory for a new version, numbered after the existing ones.
+        '''
+        numbers = [int(i) for i in os.listdir(self.versions_dir) if i.isdigit()]
+        return os.path.join(self.versions_dir, str(max(numbers + [0]) + 1))
+
+
+    def GetLinkedLocalDirs(self):
+        '''
+        :rtype: list(str)
+        :returns:
+            The local directories recorded in the usage file that are still links to the cache (or
+            any of its versions).
+        '''
+        if not os.path.isfile(self.usage_filename):
+            return []
+
+        def IsLinkedToCache(local_dir):
+            try:
+                if not IsLink(local_dir):
+                    return False
+                target = ReadLink(local_dir)
+                return _IsSamePath(target, self.cache_dir) or \
+                    _IsSamePath(os.path.dirname(target), self.versions_dir)
+            except (IOError, OSError):
+                return False
+
+        return [i for i in GetFileLines(self.usage_filename) if i and IsLinkedToCache(i)]
+
+
+    def Remove(self):
+        '''
+        Removes the cache files, unless the cache is linked or is being used by another process.
+
+        :rtype: bool
+        :returns:
+            True if the cache was removed.
+        '''
+        try:
+            with FileLock(self.lock_filename, timeout=0):
+                if self.GetLinkedLocalDirs():
+                    return False
+                if IsLink(self.cache_dir):
+                    DeleteLink(self.cache_dir)
+                elif Exists(self.cache_dir):
+                    DeleteDirectory(self.cache_dir)
+                if os.path.isdir(self.versions_dir):
+                    DeleteDirectory(self.versions_dir)
+                metadata_filenames = [self.usage_filename, self.validator_filename]
+                for i_filename in self.archive_filenames + metadata_filenames:
+                    if os.path.isfile(i_filename):
+                        DeleteFile(i_filename)
+                return True
+        except FileLockTimeoutError:
+            return False
+
+
+
+def _IsSamePath(path1, path2):
+    normalize = lambda x: os.path.normcase(os.path.abspath(x))
+    return normalize(path1) == normalize(path2)
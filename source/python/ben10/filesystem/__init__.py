@@ -1,4 +1,9 @@
-from _duplicates import CheckForUpdate, ExtendedPathMask, FindFiles, MatchMasks
+from _duplicates import (CheckForUpdate, ExtendedPathMask, FindFiles, IterFindFiles, MatchMasks,
+    ParallelFindFiles)
 from _filesystem import *
+from _filesystem_async import AsyncFilesystem
+from _filesystem_cache import FilesystemCache
 from _filesystem_exceptions import *
+from _filesystem_http_cache import HttpCache
+from _filesystem_lock import FileLock
 from _fileutils import OpenReadOnlyFile
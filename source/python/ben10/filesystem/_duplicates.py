@@ -3,6 +3,14 @@ Duplicates methods from coilib50 that should be moved to filesystem.
 '''
 import os
 
+try:
+    from os import scandir as _scandir  # Python 3.5+
+except ImportError:
+    try:
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
+
 
 
 #===================================================================================================
@@ -102,14 +110,43 @@ def MatchMasks(filename, filters):
     :param filters:
     :rtype: True if the filename has matched with one pattern, False otherwise.
     '''
-    import fnmatch
     if not isinstance(filters, (list, tuple)):
         filters = [filters]
 
-    for i_filter in filters:
-        if fnmatch.fnmatch(filename, i_filter):
-            return True
-    return False
+    return _CompileMasks(filters)(filename)
+
+
+
+_compiled_masks = {}
+
+def _CompileMasks(filters):
+    '''
+    Compiles the given patterns (as used by fnmatch) into a single regular expression.
+
+    :param list(str) filters:
+        The patterns to match.
+
+    :rtype: callable(str)
+    :returns:
+        A function that receives a filename and returns True if it matches any of the patterns.
+        The filename case is normalized the same way fnmatch.fnmatch does.
+    '''
+    key = tuple(filters)
+    result = _compiled_masks.get(key)
+    if result is None:
+        if not key:
+            result = lambda filename: False
+        else:
+            import fnmatch
+            import re
+            regex = re.compile('|'.join(fnmatch.translate(os.path.normcase(i)) for i in key))
+            normcase = os.path.normcase
+            result = lambda filename: regex.match(normcase(filename)) is not None
+
+        if len(_compiled_masks) > 100:
+            _compiled_masks.clear()
+        _compiled_masks[key] = result
+    return result
 
 
 
@@ -133,38 +170,331 @@ def FindFiles(dir_, in_filters=None, out_filters=None, recursive=True, include_r
     :type standard_paths: if True, always uses unix path separators "/"
     :param standard_paths:
     :rtype: a list of strings with the files that matched (with the full path in the filesystem).
+
+    .. seealso:: IterFindFiles for a lazy version of this function.
+    '''
+    return list(IterFindFiles(dir_, in_filters, out_filters, recursive, include_root_dir, standard_paths))
+
+
+
+#===================================================================================================
+# IterFindFiles
+#===================================================================================================
+def IterFindFiles(
+        dir_,
+        in_filters=None,
+        out_filters=None,
+        recursive=True,
+        include_root_dir=True,
+        standard_paths=False,
+        yield_entries=False,
+    ):
+    '''
+    Lazy version of FindFiles: yields the files as the directories are listed, in the same order as
+    FindFiles returns them.
+
+    The in/out filters are compiled once into a single regular expression and the directories are
+    listed using scandir (when available), which obtains the type of each entry without an extra
+    stat call on most platforms.
+
+    :param dir_:
+    :param in_filters:
+    :param out_filters:
+    :param recursive:
+    :param include_root_dir:
+    :param standard_paths:
+        .. seealso:: FindFiles
+
+    :param bool yield_entries:
+        If True, yields tuples (filename, entry) instead of filenames, where entry has the same
+        interface of os.DirEntry (name, path, is_dir(), is_file(), is_symlink() and stat()). Use it
+        to avoid stat-ing the files again: is_dir() and stat() results are cached in the entry.
+
+    :rtype: iterator(str) | iterator(tuple(str,DirEntry))
+    '''
+    match_in, match_out = _CompileFindFilters(in_filters, out_filters)
+    format_result = _FindFilesFormatter(dir_, include_root_dir, standard_paths, yield_entries)
+
+    directories = [dir_]
+    while directories:
+        matched, sub_directories = _ScanDirectory(directories.pop(), match_in, match_out)
+
+        for i_entry in matched:
+            yield format_result(i_entry)
+
+        if recursive:
+            directories.extend(reversed(sub_directories))
+
+
+
+#===================================================================================================
+# ParallelFindFiles
+#===================================================================================================
+def ParallelFindFiles(
+        dir_,
+        in_filters=None,
+        out_filters=None,
+        recursive=True,
+        include_root_dir=True,
+        standard_paths=False,
+        yield_entries=False,
+        workers=8,
+        ordered=True,
+        max_depth=None,
+    ):
     '''
-    # all files
-    if in_filters is None:
-        in_filters = ['*']
+    Version of IterFindFiles that lists the directories in parallel, using a pool of threads.
+
+    Listing a directory is mostly waiting for the (network) filesystem, so this is much faster than
+    IterFindFiles for large trees in network shares or slow disks.
 
-    if out_filters is None:
-        out_filters = []
+    :param dir_:
+    :param in_filters:
+    :param out_filters:
+    :param recursive:
+    :param include_root_dir:
+    :param standard_paths:
+    :param yield_entries:
+        .. seealso:: IterFindFiles
 
-    result = []
+    :param int workers:
+        Number of threads listing directories.
 
-    # maintain just files that don't have a pattern that match with out_filters
-    # walk through all directories based on dir
-    for dir_root, directories, filenames in os.walk(dir_):
+    :param bool ordered:
+        If True, yields the files in the same order as FindFiles. Otherwise, yields the files of
+        each directory as soon as it is listed, which uses less memory when the consumer of the
+        results is slower than the listing.
 
-        for i_directory in directories[:]:
-            if MatchMasks(i_directory, out_filters):
-                directories.remove(i_directory)
+    :param int|None max_depth:
+        The maximum depth of sub-directories to search: 0 searches only dir_ (same as
+        recursive=False), 1 searches dir_ and its sub-directories, etc. None means no limit.
 
-        for filename in directories + filenames:
-            if MatchMasks(filename, in_filters) and not MatchMasks(filename, out_filters):
-                result.append(os.path.join(dir_root, filename))
+    :rtype: iterator(str) | iterator(tuple(str,DirEntry))
+    '''
+    from multiprocessing.pool import ThreadPool
+
+    match_in, match_out = _CompileFindFilters(in_filters, out_filters)
+    format_result = _FindFilesFormatter(dir_, include_root_dir, standard_paths, yield_entries)
+    if not recursive:
+        max_depth = 0
+
+    def Scan(directory):
+        return _ScanDirectory(directory, match_in, match_out)
+
+    pool = ThreadPool(workers)
+    try:
+        if ordered:
+            # Depth-first, as IterFindFiles, but all the sub-directories found are submitted to the
+            # pool at once so they are listed while the results of the current one are consumed.
+            directories = [(pool.apply_async(Scan, (dir_,)), 0)]
+            while directories:
+                async_result, depth = directories.pop()
+                matched, sub_directories = async_result.get()
+
+                if max_depth is None or depth < max_depth:
+                    directories.extend(reversed([
+                        (pool.apply_async(Scan, (i,)), depth + 1) for i in sub_directories
+                    ]))
+
+                for i_entry in matched:
+                    yield format_result(i_entry)
+
+        else:
+            import Queue
+            import sys
+            results = Queue.Queue()
+
+            def ScanAndNotify(directory, depth):
+                try:
+                    results.put((Scan(directory), depth, None))
+                except:
+                    results.put((None, depth, sys.exc_info()))
+
+            pool.apply_async(ScanAndNotify, (dir_, 0))
+            pending = 1
+            while pending:
+                scan_result, depth, exc_info = results.get()
+                pending -= 1
+                if exc_info is not None:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+
+                matched, sub_directories = scan_result
+                if max_depth is None or depth < max_depth:
+                    for i_directory in sub_directories:
+                        pool.apply_async(ScanAndNotify, (i_directory, depth + 1))
+                        pending += 1
+
+                for i_entry in matched:
+                    yield format_result(i_entry)
+    finally:
+        pool.terminate()
+
+
+
+def _CompileFindFilters(in_filters, out_filters):
+    '''
+    :rtype: tuple(callable(str),callable(str))
+    :returns:
+        The functions matching the in and out filters as used in FindFiles.
+    '''
+    match_in = _CompileMasks(['*'] if in_filters is None else in_filters)
+    match_out = _CompileMasks(out_filters or [])
+    return match_in, match_out
 
-        if not recursive:
-            break
 
-    if not include_root_dir:
-        # Remove root dir from all paths
-        dir_prefix = len(dir_) + 1
-        result = [file[dir_prefix:] for file in result]
 
+def _FindFilesFormatter(dir_, include_root_dir, standard_paths, yield_entries):
+    '''
+    :rtype: callable(DirEntry)
+    :returns:
+        A function that converts an entry into the result of FindFiles, according to the given
+        options.
+    '''
+    dir_prefix = len(dir_) + 1
     if standard_paths:
         from ben10.filesystem import StandardizePath
-        result = map(StandardizePath, result)
 
-    return result
+    def FormatResult(entry):
+        filename = entry.path
+        if not include_root_dir:
+            filename = filename[dir_prefix:]
+        if standard_paths:
+            filename = StandardizePath(filename)
+
+        if yield_entries:
+            return filename, entry
+        return filename
+
+    return FormatResult
+
+
+
+def _ScanDirectory(directory, match_in, match_out):
+    '''
+    Lists a directory, filtering its entries as in FindFiles.
+
+    :param str directory:
+
+    :param callable(str) match_in:
+    :param callable(str) match_out:
+        .. seealso:: _CompileFindFilters
+
+    :rtype: tuple(list(DirEntry),list(str))
+    :returns:
+        The entries matching the filters (sub-directories first, as in os.walk) and the
+        sub-directories to search.
+    '''
+    sub_directories = []
+    filenames = []
+    for i_entry in _ListDirEntries(directory):
+        if i_entry.is_dir():
+            if match_out(i_entry.name):
+                continue
+            sub_directories.append(i_entry)
+        else:
+            filenames.append(i_entry)
+
+    matched = [
+        i_entry
+        for i_entry in sub_directories + filenames
+        if match_in(i_entry.name) and not match_out(i_entry.name)
+    ]
+
+    # Like os.walk, do not follow links to directories.
+    return matched, [i_entry.path for i_entry in sub_directories if not i_entry.is_symlink()]
+
+
+
+#===================================================================================================
+# _ListDirEntries
+#===================================================================================================
+def _ListDirEntries(directory):
+    '''
+    Lists the entries in a directory.
+
+    :param str directory:
+
+    :rtype: list(DirEntry)
+    :returns:
+        The entries, using os.DirEntry (or scandir.DirEntry) when available.
+        Returns an empty list if the directory can't be listed (like os.walk).
+
+    .. seealso:: FilesystemCache
+        The entries come from the active cache, if any.
+    '''
+    from ._filesystem_cache import GetActiveCache
+    cache = GetActiveCache(directory)
+    if cache is not None:
+        return cache.ListDirEntries(directory)
+    return _ReadDirEntries(directory)
+
+
+
+def _ReadDirEntries(directory):
+    '''
+    .. seealso:: _ListDirEntries
+        The same, but always reading the entries from the filesystem.
+    '''
+    try:
+        if _scandir is not None:
+            return list(_scandir(directory))
+        return [_DirEntry(directory, i) for i in os.listdir(directory)]
+    except OSError:
+        return []
+
+
+
+#===================================================================================================
+# _DirEntry
+#===================================================================================================
+class _DirEntry(object):
+    '''
+    A replacement for os.DirEntry used when scandir is not available.
+    '''
+
+    __slots__ = 'name path _stat _lstat'.split()
+
+    def __init__(self, directory, name):
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self._stat = None
+        self._lstat = None
+
+
+    def stat(self, follow_symlinks=True):
+        if not follow_symlinks:
+            if self._lstat is None:
+                self._lstat = os.lstat(self.path)
+            return self._lstat
+
+        if self._stat is None:
+            try:
+                self._stat = os.stat(self.path)
+            except OSError:
+                # Broken link: behaves as the link itself.
+                self._stat = self.stat(follow_symlinks=False)
+        return self._stat
+
+
+    def is_dir(self):
+        import stat
+        try:
+            return stat.S_ISDIR(self.stat().st_mode)
+        except OSError:
+            return False
+
+
+    def is_file(self):
+        import stat
+        try:
+            return stat.S_ISREG(self.stat().st_mode)
+        except OSError:
+            return False
+
+
+    def is_symlink(self):
+        import stat
+        try:
+            return stat.S_ISLNK(self.stat(follow_symlinks=False).st_mode)
+        except OSError:
+            return False
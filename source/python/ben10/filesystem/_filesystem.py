@@ -9,11 +9,15 @@ These functions abstract file location, most of them work for either local, ftp
 #===================================================================================================
 # FTP LIMITATIONS:
 #===================================================================================================
-    Right now, all functions that require a FTP connection are ALWAYS creating and closing a FTP
-    Host.
+    The functions that require a FTP connection obtain a FTP Host from a pool (.. seealso::
+    _filesystem_remote.ftp_host_pool) that keeps the connections open for a while after use, so
+    only the first operation in a server pays for the connection and login.
 
-    Keep in mind that this process can be slow if you perform many of such operations in sequence.
+    Still, each operation is (at least) one round trip to the server: keep in mind that this
+    process can be slow if you perform many of such operations in sequence.
 '''
+from ben10.foundation.namedtuple import namedtuple
+from urlparse import ParseResult as _ParseResult
 import contextlib
 import os
 import re
@@ -67,6 +71,26 @@ DRIVE_CDROM = 5
 # The drive is a RAM disk
 DRIVE_RAMDISK = 6
 
+# A suitable number of files copied concurrently by CopyFiles (workers) when copying from or to a
+# remote location.
+COPY_FILES_WORKERS = 8
+
+# Types of path, as given by StatMany.
+PATH_TYPE_FILE = 'file'
+PATH_TYPE_DIR = 'dir'
+# Anything else: devices, sockets, pipes, etc.
+PATH_TYPE_OTHER = 'other'
+
+# Number of threads used by StatMany to check local paths.
+STAT_MANY_WORKERS = 8
+
+# The metadata of a path, as returned by StatMany.
+#     type: The PATH_TYPE_XXX of the path (of the target, for links). None if it does not exist.
+#     size: The size in bytes, for files. None otherwise.
+#     mtime: The modification time. None if the path does not exist.
+#     link_target: The target of the link, if the path is a link. None otherwise.
+StatRecord = namedtuple('StatRecord', 'type size mtime link_target')
+
 #===================================================================================================
 # Cwd
 #===================================================================================================
@@ -211,16 +235,19 @@ def CreateMD5(source_filename, target_filename=None):
     if target_filename is None:
         target_filename = source_filename + '.md5'
 
-    from urlparse import urlparse
-    source_url = urlparse(source_filename)
+    source_url = _ParseUrl(source_filename)
 
     # Obtain MD5 hex
     if _UrlIsLocal(source_url):
         # If using a local file, we can give Md5Hex the filename
         md5_contents = Md5Hex(filename=source_filename)
     else:
-        # Md5Hex can't handle remote files, we open it and pray we won't run out of memory.
-        md5_contents = Md5Hex(contents=GetFileContents(source_filename))
+        # Read remote files in chunks, in constant memory.
+        source_file = OpenFile(source_filename, binary=True)
+        try:
+            md5_contents = Md5Hex(stream=source_file)
+        finally:
+            source_file.close()
 
     # Write MD5 hash to a file
     CreateFile(target_filename, md5_contents)
@@ -321,10 +348,8 @@ def _DoCopyFile(source_filename, target_filename, copy_symlink=True):
     :raises FileNotFoundError:
         If source_filename does not exist
     '''
-    from urlparse import urlparse
-
-    source_url = urlparse(source_filename)
-    target_url = urlparse(target_filename)
+    source_url = _ParseUrl(source_filename)
+    target_url = _ParseUrl(target_filename)
 
     if _UrlIsLocal(source_url):
         if not Exists(source_filename):
@@ -408,7 +433,7 @@ def _CopyFileLocal(source_filename, target_filename, copy_symlink=True):
 #===================================================================================================
 # CopyFiles
 #===================================================================================================
-def CopyFiles(source_dir, target_dir, create_target_dir=False, md5_check=False):
+def CopyFiles(source_dir, target_dir, create_target_dir=False, md5_check=False, workers=None):
     '''
     Copy files from the given source to the target.
 
@@ -433,13 +458,76 @@ def CopyFiles(source_dir, target_dir, create_target_dir=False, md5_check=False):
     :param bool md5_check:
         .. seealso:: CopyFile
 
+    :param int|None workers:
+        The number of files copied concurrently. If None, copies one file at a time, stopping at
+        the first failure (with its original error).
+
+        Copying many files at a time is faster when the source or the target is remote (the copy
+        is then bound by the latency of the server, not the bandwidth): e.g. COPY_FILES_WORKERS.
+
+        With more than one worker, a failure copying a file does not stop the copy of the other
+        files: all the failures are raised at the end, as a single CopyFilesError.
+
     :raises DirectoryNotFoundError:
         If target_dir does not exist, and create_target_dir is False
 
+    :raises CopyFilesError:
+        If some of the files could not be copied (only with more than one worker).
+
     .. seealso:: CopyFile for documentation on accepted protocols
 
     .. seealso:: FTP LIMITATIONS at this module's doc for performance issues information
     '''
+    files = _IterCopyFiles(source_dir, target_dir, create_target_dir, md5_check)
+
+    if workers is None or workers <= 1:
+        for i_source_path, i_target_path in files:
+            CopyFile(i_source_path, i_target_path, md5_check=md5_check)
+        return
+
+    # List all files (and create the target directories) before starting to copy.
+    files = list(files)
+    if not files:
+        return
+
+    def Copy(paths):
+        source_path, target_path = paths
+        try:
+            CopyFile(source_path, target_path, md5_check=md5_check)
+        except Exception, e:
+            return (source_path, target_path, e)
+
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(min(workers, len(files)))
+    try:
+        errors = [i for i in pool.imap(Copy, files) if i is not None]
+    finally:
+        pool.close()
+        pool.join()
+
+    if errors:
+        from ._filesystem_exceptions import CopyFilesError
+        raise CopyFilesError(errors)
+
+
+
+def _IterCopyFiles(source_dir, target_dir, create_target_dir, md5_check):
+    '''
+    Lists the files to be copied by CopyFiles, creating the target directories on the way.
+
+    :param source_dir:
+        .. see:: CopyFiles
+    :param target_dir:
+        .. see:: CopyFiles
+    :param create_target_dir:
+        .. see:: CopyFiles
+    :param md5_check:
+        .. see:: CopyFiles
+
+    :rtype: iter(tuple(str,str))
+    :returns:
+        Yields the source and target paths for each file to copy.
+    '''
     import fnmatch
 
     # Check if we were given a directory or a directory with mask
@@ -476,9 +564,10 @@ def CopyFiles(source_dir, target_dir, create_target_dir=False, md5_check=False):
 
             if IsDir(source_path):
                 # If we found a directory, copy it recursively
-                CopyFiles(source_path, target_path, create_target_dir=True, md5_check=md5_check)
+                for i_paths in _IterCopyFiles(source_path, target_path, True, md5_check):
+                    yield i_paths
             else:
-                CopyFile(source_path, target_path, md5_check=md5_check)
+                yield source_path, target_path
 
 
 
@@ -499,7 +588,7 @@ def CopyFilesX(file_mapping):
 
     .. seealso:: FTP LIMITATIONS at this module's doc for performance issues information
     '''
-    from ._duplicates import ExtendedPathMask, FindFiles
+    from ._duplicates import ExtendedPathMask, IterFindFiles
 
     # List files that match the mapping
     files = []
@@ -508,9 +597,9 @@ def CopyFilesX(file_mapping):
 
         _AssertIsLocal(dirname)
 
-        filenames = FindFiles(dirname, in_filters, out_filters, tree_recurse)
-        for i_source_filename in filenames:
-            if os.path.isdir(i_source_filename):
+        entries = IterFindFiles(dirname, in_filters, out_filters, tree_recurse, yield_entries=True)
+        for i_source_filename, i_entry in entries:
+            if i_entry.is_dir():
                 continue  # Do not copy dirs
 
             i_target_filename = i_source_filename[len(dirname) + 1:]
@@ -551,11 +640,19 @@ def IsFile(path):
         True if the file exists
 
     .. seealso:: FTP LIMITATIONS at this module's doc for performance issues information
+
+    .. seealso:: FilesystemCache to answer many queries for local files from memory.
+
+    .. seealso:: StatMany to check many paths at once.
     '''
-    from urlparse import urlparse
-    url = urlparse(path)
+    url = _ParseUrl(path)
 
     if _UrlIsLocal(url):
+        from ._filesystem_cache import GetActiveCache
+        cache = GetActiveCache(path)
+        if cache is not None:
+            return cache.IsFile(path)
+
         if IsLink(path):
             return IsFile(ReadLink(path))
         return os.path.isfile(path)
@@ -629,11 +726,17 @@ def IsDir(directory):
         If the path protocol is not local or ftp
 
     .. seealso:: FTP LIMITATIONS at this module's doc for performance issues information
+
+    .. seealso:: StatMany to check many paths at once.
     '''
-    from urlparse import urlparse
-    directory_url = urlparse(directory)
+    directory_url = _ParseUrl(directory)
 
     if _UrlIsLocal(directory_url):
+        from ._filesystem_cache import GetActiveCache
+        cache = GetActiveCache(directory)
+        if cache is not None:
+            return cache.IsDir(directory)
+
         return os.path.isdir(directory)
     elif directory_url.scheme == 'ftp':
         from ben10.filesystem._filesystem_remote import FTPIsDir
@@ -654,9 +757,10 @@ def Exists(path):
         True if the path already exists (either a file or a directory)
 
     .. seealso:: FTP LIMITATIONS at this module's doc for performance issues information
+
+    .. seealso:: StatMany to check many paths at once.
     '''
-    from urlparse import urlparse
-    path_url = urlparse(path)
+    path_url = _ParseUrl(path)
 
     # Handle local
     if _UrlIsLocal(path_url):
@@ -665,6 +769,133 @@ def Exists(path):
 
 
 
+#===================================================================================================
+# StatMany
+#===================================================================================================
+def StatMany(paths, workers=None):
+    '''
+    Obtains the metadata of many paths at once. Works for both local and ftp paths.
+
+    Use this instead of calling Exists, IsFile, IsDir, IsLink or GetMTime for each of many paths:
+        - Local paths are checked concurrently;
+        - FTP paths are checked with a single listing of each parent directory, so there is one
+          round trip to the server per directory, not per path.
+
+    e.g.:
+        for i_path, i_record in zip(paths, StatMany(paths)):
+            if i_record.type == PATH_TYPE_FILE:
+                ...
+
+    :param list(str) paths:
+        Local paths or ftp urls.
+
+    :param int|None workers:
+        The number of threads used to check the paths. If None, uses STAT_MANY_WORKERS.
+
+    :rtype: list(StatRecord)
+    :returns:
+        The metadata of each path, in the same order as the given paths.
+
+    :raises NotImplementedProtocol:
+        If a path is not local or ftp
+
+    .. seealso:: StatRecord
+    '''
+    if workers is None:
+        workers = STAT_MANY_WORKERS
+
+    # Each task obtains the records for some of the paths: (index, record) pairs.
+    def StatLocal(indexes):
+        return [(i, _StatLocal(paths[i])) for i in indexes]
+
+    def StatFTP(indexed_urls):
+        from ._filesystem_remote import FTPStatMany
+        indexes, urls = zip(*indexed_urls)
+        return zip(indexes, FTPStatMany(urls))
+
+    local_indexes = []
+    ftp_urls = {}
+    for i_index, i_path in enumerate(paths):
+        i_url = _ParseUrl(i_path)
+        if _UrlIsLocal(i_url):
+            local_indexes.append(i_index)
+        elif i_url.scheme == 'ftp':
+            ftp_urls.setdefault(i_url.netloc, []).append((i_index, i_url))
+        else:
+            from ._filesystem_exceptions import NotImplementedProtocol
+            raise NotImplementedProtocol(i_url.scheme)
+
+    # The local paths are checked in batches, to reduce the overhead of the threads.
+    batch_size = max(1, min(256, len(local_indexes) / workers))
+    tasks = [
+        (StatLocal, local_indexes[i:i + batch_size])
+        for i in xrange(0, len(local_indexes), batch_size)
+    ]
+    tasks += [(StatFTP, i) for i in ftp_urls.itervalues()]
+
+    def RunTask(task):
+        function, arg = task
+        return function(arg)
+
+    if workers <= 1 or len(tasks) <= 1:
+        task_results = map(RunTask, tasks)
+    else:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(workers, len(tasks)))
+        try:
+            task_results = pool.map(RunTask, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+    result = [None] * len(paths)
+    for i_task_result in task_results:
+        for i_index, i_record in i_task_result:
+            result[i_index] = i_record
+    return result
+
+
+def _StatLocal(path):
+    '''
+    :rtype: StatRecord
+    :returns:
+        The metadata of a local path.
+
+    .. seealso:: StatMany
+    '''
+    if sys.platform == 'win32':
+        link_target = ReadLink(path) if IsLink(path) else None
+    else:
+        link_target = os.readlink(path) if os.path.islink(path) else None
+
+    try:
+        path_stat = os.stat(path)
+    except OSError:
+        return StatRecord(None, None, None, link_target)
+    return _StatRecordFromStat(path_stat, link_target)
+
+
+def _StatRecordFromStat(path_stat, link_target):
+    '''
+    :param path_stat:
+        The result of a stat call (local or remote).
+
+    :param str|None link_target:
+
+    :rtype: StatRecord
+    '''
+    import stat
+
+    if stat.S_ISREG(path_stat.st_mode):
+        return StatRecord(PATH_TYPE_FILE, path_stat.st_size, path_stat.st_mtime, link_target)
+    if stat.S_ISDIR(path_stat.st_mode):
+        path_type = PATH_TYPE_DIR
+    else:
+        path_type = PATH_TYPE_OTHER
+    return StatRecord(path_type, None, path_stat.st_mtime, link_target)
+
+
+
 #===================================================================================================
 # CopyDirectory
 #===================================================================================================
@@ -754,27 +985,153 @@ def AppendToFile(filename, contents, eol_style=EOL_STYLE_NATIVE, encoding=None):
     :raises ValueError:
         If trying to mix unicode `contents` without `encoding`, or `encoding` without
         unicode `contents`
+
+    .. seealso:: BufferedAppender, to append many times to the same file.
     '''
     _AssertIsLocal(filename)
 
-    # Unicode
-    unicode_contents = isinstance(contents, unicode)
-    use_encoding = encoding is not None
-    if unicode_contents ^ use_encoding:  # XOR
-        raise ValueError('Either use unicode contents with an encoding, or string contents without encoding.')
-
-    if unicode_contents:
-        contents = contents.encode(encoding)
-    contents = _HandleContentsEol(contents, eol_style)
+    chunks = _IterPrepareContents(contents, eol_style, encoding)
 
     oss = open(filename, 'ab')
     try:
-        oss.write(contents)
+        for i_chunk in chunks:
+            oss.write(i_chunk)
     finally:
         oss.close()
 
 
 
+#===================================================================================================
+# BufferedAppender
+#===================================================================================================
+class BufferedAppender(object):
+    '''
+    Appends contents to a local file, like AppendToFile, but keeping the contents in memory and
+    writing them in batches: the file is opened once per batch, not once per call.
+
+    The pending contents are written when:
+        - Their size reaches "buffer_size";
+        - "max_delay" seconds passed since the oldest pending contents were appended (by a timer
+          thread, so contents are written even if nothing else is appended);
+        - Flush or Close are called (Close is called at the end of a "with" block).
+
+    e.g.:
+        with BufferedAppender('c:/temp/log.txt') as appender:
+            for i_line in lines:
+                appender.Append(i_line + '\n')
+    '''
+
+    def __init__(self, filename, eol_style=EOL_STYLE_NATIVE, encoding=None,
+            buffer_size=64 * 1024, max_delay=None, fsync=False):
+        '''
+        :param str filename:
+
+        :param eol_style:
+            .. seealso:: AppendToFile
+
+        :param str encoding:
+            .. seealso:: AppendToFile
+
+        :param int buffer_size:
+            The size (in bytes) of the pending contents that triggers a write.
+
+        :param float|None max_delay:
+            The maximum time (in seconds) the contents are kept in memory. If None, contents are
+            only written when the buffer is full or when flushed.
+
+        :param bool fsync:
+            If True, forces the data to be written to the disk on each write (os.fsync).
+
+        :raises NotImplementedForRemotePathError:
+            If trying to append to a non-local path
+        '''
+        import threading
+
+        _AssertIsLocal(filename)
+
+        self.filename = filename
+        self.eol_style = eol_style
+        self.encoding = encoding
+        self.buffer_size = buffer_size
+        self.max_delay = max_delay
+        self.fsync = fsync
+
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_size = 0
+        self._pending_since = None
+        self._timer = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.Close()
+
+
+    def Append(self, contents):
+        '''
+        :param str contents:
+            .. seealso:: AppendToFile
+        '''
+        import threading
+        import time
+
+        contents = _PrepareContents(contents, self.eol_style, self.encoding)
+
+        with self._lock:
+            now = time.time()
+            if not self._pending:
+                self._pending_since = now
+                if self.max_delay is not None:
+                    self._timer = threading.Timer(self.max_delay, self.Flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+            self._pending.append(contents)
+            self._pending_size += len(contents)
+
+            if self._pending_size >= self.buffer_size or \
+               (self.max_delay is not None and now - self._pending_since >= self.max_delay):
+                self._Write()
+
+
+    def Flush(self):
+        '''
+        Writes all the pending contents to the file.
+        '''
+        with self._lock:
+            self._Write()
+
+
+    def Close(self):
+        '''
+        Writes all the pending contents to the file.
+        '''
+        self.Flush()
+
+
+    def _Write(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self._pending:
+            return
+
+        with open(self.filename, 'ab') as oss:
+            oss.write(''.join(self._pending))
+            if self.fsync:
+                oss.flush()
+                os.fsync(oss.fileno())
+
+        self._pending = []
+        self._pending_size = 0
+        self._pending_since = None
+
+
+
 #===================================================================================================
 # MoveFile
 #===================================================================================================
@@ -823,9 +1180,8 @@ def MoveDirectory(source_dir, target_dir):
         from ben10.filesystem import DirectoryAlreadyExistsError
         raise DirectoryAlreadyExistsError(target_dir)
 
-    from urlparse import urlparse
-    source_url = urlparse(source_dir)
-    target_url = urlparse(target_dir)
+    source_url = _ParseUrl(source_dir)
+    target_url = _ParseUrl(target_dir)
 
     # Local to local
     if _UrlIsLocal(source_url) and _UrlIsLocal(target_url):
@@ -877,6 +1233,38 @@ def GetFileContents(filename, binary=False, encoding=None):
     return contents
 
 
+#===================================================================================================
+# IterFileChunks
+#===================================================================================================
+def IterFileChunks(filename, chunk_size=64 * 1024):
+    '''
+    Reads a file in chunks. Works for both local and remote files.
+
+    Use this instead of GetFileContents to process large (remote) files in constant memory.
+
+    :param str filename:
+
+    :param int chunk_size:
+        The maximum size of each chunk.
+
+    :rtype: iter(str)
+    :returns:
+        The file's (binary) contents, in chunks.
+
+    .. seealso:: FTP LIMITATIONS at this module's doc for performance issues information
+    '''
+    source_file = OpenFile(filename, binary=True)
+    try:
+        while True:
+            chunk = source_file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        source_file.close()
+
+
+
 #===================================================================================================
 # GetFileLines
 #===================================================================================================
@@ -895,6 +1283,100 @@ def GetFileLines(filename):
     return GetFileContents(filename, binary=False).split('\n')
 
 
+#===================================================================================================
+# IterFileLines
+#===================================================================================================
+def IterFileLines(filename, encoding=None, chunk_size=64 * 1024):
+    '''
+    Reads a file lazily, line by line. Works for both local and remote files.
+
+    Produces the same lines as GetFileLines, but only keeps a chunk of the file in memory at a
+    time: use it to process large files.
+
+    All eol styles ('\\r\\n', '\\r' and '\\n') are recognized, for local and remote files alike.
+
+    :param str filename:
+
+    :param str encoding:
+        File's encoding. If not None, lines are decoded using this `encoding`.
+
+    :param int chunk_size:
+        The size of the chunks read from the file.
+
+    :rtype: iter(str) | iter(unicode)
+    :returns:
+        The file's lines, without the eol. Unicode lines when `encoding` is not None.
+
+    .. seealso:: FTP LIMITATIONS at this module's doc for performance issues information
+    '''
+    chunks = IterFileChunks(filename, chunk_size=chunk_size)
+
+    if encoding is not None:
+        import codecs
+        decoder = codecs.getincrementaldecoder(encoding)()
+        def Decode(chunks):
+            for i_chunk in chunks:
+                yield decoder.decode(i_chunk)
+            yield decoder.decode('', True)
+        chunks = Decode(chunks)
+
+    pending = ''
+    for i_chunk in _IterHandleContentsEol(chunks, EOL_STYLE_UNIX):
+        lines = (pending + i_chunk).split('\n')
+        pending = lines.pop()
+        for i_line in lines:
+            yield i_line
+    yield pending
+
+
+
+#===================================================================================================
+# MapFile
+#===================================================================================================
+@contextlib.contextmanager
+def MapFile(filename):
+    '''
+    Maps a local file in memory, read-only.
+
+    The contents are read from the file on demand (by the operating system), so even very large
+    files can be searched (e.g. with re or the map's "find" method) or sliced without reading them
+    whole.
+
+    e.g.:
+        with MapFile('c:/logs/server.log') as contents:
+            position = contents.find('ERROR')
+
+    :param str filename:
+
+    :rtype: mmap.mmap | str
+    :returns:
+        The map with the file's (binary) contents, valid only inside the "with" block. The eol
+        style is not converted: use IterFileLines to read normalized lines.
+        An empty str for empty files (which cannot be mapped).
+
+    :raises NotImplementedForRemotePathError:
+        If the filename is not local.
+    '''
+    import mmap
+
+    _AssertIsLocal(filename)
+    if not os.path.isfile(filename):
+        from ._filesystem_exceptions import FileNotFoundError
+        raise FileNotFoundError(filename)
+
+    with file(filename, 'rb') as iss:
+        if os.fstat(iss.fileno()).st_size == 0:
+            yield ''
+            return
+
+        contents = mmap.mmap(iss.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield contents
+        finally:
+            contents.close()
+
+
+
 def OpenFile(filename, binary=False):
     '''
     Open a file and returns it.
@@ -915,8 +1397,7 @@ def OpenFile(filename, binary=False):
 
     .. seealso:: FTP LIMITATIONS at this module's doc for performance issues information
     '''
-    from urlparse import urlparse
-    filename_url = urlparse(filename)
+    filename_url = _ParseUrl(filename)
 
     # Check if file is local
     if _UrlIsLocal(filename_url):
@@ -959,11 +1440,15 @@ def ListFiles(directory):
 
     .. seealso:: FTP LIMITATIONS at this module's doc for performance issues information
     '''
-    from urlparse import urlparse
-    directory_url = urlparse(directory)
+    directory_url = _ParseUrl(directory)
 
     # Handle local
     if _UrlIsLocal(directory_url):
+        from ._filesystem_cache import GetActiveCache
+        cache = GetActiveCache(directory)
+        if cache is not None:
+            return cache.ListFiles(directory)
+
         if not os.path.isdir(directory):
             return None
         return os.listdir(directory)
@@ -1020,7 +1505,8 @@ def CheckIsDir(directory):
 #===================================================================================================
 # CreateFile
 #===================================================================================================
-def CreateFile(filename, contents, eol_style=EOL_STYLE_NATIVE, create_dir=True, encoding=None):
+def CreateFile(filename, contents, eol_style=EOL_STYLE_NATIVE, create_dir=True, encoding=None,
+        atomic=False, fsync=False):
     '''
     Create a file with the given contents.
 
@@ -1041,29 +1527,38 @@ def CreateFile(filename, contents, eol_style=EOL_STYLE_NATIVE, create_dir=True,
     :param str encoding:
         Target file's content encoding.
 
+    :param bool atomic:
+        If True, writes the contents to a temporary file (in the same directory) which is then
+        renamed to filename, so readers never see a partially written file: only the old or the
+        new contents. Only for local files.
+
+    :param bool fsync:
+        If True, forces the contents to be written to the disk (os.fsync) before returning. When
+        combined with atomic, the contents are on disk before the rename.
+
     :return str:
         Returns the name of the file created.
 
     :raises NotImplementedProtocol:
         If file protocol is not local or FTP
 
+    :raises NotImplementedForRemotePathError:
+        If atomic is True and the file is not local
+
     :raises ValueError:
         If trying to mix unicode `contents` without `encoding`, or `encoding` without
         unicode `contents`
 
     .. seealso:: FTP LIMITATIONS at this module's doc for performance issues information
     '''
-    # Unicode
-    unicode_contents = isinstance(contents, unicode)
-    use_encoding = encoding is not None
-    if unicode_contents ^ use_encoding:  # XOR
-        raise ValueError('Either use unicode contents with an encoding, or string contents without encoding.')
+    # The contents are converted while written, a chunk at a time, to avoid full size copies.
+    chunks = _IterPrepareContents(contents, eol_style, encoding)
 
-    if unicode_contents:
-        contents = contents.encode(encoding)
+    filename_url = _ParseUrl(filename)
 
-    # Replaces eol on each line by the given eol_style.
-    contents = _HandleContentsEol(contents, eol_style)
+    if atomic and not _UrlIsLocal(filename_url):
+        from ._filesystem_exceptions import NotImplementedForRemotePathError
+        raise NotImplementedForRemotePathError
 
     # If asked, creates directory containing file
     if create_dir:
@@ -1071,18 +1566,22 @@ def CreateFile(filename, contents, eol_style=EOL_STYLE_NATIVE, create_dir=True,
         if dirname:
             CreateDirectory(dirname)
 
-    from urlparse import urlparse
-    filename_url = urlparse(filename)
-
     # Handle local
     if _UrlIsLocal(filename_url):
-        with open(filename, 'wb') as oss:
-            oss.write(contents)
+        if atomic:
+            _CreateFileAtomic(filename, chunks, fsync)
+        else:
+            with open(filename, 'wb') as oss:
+                for i_chunk in chunks:
+                    oss.write(i_chunk)
+                if fsync:
+                    oss.flush()
+                    os.fsync(oss.fileno())
 
     # Handle FTP
     elif filename_url.scheme == 'ftp':
         from _filesystem_remote import FTPCreateFile
-        FTPCreateFile(filename_url, contents)
+        FTPCreateFile(filename_url, ''.join(chunks))
 
     else:
         from ._filesystem_exceptions import NotImplementedProtocol
@@ -1092,6 +1591,59 @@ def CreateFile(filename, contents, eol_style=EOL_STYLE_NATIVE, create_dir=True,
 
 
 
+def _CreateFileAtomic(filename, chunks, fsync):
+    '''
+    Creates a local file through a temporary file, renamed into place.
+
+    :param iter(str) chunks:
+        The file contents.
+
+    .. seealso:: CreateFile
+    '''
+    from ben10.foundation.hash import GetRandomHash
+
+    temp_filename = '%s.%s.tmp' % (filename, GetRandomHash())
+
+    # Use os.open so the new file gets the default permissions (considering the umask), like open.
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    fd = os.open(temp_filename, flags, 0666)
+    try:
+        with os.fdopen(fd, 'wb') as oss:
+            for i_chunk in chunks:
+                oss.write(i_chunk)
+            if fsync:
+                oss.flush()
+                os.fsync(oss.fileno())
+
+        # Keep the permissions of the file being replaced.
+        if os.path.isfile(filename):
+            import shutil
+            shutil.copymode(filename, temp_filename)
+
+        if sys.platform == 'win32':
+            import win32file
+            win32file.MoveFileEx(
+                temp_filename,
+                filename,
+                win32file.MOVEFILE_REPLACE_EXISTING | win32file.MOVEFILE_WRITE_THROUGH,
+            )
+        else:
+            os.rename(temp_filename, filename)
+    except:
+        if os.path.isfile(temp_filename):
+            os.remove(temp_filename)
+        raise
+
+    # Make sure the rename itself is on disk.
+    if fsync and sys.platform != 'win32':
+        dir_fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+
 def ReplaceInFile(filename, old, new):
     '''
     Replaces all occurrences of "old" by "new" in the given file.
@@ -1129,9 +1681,7 @@ def CreateDirectory(directory):
 
     .. seealso:: FTP LIMITATIONS at this module's doc for performance issues information
     '''
-    from urlparse import urlparse
-
-    directory_url = urlparse(directory)
+    directory_url = _ParseUrl(directory)
 
     # Handle local
     if _UrlIsLocal(directory_url):
@@ -1371,11 +1921,11 @@ def GetMTime(path):
     _AssertIsLocal(path)
 
     if os.path.isdir(path):
-        from ._duplicates import FindFiles
-        files = FindFiles(path)
+        from ._duplicates import IterFindFiles
+        mtimes = [i_entry.stat().st_mtime for _filename, i_entry in IterFindFiles(path, yield_entries=True)]
 
-        if len(files) > 0:
-            return max(map(os.path.getmtime, files))
+        if len(mtimes) > 0:
+            return max(mtimes)
 
     return os.path.getmtime(path)
 
@@ -1536,6 +2086,37 @@ def ReadLink(path):
 #===================================================================================================
 # Internal functions
 #===================================================================================================
+# The parsed remote urls, by url (.. seealso:: _ParseUrl).
+_parsed_urls = {}
+_PARSED_URLS_MAX_SIZE = 1000
+
+def _ParseUrl(path):
+    '''
+    Same as urlparse.urlparse, but much faster for local paths and cached for remote urls.
+
+    Local paths are recognized with a quick check (no scheme, or a single letter scheme, the drive)
+    and are not parsed: the result holds the whole path in its "path" attribute.
+
+    :param str path:
+        A local path or url.
+
+    :rtype: ParseResult
+    '''
+    # urlparse only finds a scheme before the first ':', so a ':' (if any) in the first two
+    # characters means the scheme is (at most) a drive letter.
+    if path.find(':') < 2:
+        return _ParseResult('', '', path, '', '', '')
+
+    try:
+        return _parsed_urls[path]
+    except KeyError:
+        from urlparse import urlparse
+        if len(_parsed_urls) >= _PARSED_URLS_MAX_SIZE:
+            _parsed_urls.clear()
+        result = _parsed_urls[path] = urlparse(path)
+        return result
+
+
 def _UrlIsLocal(directory_url):
     '''
     :param ParseResult directory_url:
@@ -1563,12 +2144,72 @@ def _AssertIsLocal(path):
     :raises NotImplementedForRemotePathError:
         If the given path is not local
     '''
-    from urlparse import urlparse
-    if not _UrlIsLocal(urlparse(path)):
+    if not _UrlIsLocal(_ParseUrl(path)):
         from ._filesystem_exceptions import NotImplementedForRemotePathError
         raise NotImplementedForRemotePathError
 
 
+def _PrepareContents(contents, eol_style, encoding):
+    '''
+    Encodes the contents (if unicode) and replaces eol on each line by the given eol_style.
+
+    :param str|unicode contents:
+    :param eol_style:
+    :param str|None encoding:
+
+    :rtype: str
+
+    :raises ValueError:
+        If trying to mix unicode `contents` without `encoding`, or `encoding` without
+        unicode `contents`
+    '''
+    return _HandleContentsEol(_EncodeContents(contents, encoding), eol_style)
+
+
+def _IterPrepareContents(contents, eol_style, encoding, chunk_size=1024 * 1024):
+    '''
+    Same as _PrepareContents, but returns the contents in chunks, converted one at a time, so
+    large contents are never copied as a whole for the eol conversion.
+
+    :param int chunk_size:
+        The size of the chunks converted at a time.
+
+    :rtype: iter(str)
+
+    .. seealso:: _PrepareContents
+    '''
+    contents = _EncodeContents(contents, encoding)
+
+    # Nothing to convert: avoid any copy.
+    if eol_style == EOL_STYLE_NONE or (eol_style == EOL_STYLE_UNIX and '\r' not in contents):
+        return iter([contents])
+
+    chunks = (contents[i:i + chunk_size] for i in xrange(0, len(contents), chunk_size))
+    return _IterHandleContentsEol(chunks, eol_style)
+
+
+def _EncodeContents(contents, encoding):
+    '''
+    :param str|unicode contents:
+    :param str|None encoding:
+
+    :rtype: str
+
+    :raises ValueError:
+        If trying to mix unicode `contents` without `encoding`, or `encoding` without
+        unicode `contents`
+    '''
+    # Unicode
+    unicode_contents = isinstance(contents, unicode)
+    use_encoding = encoding is not None
+    if unicode_contents ^ use_encoding:  # XOR
+        raise ValueError('Either use unicode contents with an encoding, or string contents without encoding.')
+
+    if unicode_contents:
+        contents = contents.encode(encoding)
+    return contents
+
+
 def _HandleContentsEol(contents, eol_style):
     '''
     Replaces eol on each line by the given eol_style.
@@ -1580,16 +2221,61 @@ def _HandleContentsEol(contents, eol_style):
     if eol_style == EOL_STYLE_NONE:
         return contents
 
+    if eol_style not in (EOL_STYLE_UNIX, EOL_STYLE_MAC, EOL_STYLE_WINDOWS):
+        raise ValueError('Unexpected eol style: %r' % (eol_style,))
+
+    # Contents using only '\n' (the most common case) need (at most) a single replace.
+    if '\r' not in contents:
+        if eol_style == EOL_STYLE_UNIX:
+            return contents
+        return contents.replace('\n', eol_style)
+
     if eol_style == EOL_STYLE_UNIX:
         return contents.replace('\r\n', eol_style).replace('\r', eol_style)
 
     if eol_style == EOL_STYLE_MAC:
         return contents.replace('\r\n', eol_style).replace('\n', eol_style)
 
-    if eol_style == EOL_STYLE_WINDOWS:
-        return contents.replace('\r\n', '\n').replace('\r', '\n').replace('\n', EOL_STYLE_WINDOWS)
+    return contents.replace('\r\n', '\n').replace('\r', '\n').replace('\n', EOL_STYLE_WINDOWS)
+
+
+def _IterHandleContentsEol(chunks, eol_style):
+    '''
+    Same as _HandleContentsEol, for contents given in chunks: each chunk is converted as it is
+    consumed.
+
+    :param iter(str) chunks:
+    :type eol_style: EOL_STYLE_XXX constant
+    :param eol_style:
+
+    :rtype: iter(str)
+    :returns:
+        The converted contents, in chunks.
+    '''
+    if eol_style == EOL_STYLE_NONE:
+        return chunks
+
+    # Check the eol_style now, not when the chunks are consumed.
+    _HandleContentsEol('', eol_style)
+
+    def Convert():
+        pending = ''
+        for i_chunk in chunks:
+            i_chunk = pending + i_chunk
+
+            # A '\r' at the end of a chunk may be the first half of a '\r\n': wait for the next one.
+            if i_chunk.endswith('\r'):
+                i_chunk, pending = i_chunk[:-1], i_chunk[-1:]
+            else:
+                pending = ''
+
+            if i_chunk:
+                yield _HandleContentsEol(i_chunk, eol_style)
+
+        if pending:
+            yield _HandleContentsEol(pending, eol_style)
 
-    raise ValueError('Unexpected eol style: %r' % (eol_style,))
+    return Convert()
 
 
 def _CallWindowsNetCommand(parameters):
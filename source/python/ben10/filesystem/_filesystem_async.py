@@ -0,0 +1,158 @@
+'''
+Non-blocking versions of the ben10.filesystem functions, mostly useful for remote (ftp, http)
+operations, which are bound by the latency of the server.
+'''
+
+
+
+#===================================================================================================
+# AsyncFilesystem
+#===================================================================================================
+class AsyncFilesystem(object):
+    '''
+    Runs filesystem operations in the background, in a fixed number of worker threads.
+
+    Each method starts the operation and returns immediately with a
+    multiprocessing.pool.AsyncResult: use its "get" method to wait for (and obtain) the result or
+    the exception raised by the operation. Many operations can be started at once: no more than
+    "workers" run at the same time, the others wait in a queue, so hundreds of transfers do not
+    need hundreds of threads.
+
+    FTP operations reuse the connections kept by the ftp_host_pool (.. seealso::
+    ben10.filesystem._filesystem_remote.FTPHostPool), which keeps enough idle connections for all
+    the workers until closed.
+
+    e.g.:
+        with AsyncFilesystem(workers=16) as async_filesystem:
+            results = [
+                async_filesystem.CopyFile(i_url, i_filename)
+                for i_url, i_filename in downloads
+            ]
+            for i_result in results:
+                i_result.get()  # Raises the error if the copy failed
+    '''
+
+    def __init__(self, workers=8):
+        '''
+        :param int workers:
+            The maximum number of operations running at the same time.
+        '''
+        from ._filesystem_remote import ftp_host_pool
+        from multiprocessing.pool import ThreadPool
+
+        self.workers = workers
+        self._pool = ThreadPool(workers)
+        self._closed = False
+
+        # Keep enough idle connections for all workers.
+        ftp_host_pool.ReserveIdleHosts(workers)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.Close()
+
+
+    def Close(self):
+        '''
+        Waits for all pending operations to finish and stops the worker threads.
+        '''
+        from ._filesystem_remote import ftp_host_pool
+
+        if self._closed:
+            return
+        self._closed = True
+
+        self._pool.close()
+        self._pool.join()
+        ftp_host_pool.UnreserveIdleHosts(self.workers)
+
+
+    def Apply(self, function, *args, **kwargs):
+        '''
+        Runs the given function in a worker thread.
+
+        :param callable function:
+        :param args:
+        :param kwargs:
+
+        :rtype: multiprocessing.pool.AsyncResult
+        :returns:
+            The result of function(*args, **kwargs).
+        '''
+        return self._pool.apply_async(function, args, kwargs)
+
+
+    def CopyFile(self, source_filename, target_filename, *args, **kwargs):
+        '''
+        .. seealso:: ben10.filesystem.CopyFile
+
+        :rtype: multiprocessing.pool.AsyncResult
+        '''
+        from . import _filesystem
+        return self.Apply(_filesystem.CopyFile, source_filename, target_filename, *args, **kwargs)
+
+
+    def ListFiles(self, directory):
+        '''
+        .. seealso:: ben10.filesystem.ListFiles
+
+        :rtype: multiprocessing.pool.AsyncResult
+        '''
+        from . import _filesystem
+        return self.Apply(_filesystem.ListFiles, directory)
+
+
+    def IsFile(self, path):
+        '''
+        .. seealso:: ben10.filesystem.IsFile
+
+        :rtype: multiprocessing.pool.AsyncResult
+        '''
+        from . import _filesystem
+        return self.Apply(_filesystem.IsFile, path)
+
+
+    def IsDir(self, directory):
+        '''
+        .. seealso:: ben10.filesystem.IsDir
+
+        :rtype: multiprocessing.pool.AsyncResult
+        '''
+        from . import _filesystem
+        return self.Apply(_filesystem.IsDir, directory)
+
+
+    def OpenFile(self, filename, binary=False):
+        '''
+        .. seealso:: ben10.filesystem.OpenFile
+
+        :rtype: multiprocessing.pool.AsyncResult
+        :returns:
+            The open file, it must be closed by the caller.
+        '''
+        from . import _filesystem
+        return self.Apply(_filesystem.OpenFile, filename, binary=binary)
+
+
+    def GetFileContents(self, filename, *args, **kwargs):
+        '''
+        .. seealso:: ben10.filesystem.GetFileContents
+
+        :rtype: multiprocessing.pool.AsyncResult
+        '''
+        from . import _filesystem
+        return self.Apply(_filesystem.GetFileContents, filename, *args, **kwargs)
+
+
+    def CreateFile(self, filename, contents, *args, **kwargs):
+        '''
+        .. seealso:: ben10.filesystem.CreateFile
+
+        :rtype: multiprocessing.pool.AsyncResult
+        '''
+        from . import _filesystem
+        return self.Apply(_filesystem.CreateFile, filename, contents, *args, **kwargs)
@@ -0,0 +1,308 @@
+'''
+An in-process cache for the metadata (directory listings and file types) of a local directory tree.
+
+While a FilesystemCache is active (inside its "with" block) the ben10.filesystem functions that only
+need this metadata (FindFiles, IterFindFiles, ParallelFindFiles, ListFiles, IsFile and IsDir) answer
+queries for paths inside the cached tree from memory.
+'''
+from ._duplicates import _DirEntry, _ReadDirEntries
+import os
+
+
+
+# The caches currently active, the innermost (last entered) last.
+_active_caches = []
+
+#===================================================================================================
+# GetActiveCache
+#===================================================================================================
+def GetActiveCache(path):
+    '''
+    :param str path:
+        A local path.
+
+    :rtype: FilesystemCache | None
+    :returns:
+        The innermost active cache containing the given path, or None.
+    '''
+    if not _active_caches:
+        return None
+
+    canonical_path = _CanonicalPath(path)
+    for i_cache in reversed(_active_caches):
+        if i_cache.Contains(canonical_path):
+            return i_cache
+    return None
+
+
+
+#===================================================================================================
+# FilesystemCache
+#===================================================================================================
+class FilesystemCache(object):
+    '''
+    Caches the listing of all directories in a local tree, along with the type (file, directory or
+    link) of each entry.
+
+    e.g.:
+        with FilesystemCache('c:/project'):
+            FindFiles('c:/project', in_filters=['*.py'])  # Lists the whole tree from the cache
+            IsFile('c:/project/source/alpha.py')  # Answered from the cache
+
+    The cached listing of a directory is invalidated when the directory mtime changes, so entries
+    created, removed or renamed are always noticed at the cost of one stat per directory queried.
+
+    If "watch" is True (Linux only, requires pyinotify) the cache is invalidated by inotify events
+    instead and the directories are not stat-ed at all. Note that in this case the events are
+    processed asynchronously, so a change may take a few milliseconds to be noticed.
+
+    .. note:: Only the directory listings are cached: file contents (size, mtime) may change without
+        changing the directory, so DirEntry.stat() of the cached entries always stats the file.
+    '''
+
+    def __init__(self, root, watch=False, snapshot=True):
+        '''
+        :param str root:
+            The root of the local directory tree to cache.
+
+        :param bool watch:
+            If True, uses inotify to invalidate the cache instead of checking the directories mtime.
+
+        :param bool snapshot:
+            If True, lists the whole tree when entering the cache. Otherwise, the directories are
+            listed (and cached) the first time they are queried.
+        '''
+        from ._filesystem import _AssertIsLocal
+        _AssertIsLocal(root)
+
+        self.root = _CanonicalPath(root)
+        self.watch = watch
+        self.snapshot = snapshot
+
+        # Maps the canonical path of each directory to a tuple (mtime, dict(name, entry_type))
+        self._directories = {}
+        self._notifier = None
+
+
+    def __enter__(self):
+        if self.watch:
+            self._StartWatching()
+        if self.snapshot:
+            self.Snapshot()
+        _active_caches.append(self)
+        return self
+
+
+    def __exit__(self, *args):
+        _active_caches.remove(self)
+        if self._notifier is not None:
+            self._notifier.stop()
+            self._notifier = None
+        self._directories.clear()
+
+
+    def Contains(self, canonical_path):
+        '''
+        :param str canonical_path:
+            A path, as returned by CanonicalPath.
+
+        :rtype: bool
+        :returns:
+            True if the given path is inside the cached tree.
+        '''
+        return canonical_path == self.root or canonical_path.startswith(self.root + os.sep)
+
+
+    def Snapshot(self):
+        '''
+        Lists (and caches) the whole tree.
+        '''
+        directories = [self.root]
+        while directories:
+            directory = directories.pop()
+            for i_name, i_type in self._GetListing(directory).itervalues():
+                if i_type == _TYPE_DIR:  # Like os.walk, do not follow links to directories.
+                    directories.append(_CanonicalPath(os.path.join(directory, i_name)))
+
+
+    def Invalidate(self, directory=None):
+        '''
+        Forgets the cached listing of the given directory and its sub-directories.
+
+        :param str|None directory:
+            The directory to invalidate. If None, invalidates the whole cache.
+        '''
+        if directory is None:
+            self._directories.clear()
+            return
+
+        directory = _CanonicalPath(directory)
+        prefix = directory + os.sep
+        for i_directory in self._directories.keys():
+            if i_directory == directory or i_directory.startswith(prefix):
+                self._directories.pop(i_directory, None)
+
+
+    def ListDirEntries(self, directory):
+        '''
+        :param str directory:
+            A directory inside the cached tree.
+
+        :rtype: list(DirEntry)
+        :returns:
+            The directory entries, with the same interface as os.DirEntry (.. seealso::
+            ben10.filesystem.IterFindFiles). The path of the entries is joined with the given
+            directory, exactly as given.
+        '''
+        listing = self._GetListing(_CanonicalPath(directory))
+        return [_CachedDirEntry(directory, i_name, i_type) for i_name, i_type in listing.itervalues()]
+
+
+    def ListFiles(self, directory):
+        '''
+        :rtype: list(str) | None
+        :returns:
+            The same as os.listdir, or None if the directory does not exist.
+
+        .. seealso:: ben10.filesystem.ListFiles
+        '''
+        canonical_directory = _CanonicalPath(directory)
+        if not self._IsType(canonical_directory, _TYPE_DIR):
+            return None
+
+        names = [i_name for i_name, _type in self._GetListing(canonical_directory).itervalues()]
+        if isinstance(directory, unicode):
+            import sys
+            encoding = sys.getfilesystemencoding()
+            names = [i if isinstance(i, unicode) else i.decode(encoding) for i in names]
+        return names
+
+
+    def IsFile(self, path):
+        '''
+        .. seealso:: ben10.filesystem.IsFile
+        '''
+        return self._IsType(_CanonicalPath(path), _TYPE_FILE)
+
+
+    def IsDir(self, path):
+        '''
+        .. seealso:: ben10.filesystem.IsDir
+        '''
+        return self._IsType(_CanonicalPath(path), _TYPE_DIR)
+
+
+    def _IsType(self, canonical_path, entry_type):
+        if canonical_path == self.root:
+            # The root entry is listed in its parent directory, which we do not cache.
+            if entry_type == _TYPE_DIR:
+                return os.path.isdir(canonical_path)
+            return os.path.isfile(canonical_path)
+
+        directory, name = os.path.split(canonical_path)
+        _actual_name, found_type = self._GetListing(directory).get(name, (name, _TYPE_MISSING))
+        return bool(found_type & entry_type)
+
+
+    def _GetListing(self, canonical_directory):
+        '''
+        :param str canonical_directory:
+            A directory inside the cached tree, as returned by CanonicalPath.
+
+        :rtype: dict(str,tuple(str,int))
+        :returns:
+            Maps the name of each entry in the directory (normalized with os.path.normcase) to its
+            actual name and type (the type of the target, for links). Returns an empty dict if the
+            directory does not exist.
+        '''
+        cached = self._directories.get(canonical_directory)
+        if cached is not None and self._notifier is not None:
+            return cached[1]
+
+        try:
+            mtime = os.stat(canonical_directory).st_mtime
+        except OSError:
+            self._directories.pop(canonical_directory, None)
+            return {}
+
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        listing = {}
+        for i_entry in _ReadDirEntries(canonical_directory):
+            if i_entry.is_dir():
+                entry_type = _TYPE_DIR
+            elif i_entry.is_file():
+                entry_type = _TYPE_FILE
+            else:
+                entry_type = _TYPE_OTHER  # Broken links, devices, etc.
+            if i_entry.is_symlink():
+                entry_type |= _TYPE_LINK
+            listing[os.path.normcase(i_entry.name)] = (i_entry.name, entry_type)
+
+        self._directories[canonical_directory] = (mtime, listing)
+        return listing
+
+
+    def _StartWatching(self):
+        import pyinotify
+
+        removed_mask = pyinotify.IN_DELETE | pyinotify.IN_MOVED_FROM
+        mask = removed_mask | pyinotify.IN_CREATE | pyinotify.IN_MOVED_TO
+
+        directories = self._directories
+        invalidate = self.Invalidate
+        class EventHandler(pyinotify.ProcessEvent):
+            def process_default(self, event):
+                # A directory removed (or moved away): forget everything below it.
+                if event.dir and event.mask & removed_mask:
+                    invalidate(event.pathname)
+
+                # An entry created or removed in event.path: forget its listing.
+                directories.pop(_CanonicalPath(event.path), None)
+
+        watch_manager = pyinotify.WatchManager()
+        self._notifier = pyinotify.ThreadedNotifier(watch_manager, EventHandler())
+        self._notifier.daemon = True
+        self._notifier.start()
+        watch_manager.add_watch(self.root, mask, rec=True, auto_add=True)
+
+
+
+# Entry types, as stored in the cache
+_TYPE_MISSING = 0
+_TYPE_FILE = 1
+_TYPE_DIR = 2
+_TYPE_OTHER = 4
+_TYPE_LINK = 8  # Combined with one of the above
+
+#===================================================================================================
+# _CachedDirEntry
+#===================================================================================================
+class _CachedDirEntry(_DirEntry):
+    '''
+    A DirEntry whose type comes from the cache.
+    '''
+
+    __slots__ = ['_type']
+
+    def __init__(self, directory, name, entry_type):
+        _DirEntry.__init__(self, directory, name)
+        self._type = entry_type
+
+
+    def is_dir(self):
+        return bool(self._type & _TYPE_DIR)
+
+
+    def is_file(self):
+        return bool(self._type & _TYPE_FILE)
+
+
+    def is_symlink(self):
+        return bool(self._type & _TYPE_LINK)
+
+
+
+def _CanonicalPath(path):
+    return os.path.normcase(os.path.abspath(path))
@@ -103,6 +103,21 @@ class FileOnlyActionError(FileError):
         return 'Action performed over "%s" only possible with a file.' % filename
 
 
+#===================================================================================================
+# HashMismatchError
+#===================================================================================================
+class HashMismatchError(FileError):
+    def __init__(self, filename, expected_hash, obtained_hash):
+        self.expected_hash = expected_hash
+        self.obtained_hash = obtained_hash
+        FileError.__init__(self, filename)
+
+    def GetMessage(self, filename):
+        return 'Hash of "%s" is "%s", expected "%s".' % (
+            filename, self.obtained_hash, self.expected_hash)
+
+
+
 #===================================================================================================
 # MultipleFilesNotFound
 #===================================================================================================
@@ -119,3 +134,38 @@ class MultipleFilesNotFound(FileNotFoundError):
 
     def __str__(self):
         return self.header + 'Files not found: %s' % ','.join(self.filenames)
+
+
+
+#===================================================================================================
+# CopyFilesError
+#===================================================================================================
+class CopyFilesError(RuntimeError):
+    '''
+    Raised by CopyFiles when some of the files could not be copied.
+
+    The error lists all the files that failed, along with the error for each one.
+    '''
+
+    def __init__(self, errors):
+        '''
+        :param list(tuple(str,str,Exception)) errors:
+            The source path, target path and the error for each file that could not be copied.
+        '''
+        self.errors = errors
+        RuntimeError.__init__(
+            self,
+            'Error copying %d file(s):\n' % len(errors) + '\n'.join(
+                '- "%s" to "%s": %s' % (i_source, i_target, i_error)
+                for i_source, i_target, i_error in errors
+            )
+        )
+
+
+
+#===================================================================================================
+# FileLockTimeoutError
+#===================================================================================================
+class FileLockTimeoutError(FileError):
+    def GetMessage(self, filename):
+        return 'Timeout waiting for the lock "%s".' % filename
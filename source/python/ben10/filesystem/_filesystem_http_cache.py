@@ -0,0 +1,200 @@
+'''
+A local cache for HTTP resources, revalidated with conditional requests.
+
+While a HttpCache is active (inside its "with" block) the ben10.filesystem functions that read HTTP
+resources (OpenFile, GetFileContents, CopyFile, etc) keep a copy of each resource in the cache
+directory and, on the next access, only download it again if it changed in the server.
+'''
+import os
+
+
+
+# The caches currently active, the innermost (last entered) last.
+_active_caches = []
+
+#===================================================================================================
+# GetActiveHttpCache
+#===================================================================================================
+def GetActiveHttpCache():
+    '''
+    :rtype: HttpCache | None
+    :returns:
+        The innermost active cache, or None.
+    '''
+    if not _active_caches:
+        return None
+    return _active_caches[-1]
+
+
+
+#===================================================================================================
+# HttpCache
+#===================================================================================================
+class HttpCache(object):
+    '''
+    Caches HTTP resources in a local directory.
+
+    e.g.:
+        with HttpCache('c:/http_cache'):
+            CopyFile('http://server/archive.zip', 'c:/temp/archive.zip')  # Downloads the file
+            ...
+            CopyFile('http://server/archive.zip', 'c:/temp/archive.zip')  # Copies from the cache
+
+    Each resource is stored in the cache directory along with a ".headers" file with the validators
+    (ETag and Last-Modified headers) sent by the server. When accessing a cached resource, a
+    conditional request (If-None-Match / If-Modified-Since) is made: if the server answers "304 Not
+    Modified" the cached file is used, otherwise the new contents replace the cached ones.
+
+    Resources sent without validators are cached too, but are always downloaded again.
+    '''
+
+    def __init__(self, cache_dir):
+        '''
+        :param str cache_dir:
+            The local directory where the resources are stored. Created if missing.
+        '''
+        from ._filesystem import _AssertIsLocal
+        _AssertIsLocal(cache_dir)
+
+        self.cache_dir = cache_dir
+
+
+    def __enter__(self):
+        _active_caches.append(self)
+        return self
+
+
+    def __exit__(self, *args):
+        _active_caches.remove(self)
+
+
+    def Fetch(self, url):
+        '''
+        Obtains the given resource, downloading it only if it is not in the cache or if it was
+        changed in the server.
+
+        :param ParseResult url:
+            A parsed http url as returned by urlparse.urlparse
+
+        :rtype: str
+        :returns:
+            The filename of the cached resource. It must not be changed by the caller.
+
+        :raises FileNotFoundError:
+            If the resource is not found in the server.
+        '''
+        import urllib2
+
+        filename, headers_filename = self._GetFilenames(url)
+        validators = self._ReadValidators(filename, headers_filename)
+
+        request = urllib2.Request(url.geturl())
+        if 'ETag' in validators:
+            request.add_header('If-None-Match', validators['ETag'])
+        if 'Last-Modified' in validators:
+            request.add_header('If-Modified-Since', validators['Last-Modified'])
+
+        try:
+            response = urllib2.urlopen(request)
+        except urllib2.HTTPError, e:
+            e.close()
+            if e.code == 304:
+                return filename
+            if e.code == 404:
+                from ._filesystem_exceptions import FileNotFoundError
+                raise FileNotFoundError(url.path)
+            raise
+
+        try:
+            self._Store(response, filename, headers_filename)
+        finally:
+            response.close()
+        return filename
+
+
+    def Clear(self):
+        '''
+        Removes all the cached resources.
+        '''
+        if os.path.isdir(self.cache_dir):
+            from ._filesystem import DeleteDirectory
+            DeleteDirectory(self.cache_dir)
+
+
+    def _GetFilenames(self, url):
+        '''
+        :rtype: tuple(str,str)
+        :returns:
+            The filename of the cached resource and of its headers.
+        '''
+        from ben10.foundation.hash import Md5Hex
+
+        # Keep the extension to make the cached files easier to recognize.
+        extension = os.path.splitext(url.path)[1]
+        filename = os.path.join(self.cache_dir, Md5Hex(contents=url.geturl()) + extension)
+        return filename, filename + '.headers'
+
+
+    def _ReadValidators(self, filename, headers_filename):
+        '''
+        :rtype: dict(str,str)
+        :returns:
+            The validators stored for the cached resource, empty if it is not in the cache.
+        '''
+        try:
+            with file(headers_filename, 'rb') as iss:
+                lines = iss.read().splitlines()
+            size = os.path.getsize(filename)
+        except (IOError, OSError):
+            return {}
+
+        validators = dict(i.split(': ', 1) for i in lines if ': ' in i)
+
+        # Ignore the validators if the cached file does not match them (e.g. changed by the user).
+        if validators.pop('Content-Length', None) != str(size):
+            return {}
+        return validators
+
+
+    def _Store(self, response, filename, headers_filename):
+        '''
+        Stores the response in the cache.
+
+        The files are written to temporary files and renamed, so concurrent readers always see a
+        complete file.
+        '''
+        import shutil
+        import tempfile
+
+        if not os.path.isdir(self.cache_dir):
+            from ._filesystem import CreateDirectory
+            CreateDirectory(self.cache_dir)
+
+        def Replace(temp_filename, filename):
+            if os.path.isfile(filename):
+                os.remove(filename)  # os.rename does not replace files on Windows
+            os.rename(temp_filename, filename)
+
+        fd, temp_filename = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as oss:
+                shutil.copyfileobj(response, oss)
+
+            headers = ['Content-Length: %d' % os.path.getsize(temp_filename)]
+            for i_name in ('ETag', 'Last-Modified'):
+                i_value = response.info().get(i_name)
+                if i_value is not None:
+                    headers.append('%s: %s' % (i_name, i_value))
+
+            # Remove the old headers first: they must never be paired with another file.
+            if os.path.isfile(headers_filename):
+                os.remove(headers_filename)
+            Replace(temp_filename, filename)
+        except:
+            os.remove(temp_filename)
+            raise
+
+        fd, temp_filename = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as oss:
+            oss.write('\n'.join(headers) + '\n')
+        Replace(temp_filename, headers_filename)
@@ -0,0 +1,150 @@
+'''
+A lock shared by all processes (and threads) in a machine, based on a lock file.
+'''
+import os
+import sys
+
+
+
+#===================================================================================================
+# FileLock
+#===================================================================================================
+class FileLock(object):
+    '''
+    An exclusive lock on a local file, shared by all the processes in the machine.
+
+    e.g.:
+        with FileLock('c:/dircache/alpha.lock'):
+            # Only one process (or thread) at a time runs this block.
+            ...
+
+    The lock is released when the "with" block ends, or when the process dies: a crashed process
+    never keeps the lock.
+
+    The lock file is created if missing and is never removed (removing it while other processes
+    wait for the lock would let two processes hold "the same" lock).
+
+    Uses fcntl.flock on Linux and msvcrt.locking on Windows.
+    '''
+
+    def __init__(self, filename, timeout=None, poll_interval=0.1):
+        '''
+        :param str filename:
+            The lock file.
+
+        :param float|None timeout:
+            The maximum time (in seconds) to wait for the lock. If None, waits forever.
+
+        :param float poll_interval:
+            The interval between checks for the lock (only used when the lock cannot be obtained
+            by a blocking call: on Windows or with a timeout).
+        '''
+        from ._filesystem import _AssertIsLocal
+        _AssertIsLocal(filename)
+
+        self.filename = filename
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._fd = None
+
+
+    def __enter__(self):
+        self.Acquire()
+        return self
+
+
+    def __exit__(self, *args):
+        self.Release()
+
+
+    def Acquire(self):
+        '''
+        Waits for the lock.
+
+        :raises FileLockTimeoutError:
+            If the lock could not be acquired in the given timeout.
+        '''
+        import time
+
+        assert self._fd is None, 'Lock "%s" already acquired.' % self.filename
+
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            from ._filesystem import CreateDirectory
+            CreateDirectory(directory)
+
+        fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0666)
+        try:
+            if self.timeout is None and sys.platform != 'win32':
+                _LockFile(fd, blocking=True)
+            else:
+                start = time.time()
+                while not _LockFile(fd, blocking=False):
+                    if self.timeout is not None and time.time() - start >= self.timeout:
+                        from ._filesystem_exceptions import FileLockTimeoutError
+                        raise FileLockTimeoutError(self.filename)
+                    time.sleep(self.poll_interval)
+        except:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+
+    def Release(self):
+        '''
+        Releases the lock.
+        '''
+        assert self._fd is not None, 'Lock "%s" not acquired.' % self.filename
+        try:
+            _UnlockFile(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+    def IsAcquired(self):
+        '''
+        :rtype: bool
+        :returns:
+            True if this lock is currently held (by this object).
+        '''
+        return self._fd is not None
+
+
+
+def _LockFile(fd, blocking):
+    '''
+    :rtype: bool
+    :returns:
+        True if the lock was acquired (always True when blocking).
+    '''
+    if sys.platform == 'win32':
+        import msvcrt
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except IOError:
+            return False
+        return True
+
+    import errno
+    import fcntl
+    flags = fcntl.LOCK_EX
+    if not blocking:
+        flags |= fcntl.LOCK_NB
+    try:
+        fcntl.flock(fd, flags)
+    except IOError, e:
+        if e.errno in (errno.EAGAIN, errno.EACCES):
+            return False
+        raise
+    return True
+
+
+def _UnlockFile(fd):
+    if sys.platform == 'win32':
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fd, fcntl.LOCK_UN)
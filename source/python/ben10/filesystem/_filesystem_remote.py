@@ -1,4 +1,5 @@
 from ftputil.error import FTPIOError, FTPOSError, PermanentError
+import contextlib
 
 
 
@@ -37,11 +38,32 @@ def FTPHost(url):
     Create an ftputil.FTPHost instance at the target url. Configure the host to correctly use the
     url's port.
 
+    .. seealso:: ftp_host_pool, to reuse hosts (connections) between operations.
+
     :param ParseResult url:
         As returned by urlparse.urlparse
 
     :rtype: ftputil.FTPHost
     '''
+    return _FTPConnect(url)[0]
+
+
+
+def _FTPConnect(url, passive=None):
+    '''
+    Creates an ftputil.FTPHost instance at the target url.
+
+    :param ParseResult url:
+        .. see:: FTPHost
+
+    :param bool|None passive:
+        Whether to use passive ftp. If None, tries active ftp first and switches to passive ftp if
+        the server does not support it.
+
+    :rtype: tuple(ftputil.FTPHost,bool)
+    :returns:
+        The host and whether it is using passive ftp.
+    '''
     from ftputil import FTPHost as ftputil_host
     import ftplib
 
@@ -76,6 +98,9 @@ def FTPHost(url):
     create_host = partial(ftputil_host, url.hostname, url.username, url.password, port=url.port)
 
     try:
+        if passive is not None:
+            return create_host(session_factory=DefaultFTP if passive else ActiveFTP), passive
+
         # Try to create active ftp host
         host = create_host(session_factory=ActiveFTP)
 
@@ -86,9 +111,10 @@ def FTPHost(url):
             if e.errno in [425, 500]:
                 # 425 = Errno raised when trying to a server without active ftp
                 # 500 = Illegal PORT command. In this case we also want to try passive mode.
-                host = create_host(session_factory=DefaultFTP)
+                host.close()
+                return create_host(session_factory=DefaultFTP), True
 
-        return host
+        return host, False
     except FTPOSError, e:
         if e.args[0] in [11004, -3]:
             from ben10.foundation.reraise import Reraise
@@ -104,6 +130,246 @@ def FTPHost(url):
 
 
 
+#===================================================================================================
+# FTPHostPool
+#===================================================================================================
+class FTPHostPool(object):
+    '''
+    Keeps FTP hosts (logged in connections) open after use so they can be reused by the following
+    operations in the same server, avoiding a new connection and login for each operation.
+
+    Hosts are pooled by (hostname, port, username) and each host is used by only one operation
+    (thread) at a time: concurrent operations in the same server use different hosts.
+
+    Idle hosts are closed after "idle_timeout" seconds, and a (cheap) health check is performed
+    before reusing a host, so hosts closed by the server are silently replaced.
+
+    The ftp mode (active or passive) that worked for each server is remembered, so the active
+    mode probe (.. seealso:: FTPHost) is only done for the first connection.
+
+    e.g.:
+        with ftp_host_pool.Host(url) as ftp_host:
+            ftp_host.listdir(url.path)
+    '''
+
+    def __init__(self, idle_timeout=30.0, max_idle_hosts=8):
+        '''
+        :param float idle_timeout:
+            Seconds an idle host is kept open.
+
+        :param int max_idle_hosts:
+            Maximum number of idle hosts kept open for each key.
+        '''
+        import threading
+
+        self.idle_timeout = idle_timeout
+        self.max_idle_hosts = max_idle_hosts
+
+        self._lock = threading.Lock()
+
+        # Maps the key to a list of (ftp_host, release_time), the most recently used last.
+        self._idle_hosts = {}
+
+        # The number of idle hosts reserved by each client (.. seealso:: ReserveIdleHosts).
+        self._reserved_idle_hosts = []
+
+        # Maps (hostname, port) to whether passive ftp is used.
+        self._passive = {}
+
+
+    @contextlib.contextmanager
+    def Host(self, url):
+        '''
+        Context manager that acquires a host for the given url, releasing it back to the pool at
+        the end.
+
+        :param ParseResult url:
+            As returned by urlparse.urlparse
+
+        :rtype: ftputil.FTPHost
+        '''
+        ftp_host = self.Acquire(url)
+        try:
+            yield ftp_host
+        except (PermanentError, FTPIOError):
+            # The server answered with an error (e.g. file not found): the host can be reused.
+            self.Release(url, ftp_host)
+            raise
+        except:
+            # The connection may be broken: discard it.
+            self._Close(ftp_host)
+            raise
+        else:
+            self.Release(url, ftp_host)
+
+
+    def Acquire(self, url):
+        '''
+        Obtains a host for the given url, reusing an idle host if possible. The caller is the only
+        user of the host until it is released.
+
+        :param ParseResult url:
+            As returned by urlparse.urlparse
+
+        :rtype: ftputil.FTPHost
+        '''
+        import time
+
+        key = self._GetKey(url)
+        while True:
+            with self._lock:
+                idle_hosts = self._idle_hosts.get(key)
+                if not idle_hosts:
+                    break
+                ftp_host, release_time = idle_hosts.pop()
+
+            if time.time() - release_time > self.idle_timeout or not self._IsAlive(ftp_host):
+                self._Close(ftp_host)
+                continue
+
+            # Other clients may have changed the server since the host was used.
+            ftp_host.stat_cache.clear()
+            return ftp_host
+
+        ftp_host, passive = _FTPConnect(url, self._passive.get(key[:2]))
+        self._passive[key[:2]] = passive
+        return ftp_host
+
+
+    def Release(self, url, ftp_host):
+        '''
+        Returns a host obtained with Acquire to the pool.
+
+        :param ParseResult url:
+            The url given to Acquire.
+
+        :param ftputil.FTPHost ftp_host:
+        '''
+        import time
+
+        if ftp_host.closed:
+            return
+
+        now = time.time()
+        expired = []
+        with self._lock:
+            idle_hosts = self._idle_hosts.setdefault(self._GetKey(url), [])
+            idle_hosts.append((ftp_host, now))
+            if len(idle_hosts) > self._GetMaxIdleHosts():
+                expired.append(idle_hosts.pop(0)[0])
+
+            # Take the chance to close the hosts idle for too long.
+            for i_idle_hosts in self._idle_hosts.itervalues():
+                while i_idle_hosts and now - i_idle_hosts[0][1] > self.idle_timeout:
+                    expired.append(i_idle_hosts.pop(0)[0])
+
+        for i_ftp_host in expired:
+            self._Close(i_ftp_host)
+
+
+    def ReserveIdleHosts(self, count):
+        '''
+        Keeps up to the given number of idle hosts for each key (if more than max_idle_hosts),
+        until released with UnreserveIdleHosts. Used by clients running many operations at the same
+        time (.. seealso:: AsyncFilesystem), without changing max_idle_hosts for everyone else.
+
+        :param int count:
+        '''
+        with self._lock:
+            self._reserved_idle_hosts.append(count)
+
+
+    def UnreserveIdleHosts(self, count):
+        '''
+        Releases a reservation made with ReserveIdleHosts, closing the idle hosts above the limit.
+
+        :param int count:
+            The count given to ReserveIdleHosts.
+        '''
+        expired = []
+        with self._lock:
+            self._reserved_idle_hosts.remove(count)
+            max_idle_hosts = self._GetMaxIdleHosts()
+            for i_idle_hosts in self._idle_hosts.itervalues():
+                while len(i_idle_hosts) > max_idle_hosts:
+                    expired.append(i_idle_hosts.pop(0)[0])
+
+        for i_ftp_host in expired:
+            self._Close(i_ftp_host)
+
+
+    def SetPassive(self, hostname, port, passive):
+        '''
+        Sets the ftp mode used for the given server, instead of detecting it in the first
+        connection.
+
+        :param str hostname:
+        :param int port:
+
+        :param bool|None passive:
+            Whether to use passive ftp. None to detect it again in the next connection.
+        '''
+        if passive is None:
+            self._passive.pop((hostname, port), None)
+        else:
+            self._passive[(hostname, port)] = passive
+
+
+    def CloseAll(self):
+        '''
+        Closes all the idle hosts.
+        '''
+        with self._lock:
+            idle_hosts = [i_ftp_host for i_idle_hosts in self._idle_hosts.itervalues()
+                for i_ftp_host, _release_time in i_idle_hosts]
+            self._idle_hosts.clear()
+
+        for i_ftp_host in idle_hosts:
+            self._Close(i_ftp_host)
+
+
+    def GetIdleCount(self):
+        '''
+        :rtype: int
+        :returns:
+            The number of idle hosts in the pool.
+        '''
+        with self._lock:
+            return sum(len(i) for i in self._idle_hosts.itervalues())
+
+
+    def _GetKey(self, url):
+        return (url.hostname, url.port, url.username)
+
+
+    def _GetMaxIdleHosts(self):
+        return max([self.max_idle_hosts] + self._reserved_idle_hosts)
+
+
+    def _IsAlive(self, ftp_host):
+        try:
+            ftp_host.keep_alive()
+            return True
+        except Exception:
+            return False
+
+
+    def _Close(self, ftp_host):
+        try:
+            ftp_host.close()
+        except Exception:
+            pass  # The connection is being discarded anyway.
+
+
+
+# The pool shared by all the FTP operations in this module.
+ftp_host_pool = FTPHostPool()
+
+import atexit
+atexit.register(ftp_host_pool.CloseAll)
+
+
+
 #===================================================================================================
 # FTPUploadFileToUrl
 #===================================================================================================
@@ -119,7 +385,7 @@ def FTPUploadFileToUrl(source_filename, target_url):
 
         A parsed url as returned by urlparse.urlparse
     '''
-    with FTPHost(target_url) as ftp_host:
+    with ftp_host_pool.Host(target_url) as ftp_host:
         ftp_host.upload(source_filename, target_url.path)
 
 
@@ -127,34 +393,77 @@ def FTPUploadFileToUrl(source_filename, target_url):
 #===================================================================================================
 # DownloadUrlToFile
 #===================================================================================================
-def DownloadUrlToFile(source_url, target_filename):
+def DownloadUrlToFile(source_url, target_filename, expected_md5=None, ranges=4,
+        min_range_size=8 * 1024 * 1024):
     '''
     Downloads file in source_url to target_filename
 
+    HTTP downloads are made into a "<target_filename>.partial" file, renamed to target_filename
+    once complete (unless a HttpCache is active, in which case the file is copied from the cache).
+    If the server supports byte ranges:
+        - A download interrupted (e.g. a dropped connection) is resumed by the next call, from the
+          data already in the partial file(s). The validator of the remote file (ETag or
+          Last-Modified) is saved in "<target_filename>.partial.validator" and sent in the If-Range
+          header when resuming: if the remote file changed (or has no validator) the partial files
+          are discarded and the download restarts;
+        - Large files are downloaded in up to "ranges" parallel streams, each one into its own
+          "<target_filename>.partial.<offset>" file, concatenated at the end.
+
     :param ParseResult source_url:
         A parsed url as returned by urlparse.urlparse
 
     :param str target_filename:
         A target filename
+
+    :param str|None expected_md5:
+        If given, the md5 hex digest expected for the downloaded file.
+
+    :param int ranges:
+        Maximum number of parallel streams for HTTP downloads.
+
+    :param int min_range_size:
+        Minimum size (in bytes) of each of the parallel streams for HTTP downloads: smaller files
+        are downloaded in a single stream.
+
+    :raises HashMismatchError:
+        If the md5 of the downloaded file does not match expected_md5. The downloaded file is
+        removed.
     '''
     try:
         if source_url.scheme == 'ftp':
-            return _FTPDownload(source_url, target_filename)
-
-        # Use shutil for other schemes
-        iss = OpenFile(source_url)
-        try:
-            with file(target_filename, 'wb') as oss:
+            _FTPDownload(source_url, target_filename)
+        elif source_url.scheme in ('http', 'https'):
+            from ._filesystem_http_cache import GetActiveHttpCache
+            http_cache = GetActiveHttpCache()
+            if http_cache is not None:
                 import shutil
-                shutil.copyfileobj(iss, oss)
-        finally:
-            iss.close()
+                shutil.copyfile(http_cache.Fetch(source_url), target_filename)
+            else:
+                _HTTPDownload(source_url, target_filename, ranges, min_range_size)
+        else:
+            # Use shutil for other schemes
+            iss = OpenFile(source_url)
+            try:
+                with file(target_filename, 'wb') as oss:
+                    import shutil
+                    shutil.copyfileobj(iss, oss)
+            finally:
+                iss.close()
     except FTPIOError, e:
         if e.errno == 550:
             from _filesystem_exceptions import FileNotFoundError
             raise FileNotFoundError(source_url.path)
         raise
 
+    if expected_md5 is not None:
+        from ben10.foundation.hash import Md5Hex
+        obtained_md5 = Md5Hex(target_filename)
+        if obtained_md5 != expected_md5.lower():
+            import os
+            os.remove(target_filename)
+            from _filesystem_exceptions import HashMismatchError
+            raise HashMismatchError(source_url.geturl(), expected_md5, obtained_md5)
+
 
 
 #===================================================================================================
@@ -194,6 +503,12 @@ def OpenFile(filename_url):
                 raise FileNotFoundError(filename_url.path)
             raise
 
+    if filename_url.scheme in ('http', 'https'):
+        from ._filesystem_http_cache import GetActiveHttpCache
+        http_cache = GetActiveHttpCache()
+        if http_cache is not None:
+            return file(http_cache.Fetch(filename_url), 'rb')
+
     try:
         import urllib
         return urllib.urlopen(filename_url.geturl(), None)
@@ -231,35 +546,296 @@ def _FTPDownload(source_url, target_filename):
     :param target_filename:
         .. see:: DownloadUrlToFile
     '''
-    with FTPHost(source_url) as ftp_host:
+    with ftp_host_pool.Host(source_url) as ftp_host:
         ftp_host.download(source=source_url.path, target=target_filename)
 
 
+def _HTTPDownload(source_url, target_filename, ranges, min_range_size):
+    '''
+    Downloads a file through HTTP, using byte ranges (if supported by the server) to resume
+    previous downloads and to download in parallel streams.
+
+    :param source_url:
+        .. see:: DownloadUrlToFile
+    :param target_filename:
+        .. see:: DownloadUrlToFile
+    :param ranges:
+        .. see:: DownloadUrlToFile
+    :param min_range_size:
+        .. see:: DownloadUrlToFile
+    '''
+    import os
+
+    partial_filename = target_filename + '.partial'
+    validator_filename = partial_filename + '.validator'
+
+    # The parts of a previous download in parallel streams, by offset
+    parts = {}
+    directory, partial_name = os.path.split(os.path.abspath(partial_filename))
+    for i_name in os.listdir(directory):
+        i_offset = i_name[len(partial_name) + 1:]
+        if i_name.startswith(partial_name + '.') and i_offset.isdigit():
+            parts[int(i_offset)] = partial_filename + '.' + i_offset
+
+    def RemoveParts():
+        for i_filename in parts.itervalues():
+            os.remove(i_filename)
+        parts.clear()
+
+    def WriteValidator(response):
+        # Without a validator the data downloaded cannot be resumed safely.
+        validator = _GetResponseValidator(response)
+        if validator is None:
+            RemoveValidator()
+        else:
+            with file(validator_filename, 'w') as oss:
+                oss.write(validator)
+
+    def RemoveValidator():
+        if os.path.isfile(validator_filename):
+            os.remove(validator_filename)
+
+    validator = None
+    if os.path.isfile(validator_filename):
+        with file(validator_filename, 'r') as iss:
+            validator = iss.read()
+
+    offset = os.path.getsize(partial_filename) if os.path.isfile(partial_filename) else 0
+    if validator is None and (offset or parts):
+        # Data from an unknown version of the remote file: discard it.
+        RemoveParts()
+        if offset:
+            os.remove(partial_filename)
+        offset = 0
+    response, total_size = _HTTPOpenRange(source_url, offset, if_range=validator)
+
+    if response is not None and total_size is not None and validator is not None and \
+            _GetResponseValidator(response) != validator:
+        # The server ignored the If-Range header: the remote file changed since the partial
+        # download, so download it all again.
+        response.close()
+        response, total_size = _HTTPOpenRange(source_url, None)
+
+    if response is None and total_size == offset and not parts:
+        # Range not satisfiable: the partial file is already complete (or the remote file is empty).
+        if not os.path.isfile(partial_filename):
+            file(partial_filename, 'wb').close()
+
+    elif response is None or total_size is None:
+        # The server does not support ranges (or the partial file does not match the remote file
+        # anymore): download it all in a single stream.
+        RemoveParts()
+        if response is None:
+            response, total_size = _HTTPOpenRange(source_url, None)
+        WriteValidator(response)
+        try:
+            with file(partial_filename, 'wb') as oss:
+                _CopyStream(response, oss, None)
+        finally:
+            response.close()
+
+    else:
+        # Split the remaining data in ranges: [(offset, end, filename)]
+        if not parts and ranges > 1 and total_size - offset >= 2 * min_range_size:
+            count = min(ranges, (total_size - offset) // min_range_size)
+            step = (total_size - offset) // count
+            parts = dict(
+                (offset + i * step, '%s.%d' % (partial_filename, offset + i * step))
+                for i in xrange(1, count)
+            )
+        starts = sorted(parts)
+        ends = starts + [total_size]
+        WriteValidator(response)
+        validator = _GetResponseValidator(response)
+
+        def DownloadPart(index):
+            start, end = starts[index], ends[index + 1]
+            filename = parts[start]
+            done = os.path.getsize(filename) if os.path.isfile(filename) else 0
+            if start + done >= end:
+                return
+            part_response, part_total_size = _HTTPOpenRange(
+                source_url, start + done, end - 1, if_range=validator)
+            if part_response is None:
+                raise IOError('Server refused the range %d-%d of "%s".' % (start + done, end - 1,
+                    source_url.geturl()))
+            if part_total_size is None:
+                # The remote file changed during the download: the next call restarts it.
+                part_response.close()
+                RemoveValidator()
+                raise IOError('"%s" changed during the download.' % source_url.geturl())
+            try:
+                with file(filename, 'ab') as oss:
+                    _CopyStream(part_response, oss, end - start - done)
+            finally:
+                part_response.close()
+
+        pool = None
+        if starts:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(len(starts))
+            results = pool.map_async(DownloadPart, range(len(starts)))
+            pool.close()
+
+        try:
+            try:
+                with file(partial_filename, 'ab') as oss:
+                    _CopyStream(response, oss, ends[0] - offset)
+            finally:
+                response.close()
+        finally:
+            if pool is not None:
+                pool.join()
+
+        if pool is not None:
+            results.get()  # Raises the errors from the parts
+
+        # Concatenate the parts
+        if parts:
+            with file(partial_filename, 'ab') as oss:
+                for i_start in starts:
+                    with file(parts[i_start], 'rb') as iss:
+                        _CopyStream(iss, oss, None)
+            RemoveParts()
+
+        if os.path.getsize(partial_filename) != total_size:
+            os.remove(partial_filename)
+            RemoveValidator()
+            raise IOError('Incomplete download of "%s".' % source_url.geturl())
+
+    RemoveValidator()
+    if os.path.isfile(target_filename):
+        os.remove(target_filename)
+    os.rename(partial_filename, target_filename)
+
+
+def _HTTPOpenRange(source_url, start, end=None, if_range=None):
+    '''
+    Opens the given url (HTTP only), requesting a byte range.
+
+    :param ParseResult source_url:
+        .. see:: DownloadUrlToFile
+
+    :param int|None start:
+        The first byte requested. If None, requests the whole file.
+
+    :param int|None end:
+        The last byte requested (inclusive). If None, requests up to the end of the file.
+
+    :param str|None if_range:
+        If given, the validator (as returned by _GetResponseValidator) of the remote file the range
+        is requested from: the server sends the whole file if it does not match.
+
+    :rtype: tuple(file|None,int|None)
+    :returns:
+        The response and the total size of the remote file:
+            - (response, total_size): the server is sending the requested range;
+            - (response, None): the server does not support ranges (or the remote file does not
+              match if_range) and is sending the whole file;
+            - (None, total_size): the range is not satisfiable (e.g. start is after the end of
+              file).
+    '''
+    import re
+    import urllib2
+
+    request = urllib2.Request(source_url.geturl())
+    if start is not None:
+        request.add_header('Range', 'bytes=%d-%s' % (start, '' if end is None else end))
+        if if_range is not None:
+            request.add_header('If-Range', if_range)
+
+    try:
+        response = urllib2.urlopen(request)
+    except urllib2.HTTPError, e:
+        if e.code == 404:
+            from _filesystem_exceptions import FileNotFoundError
+            raise FileNotFoundError(source_url.path)
+        if e.code == 416:
+            match = re.match(r'bytes \*/(\d+)', e.info().get('Content-Range', ''))
+            e.close()
+            return None, int(match.group(1)) if match else None
+        raise
+
+    if start is None or response.getcode() != 206:
+        return response, None
+
+    match = re.match(r'bytes (\d+)-(\d+)/(\d+)', response.info().get('Content-Range', ''))
+    if match is None or int(match.group(1)) != start:
+        response.close()
+        raise IOError('Invalid range received for "%s".' % source_url.geturl())
+    return response, int(match.group(3))
+
+
+def _GetResponseValidator(response):
+    '''
+    :param file response:
+        A response from urllib2.
+
+    :rtype: str|None
+    :returns:
+        The validator of the remote file that can be used in the If-Range header: the ETag (unless a
+        weak one) or the Last-Modified date. None if the response has neither.
+    '''
+    info = response.info()
+    etag = info.get('ETag')
+    if etag is not None and not etag.startswith('W/'):
+        return etag
+    return info.get('Last-Modified')
+
+
+def _CopyStream(iss, oss, size, chunk_size=64 * 1024):
+    '''
+    Copies the given number of bytes from one stream to the other.
+
+    :param file iss:
+    :param file oss:
+
+    :param int|None size:
+        The number of bytes to copy. If None, copies up to the end of the input stream.
+
+    :raises IOError:
+        If the input stream ends before "size" bytes are copied.
+    '''
+    while size is None or size > 0:
+        data = iss.read(chunk_size if size is None else min(chunk_size, size))
+        if not data:
+            if size is not None:
+                raise IOError('Connection closed with %d bytes missing.' % size)
+            return
+        oss.write(data)
+        if size is not None:
+            size -= len(data)
+
+
 def _FTPOpenFile(filename_url):
     '''
-    Opens a file (FTP only) and sets things up to close ftp connection when the file is closed.
+    Opens a file (FTP only) and sets things up to release the ftp host to the pool when the file is
+    closed.
 
     :param filename_url:
         .. see:: OpenFile
     '''
-    ftp_host = FTPHost(filename_url)
+    ftp_host = ftp_host_pool.Acquire(filename_url)
     try:
         # Open remote file in binary mode to maintain the original encoding and end of line.
         open_file = ftp_host.open(filename_url.path, 'rb')
 
-        # Set it up so when open_file is closed, ftp_host closes too
-        def FTPClose():
-            # Before closing, remove callback to avoid recursion, since ftputil closes all files
+        # Set it up so when open_file is closed, ftp_host is released to the pool
+        def FTPRelease():
+            # Before releasing, remove callback to avoid recursion, since ftputil closes all files
             # it has
             from ben10.foundation.callback import Remove
-            Remove(open_file.close, FTPClose)
+            Remove(open_file.close, FTPRelease)
 
-            ftp_host.close()
+            ftp_host_pool.Release(filename_url, ftp_host)
 
         from ben10.foundation.callback import After
-        After(open_file.close, FTPClose)
+        After(open_file.close, FTPRelease)
 
         return open_file
+    except (PermanentError, FTPIOError):
+        ftp_host_pool.Release(filename_url, ftp_host)
+        raise
     except:
         ftp_host.close()
         raise
@@ -282,7 +858,7 @@ def FTPCreateFile(url, contents):
     :param text contents:
         The file contents.
     '''
-    with FTPHost(url) as ftp_host:
+    with ftp_host_pool.Host(url) as ftp_host:
         with ftp_host.open(url.path, 'w') as oss:
             oss.write(contents.decode('latin1'))
 
@@ -300,7 +876,7 @@ def FTPIsFile(url):
     :returns:
         True if file exists.
     '''
-    with FTPHost(url) as ftp_host:
+    with ftp_host_pool.Host(url) as ftp_host:
         try:
             return ftp_host.path.isfile(url.path)
         except PermanentError, e:
@@ -323,7 +899,7 @@ def FTPCreateDirectory(url):
 
         A parsed url as returned by urlparse.urlparse
     '''
-    with FTPHost(url) as ftp_host:
+    with ftp_host_pool.Host(url) as ftp_host:
         ftp_host.makedirs(url.path)
 
 
@@ -339,7 +915,7 @@ def FTPMoveDirectory(source_url, target_url):
 
         A parsed url as returned by urlparse.urlparse
     '''
-    with FTPHost(source_url) as ftp_host:
+    with ftp_host_pool.Host(source_url) as ftp_host:
         ftp_host.rename(source_url.path, target_url.path)
 
 
@@ -361,7 +937,7 @@ def FTPIsDir(url):
     :returns:
         True if url is an existing dir
     '''
-    with FTPHost(url) as ftp_host:
+    with ftp_host_pool.Host(url) as ftp_host:
         try:
             return ftp_host.path.isdir(url.path)
         except PermanentError, e:
@@ -373,6 +949,79 @@ def FTPIsDir(url):
 
 
 
+#===================================================================================================
+# FTPStatMany
+#===================================================================================================
+@_CaptureUnicodeErrors
+def FTPStatMany(urls):
+    '''
+    Obtains the metadata of many paths in the same server.
+
+    Each parent directory is listed only once: the listing (kept by ftputil in the host's stat
+    cache) gives the metadata of all the paths in it.
+
+    :param list(ParseResult) urls:
+        Urls in the same server.
+
+        Parsed urls as returned by urlparse.urlparse
+
+    :rtype: list(StatRecord)
+    :returns:
+        The metadata of each path, in the same order as the given urls.
+
+    .. seealso:: ben10.filesystem.StatMany
+    '''
+    import posixpath
+    import stat
+    from ._filesystem import PATH_TYPE_DIR, StatRecord, _StatRecordFromStat
+
+    with ftp_host_pool.Host(urls[0]) as ftp_host:
+        listings = {}
+
+        def ListDir(directory):
+            '''
+            :rtype: set(str)
+            :returns:
+                The names in the given directory (empty if it is not a directory).
+            '''
+            if directory not in listings:
+                # Check the directory with the listing of its parent: ftputil would list the parent
+                # again for each missing directory.
+                parent, name = posixpath.split(directory)
+                if name and (name not in ListDir(parent) or not ftp_host.path.isdir(directory)):
+                    listings[directory] = set()
+                else:
+                    listings[directory] = set(ftp_host.listdir(directory))
+            return listings[directory]
+
+        def Stat(url):
+            path = posixpath.normpath(url.path or '/')
+            if path == '/':
+                return StatRecord(PATH_TYPE_DIR, None, None, None)
+
+            directory, name = posixpath.split(path)
+            if name not in ListDir(directory):
+                return StatRecord(None, None, None, None)
+
+            path_stat = ftp_host.lstat(path)
+            link_target = None
+            if stat.S_ISLNK(path_stat.st_mode):
+                # ftputil has no public API for the target of a link (no FTPHost.readlink or
+                # path.realpath in ftputil 3.0, pinned in requirements.txt): only the parsed listing
+                # keeps it, in the private StatResult._st_target. Guarded so that another ftputil
+                # version only loses the link targets.
+                link_target = getattr(path_stat, '_st_target', None)
+                try:
+                    path_stat = ftp_host.stat(path)
+                except PermanentError:
+                    # Broken link
+                    return StatRecord(None, None, None, link_target)
+            return _StatRecordFromStat(path_stat, link_target)
+
+        return [Stat(i) for i in urls]
+
+
+
 #===================================================================================================
 # FTPListFiles
 #===================================================================================================
@@ -390,7 +1039,7 @@ def FTPListFiles(url):
     :returns:
         List of files, or None if directory does not exist (error 550 CWD)
     '''
-    with FTPHost(url) as ftp_host:
+    with ftp_host_pool.Host(url) as ftp_host:
         try:
             return ftp_host.listdir(url.path)
         except PermanentError, e:
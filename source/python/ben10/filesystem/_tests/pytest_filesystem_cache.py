@@ -0,0 +1,123 @@
+from ben10.filesystem import (CreateDirectory, CreateFile, DeleteDirectory, DeleteFile,
+    FilesystemCache, FindFiles, IsDir, IsFile, ListFiles, MoveFile, ParallelFindFiles)
+from ben10.filesystem import _filesystem_cache
+from ben10.fixtures import SkipIfImportError
+import os
+import pytest
+
+
+
+#===================================================================================================
+# Test
+#===================================================================================================
+class Test:
+
+    def testFilesystemCache(self, embed_data, monkeypatch):
+        from ben10.filesystem._filesystem_cache import GetActiveCache
+
+        CreateFile(embed_data['root/alpha.txt'], 'alpha')
+        CreateFile(embed_data['root/sub_dir/bravo.txt'], 'bravo')
+        CreateDirectory(embed_data['root/empty_dir'])
+        CreateFile(embed_data['outside.txt'], 'outside')
+
+        root = embed_data['root']
+        expected_files = FindFiles(root)
+
+        with FilesystemCache(root) as cache:
+            listed_directories = self._CountListings(monkeypatch)
+
+            # All queries answered from memory
+            assert sorted(FindFiles(root)) == sorted(expected_files)
+            assert list(ParallelFindFiles(root, ordered=False)) != []
+            assert IsFile(embed_data['root/alpha.txt'])
+            assert not IsDir(embed_data['root/alpha.txt'])
+            assert IsDir(embed_data['root/sub_dir'])
+            assert not IsFile(embed_data['root/sub_dir'])
+            assert not IsFile(embed_data['root/missing.txt'])
+            assert not IsFile(embed_data['root/missing_dir/missing.txt'])
+            assert IsDir(root)
+            assert sorted(ListFiles(root)) == ['alpha.txt', 'empty_dir', 'sub_dir']
+            assert ListFiles(embed_data['root/empty_dir']) == []
+            assert ListFiles(embed_data['root/alpha.txt']) is None
+            assert ListFiles(embed_data['root/missing_dir']) is None
+            assert listed_directories == []
+
+            # Paths outside the cached tree are not affected
+            assert IsFile(embed_data['outside.txt'])
+            assert GetActiveCache(embed_data['outside.txt']) is None
+            assert GetActiveCache(embed_data['root/alpha.txt']) is cache
+
+            # Changes in the directories are noticed (through the directory mtime).
+            CreateFile(embed_data['root/sub_dir/charlie.txt'], 'charlie')
+            assert IsFile(embed_data['root/sub_dir/charlie.txt'])
+            DeleteFile(embed_data['root/alpha.txt'])
+            assert not IsFile(embed_data['root/alpha.txt'])
+            MoveFile(embed_data['root/sub_dir/bravo.txt'], embed_data['root/empty_dir/bravo.txt'])
+            assert sorted(FindFiles(root, include_root_dir=False, in_filters=['*.txt'])) == [
+                os.path.join('empty_dir', 'bravo.txt'),
+                os.path.join('sub_dir', 'charlie.txt'),
+            ]
+            DeleteDirectory(embed_data['root/empty_dir'])
+            assert not IsDir(embed_data['root/empty_dir'])
+            # Only the changed directories are listed again
+            assert set(listed_directories) == set([
+                os.path.abspath(embed_data['root/sub_dir']),
+                os.path.abspath(embed_data['root']),
+                os.path.abspath(embed_data['root/empty_dir']),
+            ])
+
+        # Cache is no longer used
+        assert GetActiveCache(embed_data['root/alpha.txt']) is None
+
+
+    def testFilesystemCacheWithoutSnapshot(self, embed_data, monkeypatch):
+        CreateFile(embed_data['root/alpha.txt'], 'alpha')
+        CreateFile(embed_data['root/sub_dir/bravo.txt'], 'bravo')
+
+        with FilesystemCache(embed_data['root'], snapshot=False) as cache:
+            listed_directories = self._CountListings(monkeypatch)
+            assert IsFile(embed_data['root/alpha.txt'])
+            assert IsFile(embed_data['root/alpha.txt'])
+            assert listed_directories == [os.path.abspath(embed_data['root'])]
+
+            cache.Invalidate()
+            assert IsFile(embed_data['root/alpha.txt'])
+            assert len(listed_directories) == 2
+
+
+    @pytest.mark.skipif('sys.platform != "linux2"')
+    @SkipIfImportError('pyinotify')
+    def testFilesystemCacheWatch(self, embed_data):
+        import time
+
+        CreateFile(embed_data['root/sub_dir/alpha.txt'], 'alpha')
+
+        def WaitFor(condition):
+            for _i in xrange(100):
+                if condition():
+                    return True
+                time.sleep(0.02)
+            return False
+
+        with FilesystemCache(embed_data['root'], watch=True):
+            assert IsFile(embed_data['root/sub_dir/alpha.txt'])
+
+            CreateFile(embed_data['root/sub_dir/bravo.txt'], 'bravo')
+            assert WaitFor(lambda: IsFile(embed_data['root/sub_dir/bravo.txt']))
+
+            DeleteDirectory(embed_data['root/sub_dir'])
+            assert WaitFor(lambda: not IsFile(embed_data['root/sub_dir/alpha.txt']))
+            assert WaitFor(lambda: not IsDir(embed_data['root/sub_dir']))
+
+
+    def _CountListings(self, monkeypatch):
+        '''
+        Returns a list that is populated with the directories actually listed in the filesystem.
+        '''
+        result = []
+        original_read_dir_entries = _filesystem_cache._ReadDirEntries
+        def MockReadDirEntries(directory):
+            result.append(directory)
+            return original_read_dir_entries(directory)
+        monkeypatch.setattr(_filesystem_cache, '_ReadDirEntries', MockReadDirEntries)
+        return result
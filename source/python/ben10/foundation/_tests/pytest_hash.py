@@ -1,5 +1,6 @@
 from StringIO import StringIO
-from ben10.foundation.hash import DumpDirHashToStringIO, GetRandomHash, IterHashes, Md5Hex
+from ben10.foundation.hash import (DirHashTree, DumpDirHashToStringIO, GetRandomHash, IterHashes,
+    Md5Hex)
 import pytest
 
 
@@ -82,4 +83,83 @@ class Test:
 
 
     def testMd5Hex(self):
+        from StringIO import StringIO
+
         assert Md5Hex(contents='alpha, bravo') == '2c0d78abb6e32d1614a17c6d0e4391c0'
+        assert Md5Hex(stream=StringIO('alpha, bravo')) == '2c0d78abb6e32d1614a17c6d0e4391c0'
+
+        contents = 'alpha, bravo' * 100000  # Larger than the chunks read from the stream
+        assert Md5Hex(stream=StringIO(contents)) == Md5Hex(contents=contents)
+
+
+    def testDirHashTree(self, embed_data):
+        from ben10.filesystem import CreateFile, DeleteFile
+
+        CreateFile(embed_data['alpha/file1.txt'], 'file1')
+        CreateFile(embed_data['alpha/sub_dir/file2.txt'], 'file2')
+        CreateFile(embed_data['alpha/sub_dir/sub_sub_dir/file3.txt'], 'file3')
+        CreateFile(embed_data['bravo/file1.txt'], 'file1')
+        CreateFile(embed_data['bravo/sub_dir/file2.txt'], 'file2')
+        CreateFile(embed_data['bravo/sub_dir/sub_sub_dir/file3.txt'], 'file3')
+
+        dir_hash = DirHashTree()
+        alpha_hash = dir_hash.GetHash(embed_data['alpha'])
+        assert alpha_hash == dir_hash.GetHash(embed_data['bravo'])
+        assert dir_hash.Diff(embed_data['alpha'], embed_data['bravo']) == []
+
+        # Changing a file deep in the tree changes the root hash.
+        CreateFile(embed_data['bravo/sub_dir/sub_sub_dir/file3.txt'], 'changed file3')
+        assert dir_hash.GetHash(embed_data['bravo']) != alpha_hash
+        assert dir_hash.Diff(embed_data['alpha'], embed_data['bravo']) == [
+            'sub_dir/sub_sub_dir/file3.txt',
+        ]
+
+        # Only files missing on one side and different types are reported at their level.
+        DeleteFile(embed_data['bravo/file1.txt'])
+        CreateFile(embed_data['bravo/file4.txt'], 'file4')
+        assert dir_hash.Diff(embed_data['alpha'], embed_data['bravo']) == [
+            'file1.txt',
+            'file4.txt',
+            'sub_dir/sub_sub_dir/file3.txt',
+        ]
+
+        # Filters
+        dir_hash = DirHashTree(exclude='file3.txt')
+        assert dir_hash.Diff(embed_data['alpha'], embed_data['bravo']) == ['file1.txt', 'file4.txt']
+        dir_hash = DirHashTree(include='*2.txt')
+        assert dir_hash.GetHash(embed_data['alpha']) == dir_hash.GetHash(embed_data['bravo'])
+
+
+    def testDirHashTreeCache(self, embed_data, monkeypatch):
+        from ben10.filesystem import CreateFile
+        from ben10.foundation import hash as hash_module
+        import os
+
+        CreateFile(embed_data['alpha/file1.txt'], 'file1')
+        CreateFile(embed_data['alpha/sub_dir/file2.txt'], 'file2')
+
+        dir_hash = DirHashTree()
+        first_hash = dir_hash.GetHash(embed_data['alpha'])
+
+        hashed_files = []
+        original_md5_hex = hash_module.Md5Hex
+        def MockMd5Hex(filename=None, contents=None):
+            if filename is not None:
+                hashed_files.append(os.path.basename(filename))
+            return original_md5_hex(filename=filename, contents=contents)
+        monkeypatch.setattr(hash_module, 'Md5Hex', MockMd5Hex)
+
+        # Nothing changed: no file is read again.
+        assert dir_hash.GetHash(embed_data['alpha']) == first_hash
+        assert hashed_files == []
+
+        # Only the changed file is read again.
+        CreateFile(embed_data['alpha/sub_dir/file2.txt'], 'changed file2')
+        assert dir_hash.GetHash(embed_data['alpha']) != first_hash
+        assert hashed_files == ['file2.txt']
+
+        # Clear forgets everything
+        del hashed_files[:]
+        dir_hash.Clear()
+        dir_hash.GetHash(embed_data['alpha'])
+        assert sorted(hashed_files) == ['file1.txt', 'file2.txt']
@@ -41,10 +41,236 @@ def DumpDirHashToStringIO(directory, stringio, base='', exclude=None, include=No
 
 
 
+#===================================================================================================
+# DirHashTree
+#===================================================================================================
+class DirHashTree(object):
+    '''
+    Computes a recursive (Merkle) hash of a directory tree.
+
+    Each file is hashed with Md5Hex and each directory hash is the md5 of the sorted names, types
+    and hashes of its entries, so two directories have the same hash if and only if their whole
+    contents are equal.
+
+    The instance keeps the computed nodes between calls:
+        - File hashes are reused while the file size and mtime do not change;
+        - Directory listings are reused while the directory mtime does not change;
+        - Directory hashes are only recomputed when the hash of one of its entries changes.
+
+    This means that after a change in a single file only that file is read again and only the
+    directories in its path (O(depth)) have their hashes recomputed. The tree is still traversed
+    (one stat per entry) to detect the changes.
+
+    .. note:: Changes made within the filesystem mtime resolution of the previous call may be
+        missed (see GetMTime in ben10.filesystem).
+
+    e.g.:
+        dir_hash = DirHashTree()
+        dir_hash.GetHash('c:/dircache/alpha')
+        ...
+        dir_hash.GetHash('c:/dircache/alpha')  # Only reads the files changed since the last call.
+        dir_hash.Diff('c:/dircache/alpha', 'c:/dircache/bravo')
+    '''
+
+    FILE = 'f'
+    DIR = 'd'
+
+    def __init__(self, include=None, exclude=None):
+        '''
+        :param str include:
+            Pattern to match files to include in the hashing. E.g.: *.zip
+
+        :param str exclude:
+            Pattern to match files and directories to exclude from the hashing. E.g.: *.gz
+        '''
+        self.include = include
+        self.exclude = exclude
+
+        # Maps the (absolute) path to the last computed node.
+        self._nodes = {}
+
+
+    def GetHash(self, directory):
+        '''
+        :param str directory:
+            The directory for which the hash should be done.
+
+        :rtype: str
+        :returns:
+            The hex digest of the whole directory tree.
+        '''
+        return self.GetNode(directory).digest
+
+
+    def GetNode(self, directory):
+        '''
+        :param str directory:
+            The directory for which the hash should be done.
+
+        :rtype: _DirHashNode
+        :returns:
+            The root node of the directory tree.
+        '''
+        import os
+        return self._GetDirNode(os.path.abspath(directory))
+
+
+    def Diff(self, directory1, directory2):
+        '''
+        Compares two directory trees, descending only into the sub-directories that differ.
+
+        :param str directory1:
+        :param str directory2:
+
+        :rtype: list(str)
+        :returns:
+            The sorted list of paths (relative to the given directories, using "/" as separator) of
+            the files and directories that differ between the two trees. A path that only exists in
+            one of the trees is also reported.
+        '''
+        result = []
+        self._DiffNodes(self.GetNode(directory1), self.GetNode(directory2), '', result)
+        return sorted(result)
+
+
+    def Clear(self):
+        '''
+        Forgets all the hashes computed so far.
+        '''
+        self._nodes.clear()
+
+
+    def _DiffNodes(self, node1, node2, prefix, result):
+        if node1.digest == node2.digest:
+            return
+
+        for i_name in set(node1.children) | set(node2.children):
+            i_child1 = node1.children.get(i_name)
+            i_child2 = node2.children.get(i_name)
+            if i_child1 is not None and i_child2 is not None and i_child1.digest == i_child2.digest:
+                continue
+
+            i_path = prefix + i_name
+            if i_child1 is not None and i_child2 is not None and \
+               i_child1.kind == i_child2.kind == self.DIR:
+                self._DiffNodes(i_child1, i_child2, i_path + '/', result)
+            else:
+                result.append(i_path)
+
+
+    def _IsIncluded(self, name, is_dir):
+        import fnmatch
+        if self.exclude is not None and fnmatch.fnmatch(name, self.exclude):
+            return False
+        if not is_dir and self.include is not None and not fnmatch.fnmatch(name, self.include):
+            return False
+        return True
+
+
+    def _GetFileNode(self, filename, stat_result):
+        signature = (stat_result.st_size, stat_result.st_mtime)
+        node = self._nodes.get(filename)
+        if node is not None and node.kind == self.FILE and node.signature == signature:
+            return node
+
+        node = _DirHashNode(self.FILE, Md5Hex(filename), signature)
+        self._nodes[filename] = node
+        return node
+
+
+    def _GetDirNode(self, directory):
+        import os
+        import stat
+
+        dir_mtime = os.stat(directory).st_mtime
+        node = self._nodes.get(directory)
+        if node is not None and node.kind == self.DIR and node.signature == dir_mtime:
+            names = node.children.keys()
+        else:
+            names = os.listdir(directory)
+
+        children = {}
+        for i_name in names:
+            i_path = os.path.join(directory, i_name)
+            try:
+                i_stat = os.stat(i_path)
+            except OSError:
+                continue  # Broken links and files removed while hashing.
+
+            i_is_dir = stat.S_ISDIR(i_stat.st_mode)
+            if not self._IsIncluded(i_name, i_is_dir):
+                continue
+
+            if i_is_dir:
+                children[i_name] = self._GetDirNode(i_path)
+            else:
+                children[i_name] = self._GetFileNode(i_path, i_stat)
+
+        if node is not None and node.kind == self.DIR and node.children == children:
+            # Nothing changed below this directory: keep the digest, update the mtime.
+            node.signature = dir_mtime
+            return node
+
+        contents = ''.join(
+            '%s %s %s\n' % (children[i_name].kind, i_name, children[i_name].digest)
+            for i_name in sorted(children)
+        )
+        node = _DirHashNode(self.DIR, Md5Hex(contents=contents), dir_mtime, children)
+        self._nodes[directory] = node
+        return node
+
+
+
+#===================================================================================================
+# _DirHashNode
+#===================================================================================================
+class _DirHashNode(object):
+    '''
+    A node in the DirHashTree: either a file or a directory.
+
+    Two nodes are equal if they have the same kind and digest.
+    '''
+
+    __slots__ = 'kind digest signature children'.split()
+
+    def __init__(self, kind, digest, signature, children=None):
+        '''
+        :param str kind:
+            DirHashTree.FILE or DirHashTree.DIR
+
+        :param str digest:
+            The hex digest of the file or directory.
+
+        :param object signature:
+            The data used to validate the cached node: (size, mtime) for files and the mtime for
+            directories.
+
+        :param dict(str,_DirHashNode) children:
+            The directory entries, by name. Empty for files.
+        '''
+        self.kind = kind
+        self.digest = digest
+        self.signature = signature
+        self.children = children or {}
+
+
+    def __eq__(self, other):
+        return self.kind == other.kind and self.digest == other.digest
+
+
+    def __ne__(self, other):
+        return not self == other
+
+
+    def __repr__(self):
+        return '_DirHashNode(%s, %s)' % (self.kind, self.digest)
+
+
+
 #===================================================================================================
 # Md5Hex
 #===================================================================================================
-def Md5Hex(filename=None, contents=None):
+def Md5Hex(filename=None, contents=None, stream=None):
     '''
     :param str filename:
         The file from which the md5 should be calculated. If the filename is given, the contents
@@ -54,6 +280,10 @@ def Md5Hex(filename=None, contents=None):
         The contents for which the md5 should be calculated. If the contents are given, the filename
         should NOT be given.
 
+    :param file stream:
+        A (binary) file-like object from which the md5 should be calculated, read in chunks up to
+        its end, so it can be used for large remote files. The stream is not closed.
+
     :rtype: str
     :returns:
         Returns a string with the hex digest of the stream.
@@ -61,17 +291,23 @@ def Md5Hex(filename=None, contents=None):
     import hashlib
     md5 = hashlib.md5()
 
+    def UpdateFromStream(stream):
+        while True:
+            data = stream.read(md5.block_size * 128)
+            if not data:
+                break
+            md5.update(data)
+
     if filename:
         stream = file(filename, 'rb')
         try:
-            while True:
-                data = stream.read(md5.block_size * 128)
-                if not data:
-                    break
-                md5.update(data)
+            UpdateFromStream(stream)
         finally:
             stream.close()
 
+    elif stream is not None:
+        UpdateFromStream(stream)
+
     else:
         md5.update(contents)
 